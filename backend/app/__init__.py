@@ -4,7 +4,6 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
-from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from flasgger import Swagger
 import cloudinary
@@ -14,7 +13,6 @@ from .config import config
 db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
-bcrypt = Bcrypt()
 swagger = Swagger()
 
 def create_app(config_name='default'):
@@ -34,17 +32,29 @@ def create_app(config_name='default'):
         api_secret=os.environ.get('CLOUDINARY_API_SECRET')
     )
     
+    from .utils.json_provider import init_json_provider
+    from .utils.compression import init_compression
+    from .services.storage import init_storage
+    from .services.password_hasher import init_password_hasher
+    init_json_provider(app)
+    init_compression(app)
+    init_storage(app)
+    init_password_hasher(app)
+
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
-    bcrypt.init_app(app)
+    from .utils.token_versions import is_token_revoked, revoked_token_response
+    jwt.token_in_blocklist_loader(is_token_revoked)
+    jwt.revoked_token_loader(revoked_token_response)
     swagger.init_app(app)
 
     # Initialize CORS with robust settings
     CORS(app, resources={r"/api/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
-        "allow_headers": ["Authorization", "Content-Type"]
+        "allow_headers": ["Authorization", "Content-Type", "Idempotency-Key"],
+        "expose_headers": ["Idempotent-Replayed"]
     }})
 
     # --- Register Blueprints ---
@@ -75,4 +85,11 @@ def create_app(config_name='default'):
     from .resources.sms import sms_bp
     app.register_blueprint(sms_bp, url_prefix='/api/sms')
 
+    # --- CLI Commands ---
+    from .commands import notifications_cli, images_cli, webhooks_cli, payments_cli
+    app.cli.add_command(notifications_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(webhooks_cli)
+    app.cli.add_command(payments_cli)
+
     return app
\ No newline at end of file
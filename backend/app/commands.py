@@ -0,0 +1,103 @@
+# app/commands.py
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.services.image_service import ImageWorker, drain_images
+from app.services.notification_service import NotificationWorker, drain_outbox
+from app.services.payment_reconciliation import ReconciliationWorker, reconcile_payments
+from app.services.webhook_inbox import WebhookWorker, drain_webhooks
+
+notifications_cli = AppGroup('notifications', help='Outbound SMS notification queue.')
+
+@notifications_cli.command('worker')
+@click.option('--threads', type=int, default=None, help='Concurrent sends (default: SMS_WORKER_THREADS).')
+@click.option('--batch-size', type=int, default=None, help='Messages claimed per batch (default: SMS_WORKER_BATCH_SIZE).')
+def run_worker(threads, batch_size):
+    """Run the notification worker until interrupted."""
+    worker = NotificationWorker(current_app._get_current_object(), max_workers=threads, batch_size=batch_size)
+    click.echo(f"Notification worker started ({worker.max_workers} threads, batches of {worker.batch_size}).")
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        click.echo("Stopping notification worker.")
+    finally:
+        worker.shutdown()
+
+@notifications_cli.command('drain')
+def drain():
+    """Send everything currently due in the outbox, then exit."""
+    click.echo(f"Processed {drain_outbox()} message(s).")
+
+
+images_cli = AppGroup('images', help='Produce image processing queue.')
+
+@images_cli.command('worker')
+@click.option('--threads', type=int, default=None, help='Images processed in parallel (default: IMAGE_WORKER_THREADS).')
+@click.option('--batch-size', type=int, default=None, help='Images claimed per batch (default: IMAGE_WORKER_BATCH_SIZE).')
+def run_image_worker(threads, batch_size):
+    """Run the image worker until interrupted."""
+    worker = ImageWorker(current_app._get_current_object(), max_workers=threads, batch_size=batch_size)
+    click.echo(f"Image worker started ({worker.max_workers} threads, batches of {worker.batch_size}).")
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        click.echo("Stopping image worker.")
+    finally:
+        worker.shutdown()
+
+@images_cli.command('drain')
+def drain_image_queue():
+    """Process every spooled image that is due, then exit."""
+    click.echo(f"Processed {drain_images()} image(s).")
+
+
+webhooks_cli = AppGroup('webhooks', help='Inbound webhook (M-Pesa, Twilio) inbox.')
+
+@webhooks_cli.command('worker')
+@click.option('--threads', type=int, default=None, help='Keys processed in parallel (default: WEBHOOK_WORKER_THREADS).')
+@click.option('--batch-size', type=int, default=None, help='Events claimed per batch (default: WEBHOOK_WORKER_BATCH_SIZE).')
+def run_webhook_worker(threads, batch_size):
+    """Run the webhook worker until interrupted."""
+    worker = WebhookWorker(current_app._get_current_object(), max_workers=threads, batch_size=batch_size)
+    click.echo(f"Webhook worker started ({worker.max_workers} threads, batches of {worker.batch_size}).")
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        click.echo("Stopping webhook worker.")
+    finally:
+        worker.shutdown()
+
+@webhooks_cli.command('drain')
+def drain_webhook_inbox():
+    """Process every inbound webhook that is due, then exit."""
+    click.echo(f"Processed {drain_webhooks()} webhook(s).")
+
+
+payments_cli = AppGroup('payments', help='M-Pesa payment reconciliation.')
+
+def _echo_reconciliation_stats(stats):
+    click.echo(
+        f"Checked {stats['checked']} ({stats['paid']} paid, {stats['failed']} failed, {stats['expired']} expired, "
+        f"{stats['in_progress']} in progress, {stats['unreachable']} unreachable) at {stats['checks_per_second']}/s; "
+        f"oldest pending payment is {stats['lag_seconds']}s old."
+    )
+
+@payments_cli.command('worker')
+@click.option('--threads', type=int, default=None, help='Concurrent STK queries (default: PAYMENT_RECONCILE_THREADS).')
+@click.option('--batch-size', type=int, default=None, help='Transactions checked per batch (default: PAYMENT_RECONCILE_BATCH_SIZE).')
+def run_reconciliation_worker(threads, batch_size):
+    """Run the payment reconciliation worker until interrupted."""
+    worker = ReconciliationWorker(current_app._get_current_object(), max_workers=threads, batch_size=batch_size)
+    click.echo(f"Payment reconciliation worker started ({worker.max_workers} threads, batches of {worker.batch_size}).")
+    try:
+        worker.run_forever(on_batch=lambda worker: _echo_reconciliation_stats(worker.stats.as_dict()))
+    except KeyboardInterrupt:
+        click.echo("Stopping payment reconciliation worker.")
+    finally:
+        worker.shutdown()
+
+@payments_cli.command('reconcile')
+def reconcile():
+    """Check every stale pending payment once, then exit."""
+    _echo_reconciliation_stats(reconcile_payments())
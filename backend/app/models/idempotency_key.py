@@ -0,0 +1,29 @@
+# app/models/idempotency_key.py
+from datetime import datetime, timezone
+from app import db
+
+class IdempotencyKey(db.Model):
+    """A client's Idempotency-Key for a POST and the response it got, replayed to retries until it expires."""
+    __tablename__ = 'idempotency_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    # SHA-256 of the method, path and body; the same key with a different request is rejected
+    request_fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='Processing') # Processing, Done
+    response_status = db.Column(db.Integer, nullable=True)
+    response_content_type = db.Column(db.String(100), nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    # The lease of the request in flight while Processing; when the stored response is dropped once Done.
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.Index('ix_idempotency_keys_user_id_key', 'user_id', 'key', unique=True),
+        # The user's oldest keys, evicted beyond IDEMPOTENCY_MAX_KEYS_PER_USER
+        db.Index('ix_idempotency_keys_user_id_id', 'user_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id}:{self.key}: {self.status}>'
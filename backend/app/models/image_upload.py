@@ -0,0 +1,28 @@
+# app/models/image_upload.py
+from datetime import datetime, timezone
+from app import db
+
+class ImageUpload(db.Model):
+    """A produce image spooled to local disk, waiting for the image worker to process and store it."""
+    __tablename__ = 'image_uploads'
+
+    id = db.Column(db.Integer, primary_key=True)
+    produce_id = db.Column(db.Integer, db.ForeignKey('produce.id', ondelete='CASCADE'), nullable=False, index=True)
+    spool_path = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='Pending') # Pending, Processing, Done, Failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    last_error = db.Column(db.Text, nullable=True)
+    # When the upload is next eligible for processing; also the lease expiry while Processing.
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    produce = db.relationship('Produce')
+
+    __table_args__ = (
+        db.Index('ix_image_uploads_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<ImageUpload {self.id} for produce {self.produce_id}: {self.status}>'
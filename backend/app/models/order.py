@@ -9,8 +9,11 @@ class Order(db.Model):
     status = db.Column(db.String(20), nullable=False, default='Pending') # e.g., Pending, Confirmed, Delivered, Canceled
     total_price = db.Column(db.Numeric(10, 2), nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     buyer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    # Set while an STK push for this order is in flight, so concurrent "Pay" taps wait for it.
+    payment_lock_expires_at = db.Column(db.DateTime, nullable=True)
 
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade="all, delete-orphan")
     transaction = db.relationship('Transaction', backref='order', uselist=False, lazy=True, cascade="all, delete-orphan")
@@ -0,0 +1,27 @@
+# app/models/outbound_message.py
+from datetime import datetime, timezone
+from app import db
+
+class OutboundMessage(db.Model):
+    """An SMS waiting in the notification outbox, delivered by the notification worker."""
+    __tablename__ = 'outbound_messages'
+
+    id = db.Column(db.Integer, primary_key=True)
+    to_number = db.Column(db.String(20), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='Pending') # Pending, Sending, Sent, Failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    last_error = db.Column(db.Text, nullable=True)
+    provider_message_id = db.Column(db.String(64), nullable=True)
+    # When the message is next eligible for a send attempt; also the lease expiry while Sending.
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_outbound_messages_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<OutboundMessage {self.id} to {self.to_number}: {self.status}>'
@@ -0,0 +1,17 @@
+# app/models/processed_callback.py
+from datetime import datetime, timezone
+from app import db
+
+class ProcessedCallback(db.Model):
+    """Ledger of M-Pesa STK callbacks that have been applied, so Safaricom's retries are recognised and skipped."""
+    __tablename__ = 'processed_callbacks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    checkout_request_id = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    mpesa_receipt_number = db.Column(db.String(50), nullable=True, unique=True)
+    result_code = db.Column(db.Integer, nullable=False)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id', ondelete='CASCADE'), nullable=True)
+    processed_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<ProcessedCallback {self.checkout_request_id}: {self.result_code}>'
@@ -2,6 +2,23 @@
 from datetime import datetime, timezone
 from app import db
 
+
+def produce_search_vector(name, description, location):
+    """
+    Weighted full-text document for a produce listing (PostgreSQL only).
+
+    Name matches rank above location, which ranks above description. The GIN index
+    below and the search query must use this exact expression for the planner to
+    pick the index, so always build it through this function.
+    """
+    def weighted(column, weight):
+        return db.func.setweight(
+            db.func.to_tsvector(db.literal_column("'simple'"), db.func.coalesce(column, db.literal_column("''"))),
+            db.literal_column(f"'{weight}'")
+        )
+    return weighted(name, 'A').op('||')(weighted(location, 'B')).op('||')(weighted(description, 'C'))
+
+
 class Produce(db.Model):
     __tablename__ = 'produce'
 
@@ -12,6 +29,11 @@ class Produce(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     unit = db.Column(db.String(20), nullable=False, default='kg')
     image_url = db.Column(db.String(255), nullable=True)
+    # None without an image; 'pending' until the image worker has stored it, then 'ready' or 'failed'.
+    image_status = db.Column(db.String(20), nullable=True)
+    thumbnail_url = db.Column(db.String(255), nullable=True)
+    # {"160": {"webp": url, "jpeg": url}, "480": {...}, ...}; see IMAGE_VARIANT_WIDTHS
+    image_variants = db.Column(db.JSON, nullable=True)
     location = db.Column(db.String(100), nullable=True, index=True)
     is_available = db.Column(db.Boolean, default=True, nullable=False)
     
@@ -19,7 +41,31 @@ class Produce(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
-    farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+    __table_args__ = (
+        # Shaped to the marketplace listing: WHERE is_available ORDER BY created_at DESC, id DESC,
+        # which is also the keyset used by cursor pagination.
+        db.Index(
+            'ix_produce_available_created_at', created_at.desc(), id.desc(),
+            postgresql_where=db.text('is_available')
+        ),
+        db.Index(
+            'ix_produce_available_price', price, created_at.desc(),
+            postgresql_where=db.text('is_available')
+        ),
+        # Serves a farmer's own listings without a sort step, and any other lookup by farmer_id.
+        db.Index('ix_produce_farmer_created_at', farmer_id, created_at.desc(), id.desc()),
+        # Incremental catalog exports: WHERE updated_at > :since ORDER BY updated_at, id
+        db.Index('ix_produce_updated_at', updated_at, id),
+        # Full-text index backing `?q=` search; see migration c3a91f5e2b7d for the trigram indexes.
+        db.Index(
+            'ix_produce_search_vector',
+            produce_search_vector(name, description, location),
+            postgresql_using='gin'
+        ).ddl_if(dialect='postgresql'),
+    )
 
     def __repr__(self):
-        return f'<Produce {self.name}>'
\ No newline at end of file
+        return f'<Produce {self.name}>'
+
@@ -13,9 +13,20 @@ class Transaction(db.Model):
     checkout_request_id = db.Column(db.String(100), nullable=False, unique=True, index=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, onupdate=lambda: datetime.now(timezone.utc))
+    # Last time the reconciliation worker asked Daraja about this (still Pending) transaction.
+    last_checked_at = db.Column(db.DateTime, nullable=True)
+    # The Idempotency-Key header of the initiation request that created this transaction, if any.
+    idempotency_key = db.Column(db.String(100), nullable=True)
 
     # Foreign Key to the Order
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
 
+    __table_args__ = (
+        # Reconciliation scan: WHERE status = 'Pending' AND created_at <= :stale ORDER BY created_at
+        db.Index('ix_transactions_status_created_at', 'status', 'created_at'),
+        # One transaction per (order, Idempotency-Key); also serves lookups by order.
+        db.Index('ix_transactions_order_id_idempotency_key', 'order_id', 'idempotency_key', unique=True),
+    )
+
     def __repr__(self):
         return f'<Transaction {self.mpesa_receipt_number}>'
\ No newline at end of file
@@ -1,5 +1,6 @@
 # app/models/user.py
-from app import db, bcrypt
+from app import db
+from app.services.password_hasher import get_password_hasher
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -12,12 +13,24 @@ class User(db.Model):
     role = db.Column(db.String(20), nullable=False, default='buyer')
     produce_listings = db.relationship('Produce', backref='farmer', lazy=True, cascade="all, delete-orphan")
     is_approved = db.Column(db.Boolean, default=False, nullable=False)
+    # Bumped whenever role/approval claims baked into issued JWTs become stale.
+    token_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     orders = db.relationship('Order', backref='buyer', lazy=True)
+
+    __table_args__ = (
+        # Admin "pending approvals" count: WHERE role = 'farmer' AND NOT is_approved.
+        # Only unapproved accounts are indexed, so it stays small as approved users grow.
+        db.Index('ix_users_pending_approval', 'role', 'is_approved', postgresql_where=db.text('NOT is_approved')),
+    )
+
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf8')
+        self.password_hash = get_password_hasher().hash(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return get_password_hasher().check(password, self.password_hash)
+
+    def password_needs_rehash(self):
+        return get_password_hasher().needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.username}>'
\ No newline at end of file
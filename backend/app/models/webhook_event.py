@@ -0,0 +1,30 @@
+# app/models/webhook_event.py
+from datetime import datetime, timezone
+from app import db
+
+class WebhookEvent(db.Model):
+    """A raw inbound webhook (M-Pesa callback, Twilio SMS), stored on receipt and processed later by the webhook worker."""
+    __tablename__ = 'webhook_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(20), nullable=False) # mpesa, twilio
+    # Events with the same source and key (CheckoutRequestID, sender number) are processed one at a time, in arrival order.
+    ordering_key = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='Pending') # Pending, Processing, Done, Failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=8)
+    last_error = db.Column(db.Text, nullable=True)
+    # When the event is next eligible for processing; also the lease expiry while Processing.
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    received_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_webhook_events_status_next_attempt_at', 'status', 'next_attempt_at'),
+        # "Is an earlier event for this key still unfinished?" when claiming a batch
+        db.Index('ix_webhook_events_source_ordering_key_id', 'source', 'ordering_key', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<WebhookEvent {self.id} {self.source}:{self.ordering_key}: {self.status}>'
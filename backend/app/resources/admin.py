@@ -4,15 +4,71 @@ from flask_jwt_extended import jwt_required
 
 from marshmallow import ValidationError
 from app.models.user import User
+from app.schemas.compiled import compile_schema
 from app.schemas.user import UserSchema, AdminUserUpdateSchema
 from app.utils.decorators import admin_required
+from app.utils.pagination import parse_limit
+from app.utils.token_versions import remember_token_version
 from app import db
 
 admin_bp = Blueprint('admin_bp', __name__)
 users_schema = UserSchema(many=True)
+users_serializer = compile_schema(users_schema)
 user_schema = UserSchema()
 user_update_schema = AdminUserUpdateSchema()
 
+# Sortable columns for ?sort=; a leading '-' sorts descending. id breaks ties so pages are stable.
+USER_SORT_COLUMNS = {
+    'id': User.id,
+    'username': User.username,
+    'email': User.email,
+    'role': User.role,
+}
+BOOLEAN_ARGS = {'true': True, '1': True, 'false': False, '0': False}
+
+
+def _contains_pattern(text):
+    """An ILIKE pattern matching `text` anywhere, with its own % and _ taken literally (escape character: \\)."""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def _pending_approval_filter():
+    # Matches the predicate of the ix_users_pending_approval partial index
+    return db.and_(User.role == 'farmer', db.not_(User.is_approved))
+
+
+def admin_users_filters(args):
+    """Builds the WHERE clauses for the role / is_approved / q filters in `args`. Raises ValueError on bad input."""
+    filters = []
+    role = args.get('role')
+    if role:
+        filters.append(User.role == role)
+    is_approved = args.get('is_approved')
+    if is_approved is not None:
+        if is_approved.lower() not in BOOLEAN_ARGS:
+            raise ValueError("is_approved must be true or false.")
+        filters.append(User.is_approved.is_(BOOLEAN_ARGS[is_approved.lower()]))
+    search_text = args.get('q', '').strip()
+    if search_text:
+        pattern = _contains_pattern(search_text)
+        filters.append(db.or_(
+            User.username.ilike(pattern, escape='\\'), User.email.ilike(pattern, escape='\\'),
+            User.phone_number.ilike(pattern, escape='\\')
+        ))
+    return filters
+
+
+def admin_users_order(sort):
+    """Maps ?sort= to ORDER BY clauses. Raises ValueError for unknown columns."""
+    column = USER_SORT_COLUMNS.get(sort.lstrip('-'))
+    if column is None:
+        raise ValueError(f"sort must be one of: {', '.join(USER_SORT_COLUMNS)} (prefix with '-' for descending).")
+    if sort.startswith('-'):
+        return [column.desc(), User.id.desc()]
+    return [column.asc(), User.id.asc()]
+
+
 @admin_bp.route('/users', methods=['GET'])
 @jwt_required()
 @admin_required
@@ -22,18 +78,100 @@ def get_all_users():
     ---
     tags:
       - Admin
-    summary: Get a list of all users (Admin Only)
-    description: Retrieves a complete list of all users registered on the platform. Requires admin privileges.
+    summary: Get a list of users (Admin Only)
+    description: >
+      Retrieves the users registered on the platform, optionally filtered, sorted and paginated.
+      Requires admin privileges.
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: role
+        schema: { type: string, enum: [farmer, buyer, admin] }
+        description: Only users with this role.
+      - in: query
+        name: is_approved
+        schema: { type: boolean }
+        description: Only approved (true) or unapproved (false) users.
+      - in: query
+        name: q
+        schema: { type: string }
+        description: Case-insensitive partial match on username, email or phone number.
+      - in: query
+        name: sort
+        schema: { type: string, enum: [id, -id, username, -username, email, -email, role, -role], default: id }
+        description: Sort column; prefix with '-' for descending order.
+      - in: query
+        name: page
+        schema: { type: integer, minimum: 1 }
+        description: Opt into pagination and return this page (1-based).
+      - in: query
+        name: per_page
+        schema: { type: integer, minimum: 1, maximum: 100 }
+        description: Opt into pagination and return at most this many users per page.
+    responses:
+      '200':
+        description: >
+          A list of user objects. When page or per_page is given, an envelope of the form
+          {"items": [...], "total": 42, "page": 1, "per_page": 20} is returned instead,
+          where total counts every user matching the filters.
+      '400':
+        description: Bad Request. Invalid is_approved or sort value.
+      '403':
+        description: Forbidden. User is not an admin.
+    """
+    try:
+        filters = admin_users_filters(request.args)
+        order_by = admin_users_order(request.args.get('sort', 'id'))
+    except ValueError as err:
+        return jsonify(message=str(err)), 400
+    listing = db.select(*users_serializer.columns(User)).where(*filters).order_by(*order_by)
+
+    page = request.args.get('page', type=int)
+    per_page = request.args.get('per_page', type=int)
+    if page is None and per_page is None:
+        users = db.session.execute(listing).all()
+        return jsonify(users_serializer.dump_rows(users)), 200
+
+    page = max(page or 1, 1)
+    per_page = parse_limit(per_page)
+    # count(*) OVER () returns the filtered total alongside the page in the same query
+    rows = db.session.execute(
+        listing.add_columns(db.func.count().over().label('total'))
+        .limit(per_page).offset((page - 1) * per_page)
+    ).all()
+    if rows:
+        total = rows[0].total
+    else:
+        # Past the last page there is no row to carry the total
+        total = db.session.scalar(db.select(db.func.count(User.id)).where(*filters))
+    return jsonify(
+        items=users_serializer.dump_rows(row[:-1] for row in rows), total=total, page=page, per_page=per_page
+    ), 200
+
+@admin_bp.route('/users/pending_approvals', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_pending_approvals():
+    """
+    Count farmers awaiting approval
+    ---
+    tags:
+      - Admin
+    summary: Get the number of farmers awaiting approval (Admin Only)
+    description: >
+      Returns how many farmer accounts have not been approved yet, for the admin dashboard badge.
+      Served from a partial index, so it stays cheap however many users there are.
     security:
       - bearerAuth: []
     responses:
       '200':
-        description: A list of user objects.
+        description: An object of the form {"pending_approvals": 3}.
       '403':
         description: Forbidden. User is not an admin.
     """
-    users = User.query.all()
-    return jsonify(users_schema.dump(users)), 200
+    pending = db.session.scalar(db.select(db.func.count()).select_from(User).where(_pending_approval_filter()))
+    return jsonify(pending_approvals=pending), 200
 
 @admin_bp.route('/users/<int:user_id>', methods=['PATCH'])
 @jwt_required()
@@ -79,6 +217,10 @@ def update_user_approval(user_id):
         data = user_update_schema.load(json_data)
     except ValidationError as err:
         return jsonify(err.messages), 422
-    user.is_approved = data['is_approved']
+    if user.is_approved != data['is_approved']:
+        user.is_approved = data['is_approved']
+        # Tokens issued before this change carry the old approval claim
+        user.token_version += 1
     db.session.commit()
+    remember_token_version(user)
     return jsonify(user_schema.dump(user)), 200
\ No newline at end of file
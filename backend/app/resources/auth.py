@@ -5,6 +5,8 @@ from flask_jwt_extended import create_access_token, create_refresh_token
 from flask_jwt_extended import jwt_required
 from app.models.user import User
 from app.schemas.user import UserSchema
+from app.services.registration_service import register_user, RegistrationConflict
+from app.utils.token_versions import token_claims, remember_token_version
 from app import db
 
 auth_bp = Blueprint('auth_bp', __name__)
@@ -49,7 +51,7 @@ def register():
       '201':
         description: User created successfully.
       '409':
-        description: Conflict. Username or email already exists.
+        description: Conflict. Username, email or phone number already exists.
       '422':
         description: Unprocessable Entity. Validation error.
     """
@@ -62,22 +64,16 @@ def register():
     except ValidationError as err:
         return jsonify(err.messages), 422
 
-    if User.query.filter_by(username=data['username']).first():
-        return jsonify({"message": "Username already exists"}), 409
-
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({"message": "Email already exists"}), 409
-
-    user = User(
-        username=data['username'],
-        email=data['email'],
-        role=data['role'],
-        phone_number=data.get('phone_number')
-    )
-    user.set_password(data['password'])
-
-    db.session.add(user)
-    db.session.commit()
+    try:
+        register_user(
+            username=data['username'],
+            email=data['email'],
+            password=data['password'],
+            role=data['role'],
+            phone_number=data.get('phone_number')
+        )
+    except RegistrationConflict as err:
+        return jsonify({"message": err.message, "field": err.field}), err.status_code
 
     return jsonify({"message": "User created successfully"}), 201
 
@@ -111,6 +107,8 @@ def login():
         description: Successful login, returns tokens.
       '401':
         description: Invalid credentials.
+      '503':
+        description: Too many logins are being processed; retry after the Retry-After delay.
     """
     json_data = request.get_json()
     if not json_data:
@@ -122,9 +120,15 @@ def login():
     user = User.query.filter_by(email=email).first()
 
     if user and user.check_password(password):
+        if user.password_needs_rehash():
+            # BCRYPT_LOG_ROUNDS changed since this hash was made; upgrade it while we have the password
+            user.set_password(password)
+            db.session.commit()
         identity = str(user.id)
-        access_token = create_access_token(identity=identity, fresh=True)
-        refresh_token = create_refresh_token(identity=identity)
+        claims = token_claims(user)
+        access_token = create_access_token(identity=identity, fresh=True, additional_claims=claims)
+        refresh_token = create_refresh_token(identity=identity, additional_claims=claims)
+        remember_token_version(user)
         return jsonify(access_token=access_token, refresh_token=refresh_token), 200
 
     return jsonify({"message": "Invalid credentials"}), 401
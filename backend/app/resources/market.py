@@ -1,16 +1,16 @@
 # app/resources/market.py
-from flask import request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint, current_app
 from flask_jwt_extended import jwt_required
 from marshmallow import ValidationError
 
 from app.models.market_price import MarketPrice
 from app.schemas.market_price import MarketPriceSchema
+from app.services.market_price_cache import get_price_snapshot
 from app.utils.decorators import admin_required
 from app import db
 
 market_bp = Blueprint('market_bp', __name__)
 market_price_schema = MarketPriceSchema()
-market_prices_schema = MarketPriceSchema(many=True)
 
 @market_bp.route('/prices', methods=['GET'])
 @jwt_required()
@@ -21,15 +21,22 @@ def get_prices():
     tags:
       - Market
     summary: Get a list of all current market prices
-    description: Retrieves a list of the current average market prices for various crops. Accessible by any authenticated user.
+    description: >
+      Retrieves a list of the current average market prices for various crops. Accessible by any authenticated user.
+      Responses carry an ETag; send it back in If-None-Match to get a 304 when prices have not changed.
     security:
       - bearerAuth: []
     responses:
       '200':
         description: A list of current market prices.
+      '304':
+        description: Not Modified. The client's copy (If-None-Match) is current.
     """
-    prices = MarketPrice.query.order_by(MarketPrice.crop_name).all()
-    return jsonify(market_prices_schema.dump(prices)), 200
+    snapshot = get_price_snapshot()
+    response = current_app.response_class(snapshot['body'], mimetype='application/json')
+    response.set_etag(snapshot['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 @market_bp.route('/prices', methods=['POST'])
 @jwt_required()
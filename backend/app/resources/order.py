@@ -3,18 +3,63 @@ from flask import request, jsonify, Blueprint
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import ValidationError
 from decimal import Decimal
+from sqlalchemy.orm import selectinload
 
-from app.services.twilio_service import send_sms
+from app.services.notification_service import enqueue_sms
+from app.services.inventory_service import reserve_stock, StockError
+from app.utils.conditional import conditional_response
 from app.utils.decorators import buyer_required, farmer_required
+from app.utils.idempotency import enable_idempotency_keys
 from app.models.user import User
 from app.models.produce import Produce
 from app.models.order import Order, OrderItem
+from app.schemas.compiled import compile_schema
 from app.schemas.order import OrderSchema
 from app import db
 
-order_bp = Blueprint('order_bp', __name__)
+order_bp = enable_idempotency_keys(Blueprint('order_bp', __name__))
 order_schema = OrderSchema()
 orders_schema = OrderSchema(many=True)
+orders_serializer = compile_schema(orders_schema)
+
+def _farmer_notification_batch(order_id, buyer_id):
+    """
+    Builds one (phone_number, message) pair per farmer with produce in the order.
+
+    The buyer and every involved farmer are resolved in a single query, joining
+    OrderItem -> Produce -> User, instead of one lookup per item and per farmer.
+    """
+    farmer_ids = db.select(Produce.farmer_id).join(OrderItem, OrderItem.produce_id == Produce.id).where(
+        OrderItem.order_id == order_id
+    )
+    people = db.session.execute(
+        db.select(User.id, User.username, User.phone_number).where(
+            db.or_(User.id.in_(farmer_ids), User.id == buyer_id)
+        )
+    ).all()
+    buyer_username = next(person.username for person in people if person.id == buyer_id)
+    return [
+        (person.phone_number,
+         f"Hello {person.username}, you've received a new order from {buyer_username}. Log in to confirm.")
+        for person in people
+        if person.id != buyer_id and person.phone_number
+    ]
+
+def _order_list_validators(order_filter):
+    """
+    Count and last change of the orders matching `order_filter`, in one aggregate query.
+
+    Order listings embed each item's produce name and unit, so produce edits count as changes too.
+    """
+    return db.session.query(
+        db.func.count(db.distinct(Order.id)),
+        db.func.max(Order.updated_at),
+        db.func.max(Produce.updated_at)
+    ).select_from(Order).join(OrderItem).join(Produce).filter(order_filter).one()
+
+def _with_order_items():
+    """Loader option that fetches the items and produce OrderSchema nests in two extra IN queries."""
+    return selectinload(Order.items).selectinload(OrderItem.produce)
 
 @order_bp.route('/', methods=['POST'])
 @jwt_required()
@@ -60,20 +105,15 @@ def create_order():
         data = order_schema.load(json_data)
     except ValidationError as err:
         return jsonify(err.messages), 422
-    total_price = Decimal('0.0')
-    order_items_to_create = []
     new_order = None
     try:
         with db.session.begin_nested():
+            produce_by_id = reserve_stock(data['items'])
+            total_price = Decimal('0.0')
+            order_items_to_create = []
             for item_data in data['items']:
-                produce_item = db.session.get(Produce, item_data['produce_id'])
-                if not produce_item:
-                    return jsonify(message=f"Produce with id {item_data['produce_id']} not found."), 404
-                if produce_item.quantity < item_data['quantity']:
-                    return jsonify(message=f"Insufficient stock for {produce_item.name}. Available: {produce_item.quantity}"), 400
-                produce_item.quantity -= item_data['quantity']
-                price_for_item = produce_item.price * Decimal(str(item_data['quantity']))
-                total_price += price_for_item
+                produce_item = produce_by_id[item_data['produce_id']]
+                total_price += produce_item.price * Decimal(str(item_data['quantity']))
                 order_items_to_create.append(OrderItem(
                     produce_id=produce_item.id,
                     quantity=item_data['quantity'],
@@ -82,15 +122,16 @@ def create_order():
             new_order = Order(buyer_id=buyer_id, total_price=total_price)
             new_order.items.extend(order_items_to_create)
             db.session.add(new_order)
+            db.session.flush()
+
+            # Queue farmer notifications in the same transaction; the notification worker sends them.
+            for phone_number, message in _farmer_notification_batch(new_order.id, buyer_id):
+                enqueue_sms(phone_number, message)
         db.session.commit()
-        db.session.refresh(new_order)
-        buyer = db.session.get(User, buyer_id)
-        farmer_ids = {item.produce.farmer_id for item in new_order.items}
-        for farmer_id in farmer_ids:
-            farmer = db.session.get(User, farmer_id)
-            if farmer and farmer.phone_number:
-                message = f"Hello {farmer.username}, you've received a new order from {buyer.username}. Log in to confirm."
-                send_sms(farmer.phone_number, message)
+        new_order = db.session.get(Order, new_order.id, options=[_with_order_items()], populate_existing=True)
+    except StockError as err:
+        db.session.rollback()
+        return jsonify(message=err.message), err.status_code
     except Exception as e:
         db.session.rollback()
         return jsonify(message="An error occurred while creating the order.", error=str(e)), 500
@@ -111,11 +152,20 @@ def get_buyer_orders():
       - bearerAuth: []
     responses:
       '200':
-        description: A list of the buyer's orders.
+        description: A list of the buyer's orders, with an ETag header for conditional requests.
+      '304':
+        description: Not Modified. None of the buyer's orders changed since the given validator.
     """
     buyer_id = int(get_jwt_identity())
-    orders = Order.query.filter_by(buyer_id=buyer_id).order_by(Order.created_at.desc()).all()
-    return jsonify(orders_schema.dump(orders)), 200
+
+    def build_response():
+        orders = Order.query.filter_by(buyer_id=buyer_id).options(
+            _with_order_items()
+        ).order_by(Order.created_at.desc()).all()
+        return jsonify(orders_serializer.dump(orders)), 200
+
+    validators = _order_list_validators(Order.buyer_id == buyer_id)
+    return conditional_response(validators, build_response, vary=('buyer', buyer_id))
 
 @order_bp.route('/farmer', methods=['GET'])
 @jwt_required()
@@ -132,13 +182,22 @@ def get_farmer_orders():
       - bearerAuth: []
     responses:
       '200':
-        description: A list of the farmer's relevant orders.
+        description: A list of the farmer's relevant orders, with an ETag header for conditional requests.
+      '304':
+        description: Not Modified. None of the farmer's orders changed since the given validator.
     """
     farmer_id = int(get_jwt_identity())
-    orders = Order.query.join(OrderItem).join(Produce).filter(
-        Produce.farmer_id == farmer_id
-    ).distinct().order_by(Order.created_at.desc()).all()
-    return jsonify(orders_schema.dump(orders)), 200
+
+    def build_response():
+        orders = Order.query.join(OrderItem).join(Produce).filter(
+            Produce.farmer_id == farmer_id
+        ).distinct().options(_with_order_items()).order_by(Order.created_at.desc()).all()
+        return jsonify(orders_serializer.dump(orders)), 200
+
+    # An order changes for everyone who sees it, so all of its items count, not only this farmer's.
+    farmer_orders = db.select(OrderItem.order_id).join(Produce).where(Produce.farmer_id == farmer_id)
+    validators = _order_list_validators(Order.id.in_(farmer_orders))
+    return conditional_response(validators, build_response, vary=('farmer', farmer_id))
 
 @order_bp.route('/<int:order_id>', methods=['PATCH'])
 @jwt_required()
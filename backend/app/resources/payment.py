@@ -1,14 +1,18 @@
 # app/resources/payment.py
-from flask import request, jsonify, Blueprint
+from flask import current_app, request, jsonify, Blueprint
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from app.models.user import User
 from app.models.order import Order
-from app.models.transaction import Transaction
-from app.services import mpesa_service
+from app.services.payment_callback_service import (
+    apply_stk_callback, is_processed_callback, parse_stk_callback, InvalidCallback, CALLBACK_UNKNOWN
+)
+from app.services.payment_initiation import initiate_order_payment, PaymentInitiationError
+from app.services.webhook_inbox import record_webhook
+from app.utils.idempotency import enable_idempotency_keys
 from app import db
 
-payment_bp = Blueprint('payment_bp', __name__)
+payment_bp = enable_idempotency_keys(Blueprint('payment_bp', __name__))
 
 @payment_bp.route('/initiate/<int:order_id>', methods=['POST'])
 @jwt_required()
@@ -19,7 +23,10 @@ def initiate_payment(order_id):
     tags:
       - Payments
     summary: Initiate payment for a specific order
-    description: Allows a logged-in buyer to start the payment process for their own order. Triggers an STK push to the buyer's registered phone number.
+    description: >
+      Allows a logged-in buyer to start the payment process for their own order. Triggers an STK push to the buyer's
+      registered phone number. While the order has a pending transaction, repeated or concurrent calls return it
+      instead of pushing again.
     security:
       - bearerAuth: []
     parameters:
@@ -29,6 +36,12 @@ def initiate_payment(order_id):
         schema:
           type: integer
         description: The ID of the order to be paid for.
+      - in: header
+        name: Idempotency-Key
+        required: false
+        schema:
+          type: string
+        description: A client-chosen key for this payment attempt. Retries with the same key get the same transaction back.
     responses:
       '200':
         description: STK push initiated successfully.
@@ -40,12 +53,23 @@ def initiate_payment(order_id):
                 message:
                   type: string
                   example: Payment initiated successfully. Please check your phone.
+                transaction_id:
+                  type: integer
+                checkout_request_id:
+                  type: string
+                status:
+                  type: string
+                  example: Pending
       '400':
         description: Bad Request. Order is not in a payable state or user has no phone number.
       '403':
         description: Forbidden. The user is not authorized to pay for this order.
       '404':
         description: Not Found. The specified order ID does not exist.
+      '409':
+        description: >
+          Conflict. Another request for this order is still waiting on M-Pesa, or the Idempotency-Key
+          belongs to an attempt that failed (details holds its transaction); retry with a new key.
       '500':
         description: Internal Server Error. Failed to communicate with the M-Pesa API.
     """
@@ -63,25 +87,23 @@ def initiate_payment(order_id):
     if not buyer.phone_number:
         return jsonify(message="No phone number on file for this user."), 400
 
-    response = mpesa_service.initiate_stK_push(
-        phone_number=buyer.phone_number,
-        amount=order.total_price,
-        order_id=order.id
-    )
-
-    if response and response.get("ResponseCode") == "0":
-        new_transaction = Transaction(
-            order_id=order.id,
-            amount=order.total_price,
-            phone_number=buyer.phone_number,
-            checkout_request_id=response['CheckoutRequestID']
+    try:
+        transaction, created = initiate_order_payment(
+            order, buyer.phone_number, idempotency_key=request.headers.get('Idempotency-Key')
         )
-        order.status = "Pending Payment"
-        db.session.add(new_transaction)
-        db.session.commit()
-        return jsonify(message="Payment initiated successfully. Please check your phone."), 200
-    
-    return jsonify(message="Failed to initiate payment.", details=response), 500
+    except PaymentInitiationError as err:
+        return jsonify(message=err.message, details=err.details), err.status_code
+
+    if created:
+        message = "Payment initiated successfully. Please check your phone."
+    else:
+        message = "Payment already initiated. Please check your phone."
+    return jsonify(
+        message=message,
+        transaction_id=transaction.id,
+        checkout_request_id=transaction.checkout_request_id,
+        status=transaction.status
+    ), 200
 
 @payment_bp.route('/callback', methods=['POST'])
 def payment_callback():
@@ -116,36 +138,30 @@ def payment_callback():
                       - { Name: "PhoneNumber", Value: 254712345678 }
     responses:
       '200':
-        description: Callback processed successfully.
+        description: >
+          Callback received (or, with WEBHOOK_INBOX disabled, processed). Repeated deliveries of the
+          same callback are acknowledged the same way but applied only once.
       '400':
         description: Invalid callback data received.
       '404':
-        description: Transaction corresponding to the CheckoutRequestID was not found.
+        description: >
+          Transaction corresponding to the CheckoutRequestID was not found (only with WEBHOOK_INBOX
+          disabled; the webhook worker retries such callbacks instead).
     """
-    data = request.get_json()
-    
-    if not data or "Body" not in data or "stkCallback" not in data["Body"]:
-        return jsonify(result="Invalid callback data"), 400
+    try:
+        checkout_request_id, result_code, receipt_number = parse_stk_callback(request.get_json(silent=True))
+    except InvalidCallback as err:
+        return jsonify(result=str(err)), 400
 
-    callback_data = data["Body"]["stkCallback"]
-    checkout_request_id = callback_data["CheckoutRequestID"]
-    result_code = callback_data["ResultCode"]
-    transaction = Transaction.query.filter_by(checkout_request_id=checkout_request_id).first()
+    if current_app.config['WEBHOOK_INBOX']:
+        # Acknowledge at once; the webhook worker applies it. Known retries are not even stored.
+        if not is_processed_callback(checkout_request_id, receipt_number):
+            record_webhook('mpesa', checkout_request_id, request.get_data(as_text=True))
+        return jsonify(result="Callback received"), 200
 
-    if not transaction:
+    outcome = apply_stk_callback(checkout_request_id, result_code, receipt_number)
+    if outcome == CALLBACK_UNKNOWN:
         print(f"Transaction not found for CheckoutRequestID: {checkout_request_id}")
         return jsonify(result="Transaction not found"), 404
-
-    if result_code == 0:
-        metadata = {item["Name"]: item.get("Value") for item in callback_data["CallbackMetadata"]["Item"]}
-        transaction.mpesa_receipt_number = metadata.get("MpesaReceiptNumber")
-        transaction.status = "Success"
-        order = transaction.order
-        order.status = "Confirmed"
-    else:
-        transaction.status = "Failed"
-        order = transaction.order
-        order.status = "Pending"
-
-    db.session.commit()
-    return jsonify(result="Callback processed successfully"), 200
\ No newline at end of file
+    # Retries are acknowledged like the first delivery so Safaricom stops resending them
+    return jsonify(result="Callback processed successfully"), 200
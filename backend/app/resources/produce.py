@@ -1,17 +1,35 @@
 # app/resources/produce.py
-from flask import request, jsonify, Blueprint
+import csv
+import io
+import os
+from datetime import datetime, timezone
+
+from flask import request, jsonify, Blueprint, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import ValidationError
-import cloudinary.uploader
 
 from app.models.produce import Produce
-from app.schemas.produce import ProduceSchema
+from app.schemas.compiled import compile_schema
+from app.schemas.produce import ProduceSchema, ProduceExportSchema
+from app.services.image_service import spool_image, enqueue_image, pending_spool_paths, discard_produce_images
+from app.services.search_service import search_produce
+from app.utils.conditional import conditional_response
 from app.utils.decorators import farmer_required
+from app.utils.idempotency import enable_idempotency_keys
+from app.utils.pagination import keyset_paginate, parse_limit, InvalidCursor
 from app import db
 
-produce_bp = Blueprint('produce_bp', __name__)
+produce_bp = enable_idempotency_keys(Blueprint('produce_bp', __name__))
 produce_schema = ProduceSchema()
 produces_schema = ProduceSchema(many=True)
+# List endpoints select just these columns and dump the tuples without building Produce objects
+produces_serializer = compile_schema(produces_schema)
+export_serializer = compile_schema(ProduceExportSchema(many=True))
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'produce.ndjson'),
+    'csv': ('text/csv', 'produce.csv'),
+}
 
 @produce_bp.route('/', methods=['POST'])
 @jwt_required()
@@ -23,7 +41,10 @@ def create_produce():
     tags:
       - Produce
     summary: Create a new produce listing (Farmer Only)
-    description: Allows an approved farmer to add a new produce item to the marketplace. This endpoint handles image uploads via multipart/form-data.
+    description: >
+      Allows an approved farmer to add a new produce item to the marketplace. This endpoint handles image uploads
+      via multipart/form-data. The image is processed in the background: the listing is returned with
+      image_status "pending", and image_url and thumbnail_url are filled in once it is stored ("ready").
     security:
       - bearerAuth: []
     requestBody:
@@ -47,7 +68,7 @@ def create_produce():
       '403':
         description: Forbidden. User is not an approved farmer.
       '422':
-        description: Unprocessable Entity. Validation error on form data.
+        description: Unprocessable Entity. Validation error on form data, or the upload is not an image.
     """
     farmer_id = get_jwt_identity()
     form_data = request.form.to_dict()
@@ -57,17 +78,9 @@ def create_produce():
     except ValidationError as err:
         return jsonify(err.messages), 422
     
-    image_url = None
-    if 'image' in request.files:
-        image_file = request.files['image']
-        try:
-            upload_result = cloudinary.uploader.upload(
-                image_file,
-                folder="fmlp_produce_images"
-            )
-            image_url = upload_result.get('secure_url')
-        except Exception as e:
-            return jsonify(message="Image upload failed.", error=str(e)), 500
+    image_file = request.files.get('image')
+    if image_file and not (image_file.mimetype or '').startswith('image/'):
+        return jsonify(image=["The uploaded file is not an image."]), 422
 
     new_produce = Produce(
         farmer_id=int(farmer_id),
@@ -76,15 +89,151 @@ def create_produce():
         price=data['price'],
         quantity=data['quantity'],
         unit=data['unit'],
-        location=data.get('location'),
-        image_url=image_url
+        location=data.get('location')
     )
-    
     db.session.add(new_produce)
-    db.session.commit()
-    
+
+    # The image is only spooled to disk here; the image worker stores it and fills in image_url.
+    spool_path = None
+    if image_file:
+        spool_path = spool_image(image_file)
+        enqueue_image(new_produce, spool_path)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if spool_path:
+            os.remove(spool_path)
+        raise
+
     return jsonify(produce_schema.dump(new_produce)), 201
 
+def _import_rows():
+    """Reads the bulk import payload: a JSON array, or CSV as an uploaded 'file' or as the request body."""
+    if request.is_json:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            raise ValueError("Expected a JSON array of produce objects.")
+        return rows
+    if 'file' in request.files:
+        text = request.files['file'].read().decode('utf-8-sig')
+    elif request.mimetype == 'text/csv':
+        text = request.get_data(as_text=True)
+    else:
+        raise ValueError("Send a JSON array, or CSV as text/csv or as a multipart 'file' upload.")
+    # Blank CSV cells mean "not given", so optional columns like image_url may be left empty
+    return [
+        {key: value for key, value in row.items() if key and value not in ('', None)}
+        for row in csv.DictReader(io.StringIO(text))
+    ]
+
+@produce_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+@farmer_required
+def bulk_create_produce():
+    """
+    Create many produce listings at once
+    ---
+    tags:
+      - Produce
+    summary: Bulk-create produce listings (Farmer Only)
+    description: >
+      Creates up to PRODUCE_IMPORT_MAX_ROWS listings in one transaction. Rows use the same fields as
+      single creation, with images given as already-uploaded image_url links. Every row is validated
+      first; if any row is invalid nothing is created and the errors are returned keyed by the row's
+      zero-based position (CSV rows are counted after the header).
+    security:
+      - bearerAuth: []
+    requestBody:
+      required: true
+      content:
+        application/json:
+          schema:
+            type: array
+            items:
+              type: object
+              required: [name, price, quantity, unit]
+              properties:
+                name: { type: string, example: "Fresh Tomatoes" }
+                description: { type: string }
+                price: { type: number, format: float, example: 85.50 }
+                quantity: { type: integer, example: 50 }
+                unit: { type: string, enum: [kg, bunch, crate, item] }
+                location: { type: string }
+                image_url: { type: string, format: uri }
+        text/csv:
+          schema: { type: string, example: "name,price,quantity,unit,location,image_url" }
+        multipart/form-data:
+          schema:
+            type: object
+            properties:
+              file: { type: string, format: binary, description: "CSV file with a header row." }
+    responses:
+      '201':
+        description: All rows were created. Returns the count and the new ids in input order.
+      '400':
+        description: Bad Request. The payload is not a JSON array or CSV, is empty, or has too many rows.
+      '422':
+        description: Unprocessable Entity. Per-row validation errors; nothing was created.
+    """
+    farmer_id = int(get_jwt_identity())
+    try:
+        rows = _import_rows()
+    except (ValueError, UnicodeDecodeError, csv.Error) as err:
+        return jsonify(message=str(err)), 400
+    max_rows = current_app.config['PRODUCE_IMPORT_MAX_ROWS']
+    if not rows:
+        return jsonify(message="No rows to import."), 400
+    if len(rows) > max_rows:
+        return jsonify(message=f"Too many rows: at most {max_rows} per request."), 400
+
+    try:
+        data = produces_schema.load(rows)
+    except ValidationError as err:
+        return jsonify(message="No listings were created; fix the rows below.", errors=err.messages), 422
+
+    now = datetime.now(timezone.utc)
+    values = [
+        {
+            "farmer_id": farmer_id,
+            "name": row['name'],
+            "description": row.get('description'),
+            "price": row['price'],
+            "quantity": row['quantity'],
+            "unit": row['unit'],
+            "location": row.get('location'),
+            "image_url": row.get('image_url'),
+            "image_status": 'ready' if row.get('image_url') else None,
+            "is_available": True,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for row in data
+    ]
+    # One executemany: batched into multi-row INSERT ... RETURNING on PostgreSQL and SQLite
+    new_ids = db.session.execute(
+        db.insert(Produce).returning(Produce.id, sort_by_parameter_order=True), values
+    ).scalars().all()
+    db.session.commit()
+    return jsonify(created=len(new_ids), ids=new_ids), 201
+
+def available_produce_query(args):
+    """Builds the marketplace listing query (available produce plus the name/location/price filters in `args`)."""
+    query = Produce.query.filter_by(is_available=True)
+    produce_name = args.get('name')
+    if produce_name:
+        query = query.filter(Produce.name.ilike(f"%{produce_name}%"))
+    location = args.get('location')
+    if location:
+        query = query.filter(Produce.location.ilike(f"%{location}%"))
+    min_price = args.get('min_price', type=float)
+    if min_price is not None:
+        query = query.filter(Produce.price >= min_price)
+    max_price = args.get('max_price', type=float)
+    if max_price is not None:
+        query = query.filter(Produce.price <= max_price)
+    return query
+
 @produce_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_all_produce():
@@ -98,6 +247,13 @@ def get_all_produce():
     security:
       - bearerAuth: []
     parameters:
+      - in: query
+        name: q
+        schema: { type: string }
+        description: >
+          Full-text search over name, location and description. Results are ranked by relevance
+          (name matches first) and every word must match, as a whole word or a prefix.
+          Can be combined with the other filters and with limit, but not with cursor.
       - in: query
         name: name
         schema: { type: string }
@@ -114,25 +270,59 @@ def get_all_produce():
         name: max_price
         schema: { type: number, format: float }
         description: Filter for items with a price less than or equal to this value.
+      - in: query
+        name: limit
+        schema: { type: integer, minimum: 1, maximum: 100 }
+        description: Opt into cursor pagination and return at most this many items per page.
+      - in: query
+        name: cursor
+        schema: { type: string }
+        description: The next_cursor value from a previous page. Implies cursor pagination.
     responses:
       '200':
-        description: A list of produce items.
+        description: >
+          A list of produce items. When limit or cursor is given, an envelope of the form
+          {"items": [...], "next_cursor": "..."} is returned instead; next_cursor is null on the last page,
+          and always null for q, whose ranked results are not paginated further.
+          Responses carry an ETag header for conditional requests.
+      '304':
+        description: Not Modified. No listing matching the filters changed since the If-None-Match validator.
+      '400':
+        description: Bad Request. The cursor is malformed, or was combined with q.
     """
-    query = Produce.query.filter_by(is_available=True)
-    produce_name = request.args.get('name')
-    if produce_name:
-        query = query.filter(Produce.name.ilike(f"%{produce_name}%"))
-    location = request.args.get('location')
-    if location:
-        query = query.filter(Produce.location.ilike(f"%{location}%"))
-    min_price = request.args.get('min_price', type=float)
-    if min_price is not None:
-        query = query.filter(Produce.price >= min_price)
-    max_price = request.args.get('max_price', type=float)
-    if max_price is not None:
-        query = query.filter(Produce.price <= max_price)
-    all_produce = query.order_by(Produce.created_at.desc()).all()
-    return jsonify(produces_schema.dump(all_produce)), 200
+    query = available_produce_query(request.args)
+
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    search_text = request.args.get('q', '').strip()
+    if search_text and cursor:
+        return jsonify(message="Cursor pagination is not supported for ranked search. Use limit instead."), 400
+
+    def build_response():
+        listing = query.with_entities(*produces_serializer.columns(Produce))
+        if search_text:
+            if limit is None:
+                return jsonify(produces_serializer.dump(search_produce(query, search_text, None))), 200
+            # Ranked results have no stable cursor; the envelope keeps the shape promised for limit
+            results = search_produce(query, search_text, parse_limit(limit))
+            return jsonify(items=produces_serializer.dump(results), next_cursor=None), 200
+
+        if limit is not None or cursor:
+            try:
+                page, next_cursor = keyset_paginate(
+                    listing, Produce.created_at, Produce.id, parse_limit(limit), cursor
+                )
+            except InvalidCursor as err:
+                return jsonify(message=str(err)), 400
+            return jsonify(items=produces_serializer.dump_rows(page), next_cursor=next_cursor), 200
+
+        all_produce = listing.order_by(Produce.created_at.desc(), Produce.id.desc()).all()
+        return jsonify(produces_serializer.dump_rows(all_produce)), 200
+
+    validators = query.with_entities(
+        db.func.count(Produce.id), db.func.max(Produce.updated_at)
+    ).order_by(None).one()
+    return conditional_response(validators, build_response, vary=sorted(request.args.items(multi=True)))
 
 @produce_bp.route('/<int:produce_id>', methods=['PUT'])
 @jwt_required()
@@ -210,8 +400,11 @@ def delete_produce(produce_id):
     farmer_id_from_token = get_jwt_identity()
     if produce.farmer_id != int(farmer_id_from_token):
         return jsonify(message="Unauthorized: You do not own this listing"), 403
+    # Deleting the listing cascades to its queued image uploads, but not to the files behind them
+    spool_paths = pending_spool_paths(produce.id)
     db.session.delete(produce)
     db.session.commit()
+    discard_produce_images(produce_id, spool_paths)
     return '', 204
 
 @produce_bp.route('/my-listings', methods=['GET'])
@@ -220,5 +413,91 @@ def delete_produce(produce_id):
 def get_my_produce():
     """Get all produce listings for the currently logged-in farmer."""
     farmer_id = int(get_jwt_identity())
-    my_produce = Produce.query.filter_by(farmer_id=farmer_id).order_by(Produce.created_at.desc()).all()
-    return jsonify(produces_schema.dump(my_produce)), 200
\ No newline at end of file
+    my_produce = db.session.execute(
+        db.select(*produces_serializer.columns(Produce))
+        .where(Produce.farmer_id == farmer_id)
+        .order_by(Produce.created_at.desc(), Produce.id.desc())
+    ).all()
+    return jsonify(produces_serializer.dump_rows(my_produce)), 200
+
+def _export_batches(statement):
+    """Yields lists of serialized rows, holding only one batch in memory at a time."""
+    result = db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for rows in result.partitions():
+        yield export_serializer.dump_rows(rows)
+
+def _ndjson_chunks(batches):
+    dumps = current_app.json.dumps
+    for batch in batches:
+        yield ''.join(dumps(item) + '\n' for item in batch)
+
+def _csv_cell(value):
+    # Nested values such as image_variants go out as JSON rather than a Python repr
+    return current_app.json.dumps(value) if isinstance(value, (dict, list)) else value
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = list(export_serializer.schema.dump_fields)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows([_csv_cell(item[column]) for column in columns] for item in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@produce_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_produce():
+    """
+    Export the produce catalog
+    ---
+    tags:
+      - Produce
+    summary: Stream every produce listing as NDJSON or CSV
+    description: >
+      Streams the whole catalog (available and unavailable listings) in order of last update,
+      reading it from the database in batches through a server-side cursor, so memory stays flat
+      however large the table is. For incremental syncs, pass the largest updated_at seen so far
+      as updated_since.
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: format
+        schema: { type: string, enum: [ndjson, csv], default: ndjson }
+      - in: query
+        name: updated_since
+        schema: { type: string, format: date-time }
+        description: Only export listings updated strictly after this ISO 8601 timestamp (UTC if no offset is given).
+    responses:
+      '200':
+        description: One JSON object per line (application/x-ndjson), or CSV with a header row (text/csv).
+      '400':
+        description: Bad Request. Unknown format or malformed updated_since.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(message=f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}."), 400
+
+    statement = db.select(*export_serializer.columns(Produce))
+    updated_since = request.args.get('updated_since')
+    if updated_since:
+        try:
+            since = datetime.fromisoformat(updated_since)
+        except ValueError:
+            return jsonify(message="updated_since must be an ISO 8601 timestamp."), 400
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        statement = statement.where(Produce.updated_at > since)
+    statement = statement.order_by(Produce.updated_at, Produce.id)
+
+    mimetype, filename = EXPORT_FORMATS[export_format]
+    chunks = _ndjson_chunks if export_format == 'ndjson' else _csv_chunks
+    response = current_app.response_class(
+        stream_with_context(chunks(_export_batches(statement))), mimetype=mimetype
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
@@ -1,5 +1,10 @@
-from flask import request, Response, Blueprint
+import json
+
+from flask import current_app, request, Response, Blueprint
+from twilio.twiml.messaging_response import MessagingResponse
+
 from app.services import twilio_service
+from app.services.webhook_inbox import record_webhook
 
 sms_bp = Blueprint('sms_bp', __name__)
 
@@ -15,8 +20,14 @@ def inbound_sms():
     if not from_number:
         return Response("Missing 'From' number.", status=400)
 
+    if current_app.config['WEBHOOK_INBOX']:
+        # Store and acknowledge with an empty TwiML response; the webhook worker carries out
+        # the command and the reply goes out through the outbound SMS queue.
+        record_webhook('twilio', from_number, json.dumps({"From": from_number, "Body": message_body}))
+        return Response(str(MessagingResponse()), mimetype='text/xml')
+
     # Process the logic in the service and get the TwiML response
     twiml_response_str = twilio_service.process_inbound_sms(from_number, message_body)
     
     # Return the response with the correct content type for Twilio
-    return Response(twiml_response_str, mimetype='text/xml')
\ No newline at end of file
+    return Response(twiml_response_str, mimetype='text/xml')
@@ -8,7 +8,14 @@ class ProduceSchema(Schema):
     quantity = fields.Int(required=True, validate=lambda q: q >= 0)
     unit = fields.Str(required=True, validate=validate.OneOf(['kg', 'bunch', 'crate', 'item']))
     image_url = fields.URL(required=False, allow_none=True)
+    image_status = fields.Str(dump_only=True)
+    thumbnail_url = fields.Str(dump_only=True)
+    image_variants = fields.Dict(dump_only=True)
     is_available = fields.Bool(dump_only=True)
     location = fields.Str(required=False, allow_none=True)
     created_at = fields.DateTime(dump_only=True)
-    farmer_id = fields.Int(dump_only=True)
\ No newline at end of file
+    farmer_id = fields.Int(dump_only=True)
+
+class ProduceExportSchema(ProduceSchema):
+    # Exports also carry updated_at, which clients pass back as updated_since for incremental syncs
+    updated_at = fields.DateTime(dump_only=True)
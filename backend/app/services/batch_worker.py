@@ -0,0 +1,149 @@
+# app/services/batch_worker.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from app import db
+
+# last_error of a job whose final attempt never reported back
+LEASE_EXHAUSTED_ERROR = "Lease expired on the last attempt; the worker stopped while processing it."
+
+
+def retry_delay(attempts, base_seconds):
+    """Exponential backoff: base, 2*base, 4*base, ... capped at one hour."""
+    return timedelta(seconds=min(base_seconds * (2 ** (attempts - 1)), 3600))
+
+
+class BatchWorker:
+    """
+    Scaffolding shared by the background workers.
+
+    Subclasses implement _claim_batch() (a short transaction that returns plain
+    job tuples), _process(job), which runs on the thread pool and must not touch
+    the session, and _record_results(results), which writes every outcome back
+    in one transaction.
+    """
+    name = 'batch'
+
+    def __init__(self, app, batch_size, max_workers, poll_interval):
+        self.app = app
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f'{self.name}-worker')
+
+    def _process_batch(self, batch):
+        return list(self._pool.map(self._process, batch))
+
+    def run_once(self):
+        """Claims, processes and records one batch. Returns the number of jobs attempted."""
+        with self.app.app_context():
+            batch = self._claim_batch()
+            if not batch:
+                return 0
+            results = self._process_batch(batch)
+            self._record_results(results)
+            return len(results)
+
+    def run_forever(self, stop_event=None, on_batch=None):
+        """Processes batches back to back, sleeping only when nothing is due. on_batch(worker) runs after each batch."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:
+                self.app.logger.exception(f"{self.name.capitalize()} worker error")
+                processed = 0
+            if processed and on_batch:
+                on_batch(self)
+            if not processed:
+                stop_event.wait(self.poll_interval)
+
+    def drain(self, max_batches=100):
+        """Runs batches until nothing is due, then shuts the pool down. Returns the number of jobs attempted."""
+        try:
+            total = 0
+            for _ in range(max_batches):
+                processed = self.run_once()
+                if not processed:
+                    break
+                total += processed
+            return total
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+class LeasedJobWorker(BatchWorker):
+    """
+    A BatchWorker over a job table with status, attempts, max_attempts and next_attempt_at columns.
+
+    Claiming moves due jobs to busy_status and leases them until next_attempt_at;
+    a job whose worker died is claimed again once its lease expires, but never
+    beyond max_attempts. A job that used its last attempt without reporting
+    back (say, an input that crashes the worker) is failed instead of retried.
+    """
+    model = None
+    busy_status = None
+
+    def __init__(self, app, batch_size, max_workers, poll_interval, lease_seconds, retry_base_seconds):
+        super().__init__(app, batch_size, max_workers, poll_interval)
+        self.lease = timedelta(seconds=lease_seconds)
+        self.retry_base_seconds = retry_base_seconds
+
+    def _claimable(self, now):
+        model = self.model
+        return (
+            model.status.in_(['Pending', self.busy_status]),
+            model.next_attempt_at <= now,
+            model.attempts < model.max_attempts,
+        )
+
+    def _fail_exhausted_leases(self, now):
+        """Fails (and returns) leased jobs that expired on their last attempt. Runs in the claiming transaction."""
+        model = self.model
+        exhausted = db.session.execute(
+            db.select(model)
+            .where(model.status == self.busy_status, model.next_attempt_at <= now,
+                   model.attempts >= model.max_attempts)
+            .order_by(model.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        for job in exhausted:
+            self._mark_failed(job, now, LEASE_EXHAUSTED_ERROR)
+        return exhausted
+
+    def _claim_jobs(self, now):
+        """Leases the next due jobs, oldest first, and returns them. The caller commits."""
+        model = self.model
+        claimed = db.session.execute(
+            db.select(model)
+            .where(*self._claimable(now))
+            .order_by(model.next_attempt_at, model.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        for job in claimed:
+            self._lease(job, now)
+        return claimed
+
+    def _lease(self, job, now):
+        job.status = self.busy_status
+        job.attempts += 1
+        job.next_attempt_at = now + self.lease
+
+    def _mark_failed(self, job, now, error):
+        job.status = 'Failed'
+        job.last_error = error
+
+    def _retry_or_fail(self, job, now, error):
+        """Schedules another attempt with exponential backoff, or fails the job once max_attempts is used up."""
+        if job.attempts >= job.max_attempts:
+            self._mark_failed(job, now, error)
+        else:
+            job.status = 'Pending'
+            job.last_error = error
+            job.next_attempt_at = now + retry_delay(job.attempts, self.retry_base_seconds)
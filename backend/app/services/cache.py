@@ -0,0 +1,84 @@
+# app/services/cache.py
+import json
+import threading
+import time
+
+from flask import current_app
+
+
+class MemoryCache:
+    """Per-process key/value cache with per-entry TTL. The default backend."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    """
+    Redis-backed cache shared by every worker process. Values must be JSON-serializable.
+
+    Requires the optional `redis` package.
+    """
+
+    def __init__(self, url, prefix='fmlp:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND='redis' requires the 'redis' package (pip install redis).") from e
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key):
+        raw = self._client.get(self._prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl):
+        self._client.set(self._prefix + key, json.dumps(value), ex=max(int(ttl), 1))
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self._prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+
+def get_cache(app=None):
+    """Returns the app's shared cache backend, selected by the CACHE_BACKEND setting."""
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('fmlp_cache')
+    if cache is None:
+        backend = app.config['CACHE_BACKEND']
+        if backend == 'memory':
+            cache = MemoryCache()
+        elif backend == 'redis':
+            cache = RedisCache(app.config['CACHE_REDIS_URL'])
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+        app.extensions['fmlp_cache'] = cache
+    return cache
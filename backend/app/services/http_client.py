@@ -0,0 +1,116 @@
+# app/services/http_client.py
+import json
+import threading
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+# (connect, read) seconds. Without these, a stalled provider would hang a worker thread forever.
+DEFAULT_TIMEOUT = (3.05, 15)
+DEFAULT_POOL_SIZE = 20
+
+
+class HttpClient:
+    """
+    A keep-alive, connection-pooled requests.Session with default timeouts.
+
+    One instance is shared by every thread talking to the same provider, so TLS
+    handshakes are paid once per pooled connection rather than once per call.
+    The transport adapter can be swapped (see StubTransport) to run offline.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, pool_maxsize=DEFAULT_POOL_SIZE):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.mount(HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize))
+
+    def mount(self, transport):
+        """Routes every http(s) request of this client through `transport`."""
+        self.session.mount('https://', transport)
+        self.session.mount('http://', transport)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    """Returns the shared HttpClient for an external service ('mpesa', 'twilio', ...)."""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = HttpClient()
+        return client
+
+
+def set_transport(name, transport):
+    """Replaces the transport of a service's shared client, e.g. with a StubTransport in tests."""
+    get_client(name).mount(transport)
+
+
+def reset_clients():
+    """Closes and forgets every shared client; the next get_client() starts fresh."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+class StubTransport(BaseAdapter):
+    """
+    A requests transport that answers from local handler functions instead of the network.
+
+    Handlers receive the PreparedRequest and return (status_code, body[, headers]);
+    dict and list bodies are sent as JSON. Every request is kept in `requests`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.routes = []
+        self.requests = []
+
+    def add(self, method, url_prefix, handler):
+        self.routes.append((method.upper(), url_prefix, handler))
+        return self
+
+    def calls_to(self, url_prefix):
+        return [r for r in self.requests if r.url.startswith(url_prefix)]
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        for method, url_prefix, handler in self.routes:
+            if request.method == method and request.url.startswith(url_prefix):
+                status_code, body, *rest = handler(request)
+                headers = rest[0] if rest else {}
+                break
+        else:
+            status_code, body, headers = 404, {"error": f"No stub for {request.method} {request.url}"}, {}
+
+        response = requests.Response()
+        response.status_code = status_code
+        response.request = request
+        response.url = request.url
+        response.encoding = 'utf-8'
+        if isinstance(body, (dict, list)):
+            response._content = json.dumps(body).encode('utf-8')
+            response.headers['Content-Type'] = 'application/json'
+        else:
+            response._content = (body or '').encode('utf-8')
+        response.headers.update(headers)
+        return response
+
+    def close(self):
+        pass
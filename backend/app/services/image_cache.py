@@ -0,0 +1,97 @@
+# app/services/image_cache.py
+import hashlib
+import os
+import threading
+import uuid
+
+from flask import current_app
+
+
+class DiskLRUCache:
+    """
+    A directory of cached files bounded to `max_bytes`, evicting the least recently used first.
+
+    Recency is the file's mtime, refreshed on every hit, so the cache survives
+    restarts and can be shared by several worker processes on one host (each
+    process enforces the bound on its own writes). Writes are atomic renames.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # bytes on disk, computed lazily by the first write
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def set(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        with os.scandir(self.directory) as it:
+            return [entry for entry in it if entry.is_file() and not entry.name.endswith('.tmp')]
+
+    def _scan_size(self):
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def _evict(self):
+        """Deletes the least recently used files until the cache is back under max_bytes."""
+        entries = []
+        for entry in self._entries():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries():
+                os.remove(entry.path)
+            self._size = 0
+
+
+def get_image_cache(app=None):
+    """Returns the app's rendered-image cache (IMAGE_CACHE_DIR, bounded by IMAGE_CACHE_MAX_BYTES)."""
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('image_cache')
+    if cache is None:
+        cache = DiskLRUCache(app.config['IMAGE_CACHE_DIR'], app.config['IMAGE_CACHE_MAX_BYTES'])
+        app.extensions['image_cache'] = cache
+    return cache
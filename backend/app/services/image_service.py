@@ -0,0 +1,259 @@
+# app/services/image_service.py
+import hashlib
+import io
+import os
+import uuid
+from datetime import datetime, timezone
+
+from flask import current_app
+from PIL import Image, ImageOps
+
+from app import db
+from app.models.image_upload import ImageUpload
+from app.models.produce import Produce
+from app.services.batch_worker import LeasedJobWorker
+from app.services.image_cache import get_image_cache
+from app.services.storage import get_storage
+
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+
+def spool_image(file_storage, spool_dir=None):
+    """Saves an uploaded file to the spool directory and returns its path. No network, no decoding."""
+    spool_dir = spool_dir or current_app.config['IMAGE_SPOOL_DIR']
+    os.makedirs(spool_dir, exist_ok=True)
+    path = os.path.join(spool_dir, uuid.uuid4().hex)
+    file_storage.save(path)
+    return path
+
+
+def enqueue_image(produce, spool_path, max_attempts=None):
+    """
+    Queues a spooled image for `produce` in the current session and marks the listing's image as pending.
+
+    The job is committed together with the listing; the image worker then stores
+    the image and its resized variants and fills in image_url, image_variants and thumbnail_url.
+    """
+    produce.image_status = 'pending'
+    upload = ImageUpload(
+        produce=produce,
+        spool_path=spool_path,
+        max_attempts=max_attempts or current_app.config['IMAGE_MAX_ATTEMPTS']
+    )
+    db.session.add(upload)
+    return upload
+
+
+# name -> (Pillow format, file extension, MIME type, encoder options)
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', '.jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', '.webp', 'image/webp', {'quality': 80, 'method': 4}),
+}
+
+
+def _source_format(data):
+    """Identifies the upload from its header (no full decode). Raises if it is not a supported image."""
+    with Image.open(io.BytesIO(data)) as image:
+        if image.format not in EXTENSIONS:
+            raise ValueError(f"Unsupported image format: {image.format}")
+        return image.format
+
+
+def render_variants(data, widths, formats):
+    """
+    Decodes the image once and returns {width: {format: encoded bytes}}.
+
+    Each variant fits within `width` pixels (never upscaled) and is resized from
+    the next larger one, so the full-size image is only downsampled once.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        current = ImageOps.exif_transpose(image).convert('RGB')
+    variants = {}
+    for width in sorted(widths, reverse=True):
+        current.thumbnail((width, width * 4), reducing_gap=3.0)
+        variants[width] = {}
+        for name in formats:
+            pil_format, _, _, options = VARIANT_FORMATS[name]
+            buffer = io.BytesIO()
+            current.save(buffer, pil_format, **options)
+            variants[width][name] = buffer.getvalue()
+    return variants
+
+
+def _cached_variants(data, widths, formats, cache):
+    """render_variants(), reusing earlier renders of byte-identical images from the disk cache."""
+    digest = hashlib.sha256(data).hexdigest()
+    keys = {(width, name): f"variant:{digest}:{width}:{name}" for width in widths for name in formats}
+    if cache is not None:
+        hits = {spec: cache.get(key) for spec, key in keys.items()}
+        if all(hit is not None for hit in hits.values()):
+            variants = {width: {} for width in widths}
+            for (width, name), encoded in hits.items():
+                variants[width][name] = encoded
+            return variants
+    variants = render_variants(data, widths, formats)
+    if cache is not None:
+        for (width, name), key in keys.items():
+            cache.set(key, variants[width][name])
+    return variants
+
+
+def process_image(data, produce_id, storage, widths, formats, cache=None):
+    """
+    Validates the image, stores the original and every variant, and returns (image_url, variant_urls).
+
+    variant_urls maps str(width) -> format -> URL, as kept in Produce.image_variants.
+    Raises if `data` is not an image Pillow can decode.
+    """
+    source_format = _source_format(data)
+    variants = _cached_variants(data, widths, formats, cache)
+
+    # A fresh prefix per upload, so caches never serve a previous image under the same URL
+    prefix = f"{_storage_prefix(produce_id)}{uuid.uuid4().hex[:16]}"
+    image_url = storage.save(f"{prefix}/original{EXTENSIONS[source_format]}", data, Image.MIME[source_format])
+    variant_urls = {}
+    for width, encoded in variants.items():
+        variant_urls[str(width)] = {
+            name: storage.save(f"{prefix}/w{width}{VARIANT_FORMATS[name][1]}", encoded[name], VARIANT_FORMATS[name][2])
+            for name in formats
+        }
+    return image_url, variant_urls
+
+
+def _remove_spool_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _storage_prefix(produce_id):
+    return f"produce/{produce_id}/"
+
+
+def pending_spool_paths(produce_id):
+    """Spool files of the listing's uploads the worker has not finished with yet."""
+    return db.session.scalars(
+        db.select(ImageUpload.spool_path)
+        .where(ImageUpload.produce_id == produce_id, ImageUpload.status.in_(['Pending', 'Processing']))
+    ).all()
+
+
+def discard_produce_images(produce_id, spool_paths, storage=None):
+    """
+    Removes a deleted listing's spooled uploads and every image stored for it.
+
+    Call after the deletion is committed. Storage errors are logged rather than
+    raised, since the listing is already gone.
+    """
+    for path in spool_paths:
+        _remove_spool_file(path)
+    try:
+        (storage or get_storage()).delete_prefix(_storage_prefix(produce_id))
+    except Exception:
+        current_app.logger.exception(f"Could not delete stored images of produce {produce_id}")
+
+
+class ImageWorker(LeasedJobWorker):
+    """
+    Processes spooled produce images.
+
+    Works like the notification worker: each batch is claimed in a short
+    transaction (FOR UPDATE SKIP LOCKED on PostgreSQL) with a lease, the images
+    are decoded, resized into every IMAGE_VARIANT_WIDTHS x IMAGE_VARIANT_FORMATS
+    variant and stored from a thread pool, and the results are
+    written back to the listings in one transaction. Failures are retried with
+    exponential backoff; after max_attempts the listing's image is marked failed,
+    including when the image keeps killing the worker (a decompression bomb, say).
+    """
+    name = 'image'
+    model = ImageUpload
+    busy_status = 'Processing'
+
+    def __init__(self, app, storage=None, cache=None, batch_size=None, max_workers=None, poll_interval=None):
+        super().__init__(
+            app,
+            batch_size=batch_size or app.config['IMAGE_WORKER_BATCH_SIZE'],
+            max_workers=max_workers or app.config['IMAGE_WORKER_THREADS'],
+            poll_interval=poll_interval or app.config['IMAGE_WORKER_POLL_INTERVAL'],
+            lease_seconds=app.config['IMAGE_PROCESS_LEASE_SECONDS'],
+            retry_base_seconds=app.config['IMAGE_RETRY_BASE_SECONDS']
+        )
+        self.storage = storage or get_storage(app)
+        self.cache = cache or get_image_cache(app)
+        self.widths = tuple(app.config['IMAGE_VARIANT_WIDTHS'])
+        self.formats = tuple(app.config['IMAGE_VARIANT_FORMATS'])
+        self.thumbnail_width = app.config['IMAGE_THUMBNAIL_WIDTH']
+        if self.thumbnail_width not in self.widths or 'jpeg' not in self.formats:
+            raise ValueError("IMAGE_THUMBNAIL_WIDTH must be one of IMAGE_VARIANT_WIDTHS, with 'jpeg' among IMAGE_VARIANT_FORMATS.")
+
+    def _claim_batch(self):
+        now = datetime.now(timezone.utc)
+        finished_files = [upload.spool_path for upload in self._fail_exhausted_leases(now)]
+        batch = [(upload.id, upload.produce_id, upload.spool_path) for upload in self._claim_jobs(now)]
+        db.session.commit()
+        for path in finished_files:
+            _remove_spool_file(path)
+        return batch
+
+    def _process(self, job):
+        upload_id, produce_id, spool_path = job
+        try:
+            with open(spool_path, 'rb') as f:
+                data = f.read()
+            result = process_image(data, produce_id, self.storage, self.widths, self.formats, self.cache)
+            return upload_id, produce_id, result, None
+        except Exception as e:
+            return upload_id, produce_id, None, f"{type(e).__name__}: {e}"
+
+    def _mark_failed(self, upload, now, error):
+        super()._mark_failed(upload, now, error)
+        upload.finished_at = now
+        if upload.produce is not None:
+            upload.produce.image_status = 'failed'
+
+    def _record_results(self, results):
+        now = datetime.now(timezone.utc)
+        uploads = {
+            upload.id: upload
+            for upload in ImageUpload.query.filter(ImageUpload.id.in_([r[0] for r in results]))
+        }
+        # Loaded in one query, so the relationship lookups below hit the identity map
+        produce = {
+            item.id: item
+            for item in Produce.query.filter(Produce.id.in_([upload.produce_id for upload in uploads.values()]))
+        }
+        finished_files = []
+        orphaned = []
+        for upload_id, produce_id, result, error in results:
+            upload = uploads.get(upload_id)
+            if upload is None:
+                # The listing, and with it the job, was deleted meanwhile; drop what we just stored for it
+                if error is None:
+                    orphaned.append(produce_id)
+                continue
+            listing = produce.get(upload.produce_id)
+            if error is None:
+                upload.status = 'Done'
+                upload.finished_at = now
+                upload.last_error = None
+                if listing is not None:
+                    listing.image_url, listing.image_variants = result
+                    listing.thumbnail_url = listing.image_variants[str(self.thumbnail_width)]['jpeg']
+                    listing.image_status = 'ready'
+                finished_files.append(upload.spool_path)
+            else:
+                self._retry_or_fail(upload, now, error)
+                if upload.status == 'Failed':
+                    finished_files.append(upload.spool_path)
+        db.session.commit()
+        for path in finished_files:
+            _remove_spool_file(path)
+        for produce_id in orphaned:
+            discard_produce_images(produce_id, [], self.storage)
+
+
+def drain_images(app=None, max_batches=100):
+    """Runs the worker until no spooled image is due. Handy for tests and cron jobs."""
+    return ImageWorker(app or current_app._get_current_object()).drain(max_batches)
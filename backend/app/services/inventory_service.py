@@ -0,0 +1,82 @@
+# app/services/inventory_service.py
+from collections import OrderedDict
+
+from app import db
+from app.models.produce import Produce
+
+
+class StockError(Exception):
+    """Base class for reservation failures that should be reported to the buyer."""
+    status_code = 400
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class ProduceNotFound(StockError):
+    status_code = 404
+
+
+class InsufficientStock(StockError):
+    status_code = 400
+
+
+def reserve_stock(cart_lines):
+    """
+    Atomically decrements stock for every line in a cart.
+
+    All cart produce is fetched in one SELECT ... FOR UPDATE ordered by id, so
+    concurrent carts always lock rows in the same order and cannot deadlock.
+    Stock is validated in memory, then every decrement is applied in a single
+    UPDATE guarded by `quantity >= requested`, which also protects databases
+    that ignore FOR UPDATE (SQLite) from overselling.
+
+    Must be called inside the caller's transaction; the locks are held until it
+    commits or rolls back. Returns {produce_id: Produce} for pricing the order.
+    Raises ProduceNotFound or InsufficientStock without writing anything.
+    """
+    requested = OrderedDict()
+    for line in cart_lines:
+        requested[line['produce_id']] = requested.get(line['produce_id'], 0) + line['quantity']
+
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite ignores FOR UPDATE, and a transaction that reads before it writes is refused with
+        # "database is locked" instead of waiting when another one writes meanwhile. A no-op write
+        # first takes the database write lock (waiting for it like a row lock), so carts queue up.
+        db.session.execute(
+            db.update(Produce)
+            .where(Produce.id.in_(requested.keys()))
+            .values(quantity=Produce.quantity, updated_at=Produce.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+
+    locked = db.session.execute(
+        db.select(Produce)
+        .where(Produce.id.in_(requested.keys()))
+        .order_by(Produce.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalars().all()
+    produce_by_id = {produce.id: produce for produce in locked}
+
+    for produce_id, quantity in requested.items():
+        produce = produce_by_id.get(produce_id)
+        if produce is None:
+            raise ProduceNotFound(f"Produce with id {produce_id} not found.")
+        if produce.quantity < quantity:
+            raise InsufficientStock(f"Insufficient stock for {produce.name}. Available: {produce.quantity}")
+
+    decrement = db.case(requested, value=Produce.id)
+    result = db.session.execute(
+        db.update(Produce)
+        .where(Produce.id.in_(requested.keys()), Produce.quantity >= decrement)
+        .values(quantity=Produce.quantity - decrement)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(requested):
+        raise InsufficientStock("Stock changed while placing the order. Please review your cart and try again.")
+
+    for produce in locked:
+        db.session.expire(produce, ['quantity', 'updated_at'])
+    return produce_by_id
@@ -0,0 +1,90 @@
+# app/services/market_price_cache.py
+import hashlib
+import uuid
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.market_price import MarketPrice
+from app.schemas.compiled import compile_schema
+from app.schemas.market_price import MarketPriceSchema
+from app.services.cache import get_cache
+
+CACHE_KEY = 'market_prices:v2'
+# Changed by every invalidation; a snapshot only counts as current if built under the current generation.
+GENERATION_KEY = 'market_prices:generation'
+GENERATION_TTL = 30 * 24 * 3600
+_prices_serializer = compile_schema(MarketPriceSchema(many=True))
+
+
+def _build_snapshot(generation):
+    rows = db.session.execute(
+        db.select(*_prices_serializer.columns(MarketPrice)).order_by(MarketPrice.crop_name)
+    ).all()
+    prices = _prices_serializer.dump_rows(rows)
+    body = current_app.json.dumps(prices)
+    return {
+        "body": body,
+        "etag": hashlib.sha1(body.encode('utf-8')).hexdigest(),
+        "by_crop": {price['crop_name']: price for price in prices},
+        "generation": generation,
+    }
+
+
+def _current_generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        cache.set(GENERATION_KEY, generation, GENERATION_TTL)
+    return generation
+
+
+def get_price_snapshot():
+    """
+    Returns the cached market price list, rebuilding it from the database when missing or expired.
+
+    The snapshot holds the serialized JSON body for GET /api/market/prices, its
+    ETag, and a crop_name lookup for the SMS PRICE command, so both read paths
+    share one query per MARKET_PRICE_CACHE_TTL (or per write, whichever is sooner).
+
+    A snapshot read from the database while a write commits may predate the
+    write yet reach the cache after its invalidation. It then carries the
+    generation from before that invalidation, so it is not stored, and it is
+    ignored if another process stored it anyway.
+    """
+    cache = get_cache()
+    generation = _current_generation(cache)
+    snapshot = cache.get(CACHE_KEY)
+    if snapshot is None or snapshot.get('generation') != generation:
+        snapshot = _build_snapshot(generation)
+        if cache.get(GENERATION_KEY) == generation:
+            cache.set(CACHE_KEY, snapshot, current_app.config['MARKET_PRICE_CACHE_TTL'])
+    return snapshot
+
+
+def invalidate_market_prices():
+    cache = get_cache()
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, GENERATION_TTL)
+    cache.delete(CACHE_KEY)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_market_price_writes(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, MarketPrice):
+            session.info['market_prices_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    # Runs for every write path (admin API, scripts, tests), not just create_price.
+    if session.info.pop('market_prices_changed', False):
+        invalidate_market_prices()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('market_prices_changed', None)
@@ -1,32 +1,92 @@
 # app/services/mpesa_service.py
 import os
+import threading
+import time
 import requests
 from requests.auth import HTTPBasicAuth
 import base64
 from datetime import datetime
 
-def get_access_token():
-    """Get access token from Safaricom Daraja API."""
+from app.services import http_client
+
+# Refresh the access token this many seconds before Daraja says it expires.
+TOKEN_EXPIRY_MARGIN = 60
+
+def _base_url():
+    return os.environ.get('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke')
+
+class AccessTokenCache:
+    """
+    Holds the Daraja OAuth token until shortly before it expires.
+
+    The lock makes concurrent requests share a single token fetch instead of
+    each racing to Safaricom when the cached token runs out.
+    """
+
+    def __init__(self):
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, fetch):
+        with self._lock:
+            if self._token is None or time.monotonic() >= self._expires_at:
+                token, expires_in = fetch()
+                self._token = token
+                self._expires_at = time.monotonic() + max(expires_in - TOKEN_EXPIRY_MARGIN, 0)
+            return self._token
+
+    def clear(self):
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
+
+token_cache = AccessTokenCache()
+
+def _fetch_access_token():
     consumer_key = os.environ.get('MPESA_CONSUMER_KEY')
     consumer_secret = os.environ.get('MPESA_CONSUMER_SECRET')
-    api_url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-    
+    api_url = f"{_base_url()}/oauth/v1/generate?grant_type=client_credentials"
+    r = http_client.get_client('mpesa').get(api_url, auth=HTTPBasicAuth(consumer_key, consumer_secret))
+    r.raise_for_status()
+    body = r.json()
+    return body['access_token'], int(body.get('expires_in', 3599))
+
+def get_access_token():
+    """Get access token from Safaricom Daraja API, reusing the cached one while it is valid."""
     try:
-        r = requests.get(api_url, auth=HTTPBasicAuth(consumer_key, consumer_secret))
-        r.raise_for_status()
-        return r.json()['access_token']
-    except requests.exceptions.RequestException as e:
+        return token_cache.get(_fetch_access_token)
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
         print(f"Error getting M-Pesa token: {e}")
         return None
 
+def _stk_password(timestamp):
+    """Returns (shortcode, base64(shortcode + passkey + timestamp)), as STK requests must be signed."""
+    shortcode = os.environ.get('MPESA_SHORTCODE')
+    passkey = os.environ.get('MPESA_PASSKEY')
+    password_str = shortcode + passkey + timestamp
+    password_bytes = password_str.encode('ascii')
+    return shortcode, base64.b64encode(password_bytes).decode('utf-8')
+
+def _post_with_token(api_url, payload, access_token):
+    client = http_client.get_client('mpesa')
+    response = client.post(api_url, json=payload, headers={"Authorization": f"Bearer {access_token}"})
+    if response.status_code == 401:
+        # Token revoked before its advertised expiry; fetch a new one and retry once.
+        token_cache.clear()
+        access_token = get_access_token()
+        if not access_token:
+            return None
+        response = client.post(api_url, json=payload, headers={"Authorization": f"Bearer {access_token}"})
+    return response
+
 def initiate_stk_push(phone_number, amount, order_id):
     """Initiate an STK Push request to the Safaricom API."""
     access_token = get_access_token()
     if not access_token:
         return None
 
-    api_url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-    headers = {"Authorization": f"Bearer {access_token}"}
+    api_url = f"{_base_url()}/mpesa/stkpush/v1/processrequest"
     
     # Sanitize phone number to 254... format
     if phone_number.startswith('+'):
@@ -35,13 +95,7 @@ def initiate_stk_push(phone_number, amount, order_id):
         phone_number = '254' + phone_number[1:]
 
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    shortcode = os.environ.get('MPESA_SHORTCODE')
-    passkey = os.environ.get('MPESA_PASSKEY')
-    
-    # Create the base64 encoded password
-    password_str = shortcode + passkey + timestamp
-    password_bytes = password_str.encode('ascii')
-    password = base64.b64encode(password_bytes).decode('utf-8')
+    shortcode, password = _stk_password(timestamp)
 
     payload = {
         "BusinessShortCode": shortcode,
@@ -58,9 +112,50 @@ def initiate_stk_push(phone_number, amount, order_id):
     }
 
     try:
-        response = requests.post(api_url, json=payload, headers=headers)
+        response = _post_with_token(api_url, payload, access_token)
+        if response is None:
+            return None
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         print(f"Error initiating STK push: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def query_stk_status(checkout_request_id):
+    """
+    Asks Daraja for the outcome of an STK push (the STK Push Query API).
+
+    Returns the response body, whose ResultCode is "0" for a completed payment
+    and another code for a failed or cancelled one. While the push is still in
+    progress Daraja answers with an error body instead (an errorCode, no
+    ResultCode), which is returned as well. Returns None if Daraja could not be reached.
+    """
+    access_token = get_access_token()
+    if not access_token:
+        return None
+
+    api_url = f"{_base_url()}/mpesa/stkpushquery/v1/query"
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    shortcode, password = _stk_password(timestamp)
+    payload = {
+        "BusinessShortCode": shortcode,
+        "Password": password,
+        "Timestamp": timestamp,
+        "CheckoutRequestID": checkout_request_id
+    }
+
+    try:
+        response = _post_with_token(api_url, payload, access_token)
+        if response is None:
+            return None
+        # "The transaction is being processed" and similar come back as 400/500 with a JSON body
+        if response.ok or response.status_code in (400, 500):
+            try:
+                return response.json()
+            except ValueError:
+                pass
+        response.raise_for_status()
+        return None
+    except requests.exceptions.RequestException as e:
+        print(f"Error querying STK push status: {e}")
+        return None
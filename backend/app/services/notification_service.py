@@ -0,0 +1,134 @@
+# app/services/notification_service.py
+import threading
+from datetime import datetime, timezone
+
+from flask import current_app
+
+from app import db
+from app.models.outbound_message import OutboundMessage
+from app.services import twilio_service
+from app.services.batch_worker import LeasedJobWorker
+
+
+class TwilioSender:
+    """Delivers messages through the real Twilio API."""
+
+    def send(self, to_number, body):
+        return twilio_service.deliver_sms(to_number, body)
+
+
+class FakeSender:
+    """
+    Records messages in memory instead of sending them, for tests and offline development.
+
+    `fail_times` makes the first N sends raise, to exercise the retry path.
+    """
+
+    def __init__(self, fail_times=0):
+        self.sent = []
+        self.fail_times = fail_times
+        self._lock = threading.Lock()
+
+    def send(self, to_number, body):
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise RuntimeError("Simulated SMS provider failure")
+            self.sent.append((to_number, body))
+            return f"FAKE{len(self.sent):06d}"
+
+
+SENDERS = {
+    'twilio': TwilioSender,
+    'fake': FakeSender,
+}
+
+
+def get_sender(app=None):
+    """Returns the app's configured SMS sender, creating it on first use."""
+    app = app or current_app._get_current_object()
+    sender = app.extensions.get('sms_sender')
+    if sender is None:
+        sender = SENDERS[app.config['SMS_SENDER']]()
+        app.extensions['sms_sender'] = sender
+    return sender
+
+
+def enqueue_sms(to_number, body, max_attempts=None):
+    """
+    Adds an SMS to the outbox in the current session.
+
+    Nothing is sent here: the message is committed together with the caller's
+    transaction and delivered later by the notification worker, so requests never
+    wait on the SMS provider and a rolled-back request never notifies anyone.
+    """
+    message = OutboundMessage(
+        to_number=to_number,
+        body=body,
+        max_attempts=max_attempts or current_app.config['SMS_MAX_ATTEMPTS']
+    )
+    db.session.add(message)
+    return message
+
+
+class NotificationWorker(LeasedJobWorker):
+    """
+    Drains the outbound SMS outbox.
+
+    Each batch is claimed in a short transaction (SELECT ... FOR UPDATE SKIP
+    LOCKED on PostgreSQL, so several workers can run side by side), marked as
+    Sending with a lease, and then sent concurrently from a thread pool. Failed
+    sends are retried with exponential backoff until max_attempts is reached.
+    A message whose worker died mid-send is picked up again once its lease
+    expires, unless that was its last attempt.
+    """
+    name = 'notification'
+    model = OutboundMessage
+    busy_status = 'Sending'
+
+    def __init__(self, app, sender=None, batch_size=None, max_workers=None, poll_interval=None):
+        super().__init__(
+            app,
+            batch_size=batch_size or app.config['SMS_WORKER_BATCH_SIZE'],
+            max_workers=max_workers or app.config['SMS_WORKER_THREADS'],
+            poll_interval=poll_interval or app.config['SMS_WORKER_POLL_INTERVAL'],
+            lease_seconds=app.config['SMS_SEND_LEASE_SECONDS'],
+            retry_base_seconds=app.config['SMS_RETRY_BASE_SECONDS']
+        )
+        self.sender = sender or get_sender(app)
+
+    def _claim_batch(self):
+        now = datetime.now(timezone.utc)
+        self._fail_exhausted_leases(now)
+        batch = [(message.id, message.to_number, message.body) for message in self._claim_jobs(now)]
+        db.session.commit()
+        return batch
+
+    def _process(self, job):
+        message_id, to_number, body = job
+        try:
+            return message_id, self.sender.send(to_number, body), None
+        except Exception as e:
+            return message_id, None, f"{type(e).__name__}: {e}"
+
+    def _record_results(self, results):
+        now = datetime.now(timezone.utc)
+        messages = {
+            message.id: message
+            for message in OutboundMessage.query.filter(OutboundMessage.id.in_([r[0] for r in results]))
+        }
+        for message_id, provider_message_id, error in results:
+            message = messages[message_id]
+            if error is None:
+                message.status = 'Sent'
+                message.sent_at = now
+                message.provider_message_id = provider_message_id
+                message.last_error = None
+            else:
+                self._retry_or_fail(message, now, error)
+        db.session.commit()
+
+
+def drain_outbox(app=None, max_batches=100):
+    """Runs the worker until the outbox has nothing due. Handy for tests and cron jobs."""
+    return NotificationWorker(app or current_app._get_current_object()).drain(max_batches)
@@ -0,0 +1,134 @@
+# app/services/password_hasher.py
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from flask import current_app, jsonify
+
+# bcrypt only looks at the first 72 bytes; bcrypt>=5 raises instead of truncating silently.
+MAX_PASSWORD_BYTES = 72
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full; the request is answered with 503 instead of piling up."""
+
+
+def _password_bytes(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password, password_hash):
+    try:
+        return bcrypt.checkpw(password, password_hash.encode('utf-8'))
+    except ValueError:  # not a bcrypt hash
+        return False
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a bounded pool of worker processes.
+
+    bcrypt is deliberately slow CPU work. Done on the request thread, a burst of
+    logins occupies every web worker; here it runs in `workers` separate
+    processes, and at most `workers + max_queue` hashes may be in flight. Callers
+    beyond that wait up to `queue_timeout` seconds for a slot and then get
+    PasswordHasherBusy. With workers=0 hashing runs inline (tests, tiny hosts).
+    """
+
+    def __init__(self, rounds, workers, max_queue, queue_timeout):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + max_queue)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn, not fork: the web process has threads and open database connections
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Forgets a broken pool, so the next caller starts a new one. A no-op if another thread already did."""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise PasswordHasherBusy()
+        try:
+            if not self.workers:
+                return fn(*args)
+            pool = self._get_pool()
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A worker process died (OOM killer, say); retry once on a fresh pool
+                self._discard_pool(pool)
+                return self._get_pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, _password_bytes(password), self.rounds)
+
+    def check(self, password, password_hash):
+        if not password or not password_hash:
+            return False
+        return self._run(_check, _password_bytes(password), password_hash)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a different work factor than the configured one."""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+    def warm_up(self):
+        """Starts the worker processes ahead of the first login."""
+        if self.workers:
+            list(self._get_pool().map(_hash, [b'warm-up'] * self.workers, [4] * self.workers))
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+
+def get_password_hasher(app=None):
+    """Returns the app's shared PasswordHasher, configured by the BCRYPT_* and PASSWORD_HASH_* settings."""
+    app = app or current_app._get_current_object()
+    hasher = app.extensions.get('password_hasher')
+    if hasher is None:
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        hasher = PasswordHasher(
+            rounds=app.config['BCRYPT_LOG_ROUNDS'],
+            workers=(os.cpu_count() or 1) if workers is None else workers,
+            max_queue=app.config['PASSWORD_HASH_MAX_QUEUE'],
+            queue_timeout=app.config['PASSWORD_HASH_QUEUE_TIMEOUT']
+        )
+        app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+def init_password_hasher(app):
+    @app.errorhandler(PasswordHasherBusy)
+    def hasher_busy(error):
+        response = jsonify(message="The server is busy. Please try again in a moment.")
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
@@ -0,0 +1,122 @@
+# app/services/payment_callback_service.py
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.order import Order
+from app.models.processed_callback import ProcessedCallback
+from app.models.transaction import Transaction
+
+# Outcomes of apply_stk_callback()
+CALLBACK_APPLIED = 'applied'
+CALLBACK_DUPLICATE = 'duplicate'
+CALLBACK_UNKNOWN = 'unknown'
+
+# Order states a payment result may still move; anything else (Confirmed, Delivered, ...) is final here.
+PAYABLE_ORDER_STATUSES = ('Pending', 'Pending Payment')
+
+
+class InvalidCallback(ValueError):
+    """Raised when an STK callback payload is missing the fields we need."""
+
+
+def parse_stk_callback(data):
+    """Returns (checkout_request_id, result_code, mpesa_receipt_number) from a Daraja STK callback body."""
+    try:
+        callback_data = data["Body"]["stkCallback"]
+        checkout_request_id = callback_data["CheckoutRequestID"]
+        result_code = int(callback_data["ResultCode"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidCallback("Invalid callback data") from e
+    receipt_number = None
+    if result_code == 0:
+        items = (callback_data.get("CallbackMetadata") or {}).get("Item") or []
+        metadata = {item.get("Name"): item.get("Value") for item in items}
+        receipt_number = metadata.get("MpesaReceiptNumber")
+    return checkout_request_id, result_code, receipt_number
+
+
+def is_processed_callback(checkout_request_id, receipt_number=None):
+    """True if the processed_callbacks ledger already holds this CheckoutRequestID or receipt."""
+    key = ProcessedCallback.checkout_request_id == checkout_request_id
+    if receipt_number:
+        key = db.or_(key, ProcessedCallback.mpesa_receipt_number == receipt_number)
+    return db.session.scalar(db.select(ProcessedCallback.id).where(key).limit(1)) is not None
+
+
+def _record_callback(checkout_request_id, result_code, receipt_number, transaction_id):
+    db.session.add(ProcessedCallback(
+        checkout_request_id=checkout_request_id,
+        mpesa_receipt_number=receipt_number,
+        result_code=result_code,
+        transaction_id=transaction_id
+    ))
+    db.session.commit()
+
+
+def apply_stk_callback(checkout_request_id, result_code, receipt_number=None):
+    """
+    Applies one STK callback at most once and commits. Returns CALLBACK_APPLIED, _DUPLICATE or _UNKNOWN.
+
+    Safaricom retries callbacks it thinks were not delivered, often several at
+    once during payment spikes. A retry is answered from the processed_callbacks
+    ledger with a single indexed read and no write. A first delivery moves the
+    transaction with one `UPDATE ... WHERE status = 'Pending' RETURNING`, so
+    of two concurrent deliveries only one matches the row and the other waits
+    for its row lock, then finds nothing to do. The order is moved the same way,
+    only while it is still payable, and the callback is recorded in the ledger
+    in the same transaction. A success callback for a payment the reconciliation
+    worker already settled only fills in its missing M-Pesa receipt.
+    """
+    if is_processed_callback(checkout_request_id, receipt_number):
+        return CALLBACK_DUPLICATE
+
+    success = result_code == 0
+    changes = {'status': 'Success' if success else 'Failed'}
+    if success:
+        changes['mpesa_receipt_number'] = receipt_number
+    try:
+        moved = db.session.execute(
+            db.update(Transaction)
+            .where(Transaction.checkout_request_id == checkout_request_id, Transaction.status == 'Pending')
+            .values(**changes)
+            .returning(Transaction.id, Transaction.order_id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if moved is None and success and receipt_number:
+            # Settled by the reconciliation worker, whose STK query carries no receipt: record this one
+            receipted = db.session.execute(
+                db.update(Transaction)
+                .where(Transaction.checkout_request_id == checkout_request_id, Transaction.status == 'Success',
+                       Transaction.mpesa_receipt_number.is_(None))
+                .values(mpesa_receipt_number=receipt_number)
+                .returning(Transaction.id)
+                .execution_options(synchronize_session=False)
+            ).first()
+            if receipted is not None:
+                _record_callback(checkout_request_id, result_code, receipt_number, receipted.id)
+                return CALLBACK_APPLIED
+    except IntegrityError:
+        # The receipt number is already recorded against another transaction
+        db.session.rollback()
+        return CALLBACK_DUPLICATE
+
+    if moved is None:
+        exists = db.session.scalar(
+            db.select(Transaction.id).where(Transaction.checkout_request_id == checkout_request_id)
+        )
+        db.session.rollback()
+        return CALLBACK_DUPLICATE if exists is not None else CALLBACK_UNKNOWN
+
+    if success:
+        order_filter = Order.status.in_(PAYABLE_ORDER_STATUSES)
+    else:
+        # A failed attempt must not undo a payment that went through on another transaction
+        order_filter = Order.status == 'Pending Payment'
+    db.session.execute(
+        db.update(Order)
+        .where(Order.id == moved.order_id, order_filter)
+        .values(status='Confirmed' if success else 'Pending')
+        .execution_options(synchronize_session=False)
+    )
+    _record_callback(checkout_request_id, result_code, receipt_number, moved.id)
+    return CALLBACK_APPLIED
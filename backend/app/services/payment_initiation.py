@@ -0,0 +1,134 @@
+# app/services/payment_initiation.py
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from app import db
+from app.models.order import Order
+from app.models.transaction import Transaction
+from app.services import mpesa_service
+
+# How often a request waiting on another request's in-flight STK push checks for its transaction.
+LOCK_POLL_SECONDS = 0.2
+
+
+class PaymentInitiationError(Exception):
+    """Raised when an STK push cannot be started; reported to the buyer with status_code."""
+    status_code = 500
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+
+class PaymentInProgress(PaymentInitiationError):
+    status_code = 409
+
+
+class PaymentAttemptFailed(PaymentInitiationError):
+    """Raised when the Idempotency-Key belongs to an attempt that failed; the buyer must start a new one."""
+    status_code = 409
+
+    def __init__(self, transaction):
+        super().__init__(
+            "This payment attempt failed. Use a new Idempotency-Key to try again.",
+            details={"transaction_id": transaction.id, "checkout_request_id": transaction.checkout_request_id,
+                     "status": transaction.status}
+        )
+
+
+def _existing_transaction(order_id, idempotency_key):
+    """
+    The transaction a repeated initiation should get back: the one made with this key, else any still Pending.
+    Raises PaymentAttemptFailed if the key's transaction failed.
+    """
+    if idempotency_key:
+        transaction = Transaction.query.filter_by(order_id=order_id, idempotency_key=idempotency_key).first()
+        if transaction is not None:
+            if transaction.status == 'Failed':
+                raise PaymentAttemptFailed(transaction)
+            return transaction
+    return (
+        Transaction.query.filter_by(order_id=order_id, status='Pending')
+        .order_by(Transaction.id.desc()).first()
+    )
+
+
+def _update_order_lock(order_id, condition, expires_at):
+    # Keep updated_at as is: the lock is not a change clients need to refetch the order for
+    changed = db.session.execute(
+        db.update(Order).where(Order.id == order_id, condition)
+        .values(payment_lock_expires_at=expires_at, updated_at=Order.updated_at)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return changed == 1
+
+
+def _acquire_order_lock(order_id, expires_at):
+    free = db.or_(Order.payment_lock_expires_at.is_(None), Order.payment_lock_expires_at < datetime.now(timezone.utc))
+    return _update_order_lock(order_id, free, expires_at)
+
+
+def _release_order_lock(order_id, expires_at):
+    # Only our own lock: once it has expired, another request may hold a newer one
+    return _update_order_lock(order_id, Order.payment_lock_expires_at == expires_at, None)
+
+
+def initiate_order_payment(order, phone_number, idempotency_key=None):
+    """
+    Starts an STK push for `order` unless one is already under way. Returns (transaction, created).
+
+    Two taps on "Pay" must not charge the buyer twice. A pending transaction for
+    the order (or the one created with the same Idempotency-Key) is returned as
+    is, without calling Daraja; a key whose attempt failed raises
+    PaymentAttemptFailed, since the buyer has no prompt left to answer. Otherwise the order's payment lock is taken
+    with a compare-and-set UPDATE, which is atomic on every database, and held
+    only for the STK push; it expires after PAYMENT_INITIATION_LOCK_SECONDS in
+    case the holder dies. A concurrent request that finds the lock taken waits
+    for the holder's transaction and returns that instead, or raises
+    PaymentInProgress if none appears in time.
+    """
+    lock_seconds = current_app.config['PAYMENT_INITIATION_LOCK_SECONDS']
+    deadline = time.monotonic() + lock_seconds
+    while True:
+        existing = _existing_transaction(order.id, idempotency_key)
+        if existing is not None:
+            return existing, False
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=lock_seconds)
+        if _acquire_order_lock(order.id, expires_at):
+            break
+        if time.monotonic() >= deadline:
+            raise PaymentInProgress("A payment for this order is already being initiated. Please check your phone.")
+        time.sleep(LOCK_POLL_SECONDS)
+
+    try:
+        # The previous holder may have finished between our check and taking the lock
+        existing = _existing_transaction(order.id, idempotency_key)
+        if existing is not None:
+            return existing, False
+
+        response = mpesa_service.initiate_stk_push(
+            phone_number=phone_number,
+            amount=order.total_price,
+            order_id=order.id
+        )
+        if not response or response.get("ResponseCode") != "0":
+            raise PaymentInitiationError("Failed to initiate payment.", details=response)
+
+        transaction = Transaction(
+            order_id=order.id,
+            amount=order.total_price,
+            phone_number=phone_number,
+            checkout_request_id=response['CheckoutRequestID'],
+            idempotency_key=idempotency_key
+        )
+        order.status = "Pending Payment"
+        db.session.add(transaction)
+        db.session.commit()
+        return transaction, True
+    finally:
+        db.session.rollback()
+        _release_order_lock(order.id, expires_at)
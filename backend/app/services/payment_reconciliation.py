@@ -0,0 +1,194 @@
+# app/services/payment_reconciliation.py
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from app import db
+from app.models.order import Order
+from app.models.transaction import Transaction
+from app.services import mpesa_service
+from app.services.batch_worker import BatchWorker
+from app.services.payment_callback_service import PAYABLE_ORDER_STATUSES
+
+# Outcomes of an STK Push Query
+STK_PAID = 'paid'
+STK_FAILED = 'failed'
+STK_IN_PROGRESS = 'in_progress'
+STK_UNREACHABLE = 'unreachable'
+
+
+def classify_stk_query(body):
+    """Maps a query_stk_status() response to STK_PAID, STK_FAILED, STK_IN_PROGRESS or STK_UNREACHABLE."""
+    if body is None:
+        return STK_UNREACHABLE
+    result_code = body.get('ResultCode')
+    if result_code is not None:
+        try:
+            return STK_PAID if int(result_code) == 0 else STK_FAILED
+        except (TypeError, ValueError):
+            return STK_UNREACHABLE
+    if body.get('errorCode'):
+        # e.g. 500.001.1001 "The transaction is being processed"
+        return STK_IN_PROGRESS
+    return STK_UNREACHABLE
+
+
+class ReconciliationStats:
+    """Running totals of a ReconciliationWorker: how much it checks per second and how far behind it is."""
+
+    def __init__(self):
+        self.checked = 0
+        self.outcomes = {STK_PAID: 0, STK_FAILED: 0, STK_IN_PROGRESS: 0, STK_UNREACHABLE: 0}
+        self.expired = 0
+        self.busy_seconds = 0.0
+        self.lag_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_batch(self, outcomes, expired, seconds, lag_seconds):
+        with self._lock:
+            self.checked += len(outcomes)
+            for outcome in outcomes:
+                self.outcomes[outcome] += 1
+            self.expired += expired
+            self.busy_seconds += seconds
+            self.lag_seconds = lag_seconds
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "checked": self.checked,
+                **self.outcomes,
+                "expired": self.expired,
+                "checks_per_second": round(self.checked / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+                # Age of the oldest transaction still Pending, callback or not
+                "lag_seconds": round(self.lag_seconds, 1),
+            }
+
+
+class ReconciliationWorker(BatchWorker):
+    """
+    Settles M-Pesa payments whose callback never arrived.
+
+    Each batch picks transactions still Pending PAYMENT_RECONCILE_AFTER_SECONDS
+    after they were created (oldest first, via the (status, created_at) index)
+    that were not checked in the last PAYMENT_RECONCILE_INTERVAL_SECONDS, and
+    stamps them as checked in a short transaction (FOR UPDATE SKIP LOCKED on
+    PostgreSQL, so several workers can run side by side). Their status is then
+    fetched from the Daraja STK Push Query API from a bounded thread pool, and
+    all outcomes are applied with a handful of bulk UPDATEs guarded by
+    `status = 'Pending'`, so a callback landing meanwhile is never overwritten.
+    Pushes still unresolved after PAYMENT_RECONCILE_EXPIRE_SECONDS are failed
+    and their orders reopened.
+    """
+    name = 'reconciliation'
+
+    def __init__(self, app, query=None, batch_size=None, max_workers=None, poll_interval=None):
+        super().__init__(
+            app,
+            batch_size=batch_size or app.config['PAYMENT_RECONCILE_BATCH_SIZE'],
+            max_workers=max_workers or app.config['PAYMENT_RECONCILE_THREADS'],
+            poll_interval=poll_interval or app.config['PAYMENT_RECONCILE_POLL_INTERVAL']
+        )
+        self.query = query or mpesa_service.query_stk_status
+        self.stale_after = timedelta(seconds=app.config['PAYMENT_RECONCILE_AFTER_SECONDS'])
+        self.recheck_interval = timedelta(seconds=app.config['PAYMENT_RECONCILE_INTERVAL_SECONDS'])
+        self.expire_after = timedelta(seconds=app.config['PAYMENT_RECONCILE_EXPIRE_SECONDS'])
+        self.stats = ReconciliationStats()
+
+    def _claim_batch(self, now):
+        batch = db.session.execute(
+            db.select(Transaction.id, Transaction.checkout_request_id)
+            .where(
+                Transaction.status == 'Pending',
+                Transaction.created_at <= now - self.stale_after,
+                db.or_(Transaction.last_checked_at.is_(None), Transaction.last_checked_at <= now - self.recheck_interval)
+            )
+            .order_by(Transaction.created_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if batch:
+            db.session.execute(
+                db.update(Transaction)
+                .where(Transaction.id.in_([row.id for row in batch]))
+                .values(last_checked_at=now)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        return batch
+
+    def _check(self, row):
+        try:
+            return row.id, classify_stk_query(self.query(row.checkout_request_id))
+        except Exception as e:
+            self.app.logger.warning(f"STK query for {row.checkout_request_id} failed: {e}")
+            return row.id, STK_UNREACHABLE
+
+    def _settle(self, transaction_ids, transaction_status, order_status, order_filter, extra_filter=None):
+        """Moves still-Pending transactions to transaction_status and their orders to order_status; returns the count."""
+        if not transaction_ids:
+            return 0
+        moved = db.session.execute(
+            db.update(Transaction)
+            .where(Transaction.id.in_(transaction_ids), Transaction.status == 'Pending',
+                   *([extra_filter] if extra_filter is not None else []))
+            .values(status=transaction_status)
+            .returning(Transaction.order_id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        if moved:
+            db.session.execute(
+                db.update(Order)
+                .where(Order.id.in_(moved), order_filter)
+                .values(status=order_status)
+                .execution_options(synchronize_session=False)
+            )
+        return len(moved)
+
+    def _apply_outcomes(self, results, now):
+        by_outcome = {}
+        for transaction_id, outcome in results:
+            by_outcome.setdefault(outcome, []).append(transaction_id)
+        self._settle(by_outcome.get(STK_PAID), 'Success', 'Confirmed', Order.status.in_(PAYABLE_ORDER_STATUSES))
+        # A failed push must not undo a payment that went through on another transaction
+        reopen = Order.status == 'Pending Payment'
+        self._settle(by_outcome.get(STK_FAILED), 'Failed', 'Pending', reopen)
+        unresolved = by_outcome.get(STK_IN_PROGRESS, []) + by_outcome.get(STK_UNREACHABLE, [])
+        expired = self._settle(unresolved, 'Failed', 'Pending', reopen, Transaction.created_at <= now - self.expire_after)
+        db.session.commit()
+        return expired
+
+    def _lag_seconds(self, now):
+        oldest = db.session.scalar(
+            db.select(Transaction.created_at).where(Transaction.status == 'Pending')
+            .order_by(Transaction.created_at).limit(1)
+        )
+        if oldest is None:
+            return 0.0
+        if oldest.tzinfo is None:
+            oldest = oldest.replace(tzinfo=timezone.utc)
+        return max((now - oldest).total_seconds(), 0.0)
+
+    def run_once(self):
+        """Claims, queries and settles one batch. Returns the number of transactions checked."""
+        with self.app.app_context():
+            started = time.perf_counter()
+            now = datetime.now(timezone.utc)
+            batch = self._claim_batch(now)
+            if not batch:
+                return 0
+            results = list(self._pool.map(self._check, batch))
+            expired = self._apply_outcomes(results, now)
+            self.stats.record_batch(
+                [outcome for _, outcome in results], expired, time.perf_counter() - started, self._lag_seconds(now)
+            )
+            return len(batch)
+
+
+def reconcile_payments(app=None, max_batches=100):
+    """Checks every stale pending transaction once and returns the worker's stats. Handy for tests and cron jobs."""
+    worker = ReconciliationWorker(app or current_app._get_current_object())
+    worker.drain(max_batches)
+    return worker.stats.as_dict()
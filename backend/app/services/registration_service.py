@@ -0,0 +1,56 @@
+# app/services/registration_service.py
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.user import User
+
+# Unique columns on users, checked in this order when a driver message names several
+UNIQUE_FIELDS = ('username', 'email', 'phone_number')
+FIELD_LABELS = {'username': "Username", 'email': "Email", 'phone_number': "Phone number"}
+
+
+class RegistrationConflict(Exception):
+    """Raised when a new account collides with an existing username, email or phone number."""
+    status_code = 409
+
+    def __init__(self, field):
+        self.field = field
+        self.message = f"{FIELD_LABELS[field]} already exists"
+        super().__init__(self.message)
+
+
+def _conflicting_field(error):
+    """Maps a unique-violation IntegrityError on users to the column it names, or None."""
+    diag = getattr(error.orig, 'diag', None)
+    # PostgreSQL reports the index name (ix_users_email); SQLite the column (users.email)
+    text = getattr(diag, 'constraint_name', None) or str(error.orig)
+    for field in UNIQUE_FIELDS:
+        if f"ix_users_{field}" in text or f"users_{field}_key" in text or f"users.{field}" in text:
+            return field
+    return None
+
+
+def register_user(username, email, password, role, phone_number=None, is_approved=False):
+    """
+    Creates and commits a user, relying on the unique indexes to detect duplicates.
+
+    Checking for an existing username/email first costs a query per column and
+    still lets two concurrent sign-ups pass the checks and collide on commit (a
+    500). Instead the password is hashed up front, the row is inserted in one
+    statement, and a unique violation is rolled back and raised as
+    RegistrationConflict naming the offending field.
+    """
+    user = User(username=username, email=email, role=role, phone_number=phone_number, is_approved=is_approved)
+    # Hash before touching the session so the transaction stays short
+    user.set_password(password)
+
+    db.session.add(user)
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        field = _conflicting_field(e)
+        if field is None:
+            raise
+        raise RegistrationConflict(field) from e
+    return user
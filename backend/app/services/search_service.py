@@ -0,0 +1,174 @@
+# app/services/search_service.py
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from app import db
+from app.models.produce import Produce, produce_search_vector
+
+_TOKEN_RE = re.compile(r'[^\W_]+')
+
+# Mirrors the default ts_rank weights for the A/B/C labels used by produce_search_vector.
+FIELD_WEIGHTS = (('name', 1.0), ('location', 0.4), ('description', 0.2))
+PREFIX_FACTOR = 0.8
+
+
+def tokenize(text):
+    """Lower-cases and splits text into alphanumeric tokens, like the 'simple' text search config."""
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+class ProduceSearchIndex:
+    """
+    In-process inverted index over produce name/location/description.
+
+    Only meant for databases without full-text support (SQLite in development
+    and tests). It matches like the PostgreSQL path: every query term must match
+    a word exactly or as a prefix.
+    """
+
+    def __init__(self):
+        self.signature = None
+        self.latest_update = None
+        self._postings = {}
+        self._vocabulary = []
+        self._row_tokens = {}
+
+    def _remove_row(self, row_id):
+        for token in self._row_tokens.pop(row_id, ()):
+            postings = self._postings[token]
+            del postings[row_id]
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def _add_row(self, row_id, name, description, location):
+        texts = {'name': name, 'location': location, 'description': description}
+        weights = {}
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(texts[field]):
+                weights[token] = max(weights.get(token, 0.0), weight)
+        for token, weight in weights.items():
+            if token not in self._postings:
+                self._postings[token] = {}
+                insort(self._vocabulary, token)
+            self._postings[token][row_id] = weight
+        self._row_tokens[row_id] = tuple(weights)
+
+    def update(self, rows, signature, live_ids=None):
+        """
+        Indexes `rows` (id, name, description, location), replacing earlier versions of the same ids.
+
+        With `live_ids`, rows not among them are dropped as deleted.
+        """
+        if live_ids is not None:
+            for row_id in self._row_tokens.keys() - set(live_ids):
+                self._remove_row(row_id)
+        for row_id, name, description, location in rows:
+            self._remove_row(row_id)
+            self._add_row(row_id, name, description, location)
+        self.signature = signature
+        self.latest_update = signature[1]
+
+    def __len__(self):
+        return len(self._row_tokens)
+
+    def __contains__(self, row_id):
+        return row_id in self._row_tokens
+
+    def _expand(self, term):
+        """Returns {index token: confidence} for every token a query term matches."""
+        matches = {}
+        start = bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            matches[token] = 1.0 if token == term else PREFIX_FACTOR
+        return matches
+
+    def search(self, text):
+        """Returns {produce_id: score} for rows matching every term in `text`."""
+        scores = None
+        for term in tokenize(text):
+            term_scores = defaultdict(float)
+            for token, factor in self._expand(term).items():
+                for row_id, weight in self._postings[token].items():
+                    term_scores[row_id] = max(term_scores[row_id], weight * factor)
+            if scores is None:
+                scores = dict(term_scores)
+            else:
+                scores = {row_id: score + term_scores[row_id] for row_id, score in scores.items() if row_id in term_scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+
+_fallback_indexes = {}
+_fallback_lock = threading.Lock()
+
+
+def _fallback_index():
+    """
+    Returns the in-process index for the current database, brought up to date with it.
+
+    The (row count, latest updated_at) signature is one cheap aggregate query and
+    changes on every insert, update or delete, including those made by other
+    worker processes, so the index never serves results from before a write.
+    Only rows updated since the last refresh are re-indexed; the full id list is
+    read only when the count shows that rows were deleted.
+    """
+    signature = tuple(db.session.query(db.func.count(Produce.id), db.func.max(Produce.updated_at)).one())
+    with _fallback_lock:
+        index = _fallback_indexes.setdefault(str(db.engine.url), ProduceSearchIndex())
+        if index.signature == signature:
+            return index
+        columns = (Produce.id, Produce.name, Produce.description, Produce.location)
+        if index.latest_update is None:
+            index.update(db.session.query(*columns).all(), signature)
+            return index
+        # >= rather than >: another row may have been written within the same timestamp
+        changed = db.session.query(*columns).filter(Produce.updated_at >= index.latest_update).all()
+        new_rows = sum(1 for row in changed if row.id not in index)
+        live_ids = None
+        if signature[0] < len(index) + new_rows:
+            live_ids = db.session.scalars(db.select(Produce.id)).all()
+        index.update(changed, signature, live_ids)
+    return index
+
+
+def _prefix_tsquery(text):
+    """Builds a to_tsquery string where every term must match, each as a prefix."""
+    tokens = tokenize(text)
+    if not tokens:
+        return None
+    return ' & '.join(f"{token}:*" for token in tokens)
+
+
+def search_produce(query, text, limit=None):
+    """
+    Applies a ranked full-text search for `text` on top of a filtered Produce query.
+
+    On PostgreSQL this is a tsvector match served by the ix_produce_search_vector
+    GIN index and ordered by ts_rank. Other databases fall back to the in-process
+    ProduceSearchIndex. Ties are broken newest first in both cases.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        tsquery_text = _prefix_tsquery(text)
+        if tsquery_text is None:
+            return []
+        tsquery = db.func.to_tsquery(db.literal_column("'simple'"), tsquery_text)
+        vector = produce_search_vector(Produce.name, Produce.description, Produce.location)
+        ranked = query.filter(vector.op('@@')(tsquery)).order_by(
+            db.func.ts_rank(vector, tsquery).desc(), Produce.created_at.desc(), Produce.id.desc()
+        )
+        if limit:
+            ranked = ranked.limit(limit)
+        return ranked.all()
+
+    scores = _fallback_index().search(text)
+    if not scores:
+        return []
+    matches = query.filter(Produce.id.in_(scores.keys())).all()
+    matches.sort(key=lambda p: (scores[p.id], p.created_at, p.id), reverse=True)
+    return matches[:limit] if limit else matches
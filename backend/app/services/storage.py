@@ -0,0 +1,103 @@
+# app/services/storage.py
+import io
+import os
+import shutil
+import uuid
+
+import cloudinary.api
+import cloudinary.uploader
+from flask import current_app, send_from_directory
+
+
+class LocalStorage:
+    """
+    Keeps images on the local filesystem under IMAGE_STORAGE_DIR, served at IMAGE_BASE_URL.
+
+    Meant for development, tests and single-host deployments; the files are
+    served by the app itself (see init_storage).
+    """
+
+    def __init__(self, root, base_url):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def save(self, key, data, content_type=None):
+        """Stores `data` (bytes) under `key` and returns its public URL."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a reader never sees a half-written image
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return f"{self.base_url}/{key}"
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix):
+        """Deletes every file stored under `prefix` (a key ending in '/')."""
+        shutil.rmtree(self._path(prefix.rstrip('/')), ignore_errors=True)
+
+
+class CloudinaryStorage:
+    """Uploads images to Cloudinary (configured in create_app) and returns their CDN URLs."""
+
+    def __init__(self, folder='fmlp_produce_images'):
+        self.folder = folder
+
+    def _public_id(self, key):
+        return f"{self.folder}/{os.path.splitext(key)[0]}"
+
+    def save(self, key, data, content_type=None):
+        result = cloudinary.uploader.upload(
+            io.BytesIO(data), public_id=self._public_id(key), overwrite=True, resource_type='image'
+        )
+        return result['secure_url']
+
+    def delete(self, key):
+        cloudinary.uploader.destroy(self._public_id(key))
+
+    def delete_prefix(self, prefix):
+        cloudinary.api.delete_resources_by_prefix(f"{self.folder}/{prefix}")
+
+
+STORAGES = {
+    'local': lambda app: LocalStorage(app.config['IMAGE_STORAGE_DIR'], app.config['IMAGE_BASE_URL']),
+    'cloudinary': lambda app: CloudinaryStorage(),
+}
+
+
+def get_storage(app=None):
+    """Returns the app's configured image storage backend, creating it on first use."""
+    app = app or current_app._get_current_object()
+    storage = app.extensions.get('image_storage')
+    if storage is None:
+        backend = app.config['IMAGE_STORAGE']
+        if backend not in STORAGES:
+            raise ValueError(f"Unknown IMAGE_STORAGE: {backend}")
+        storage = STORAGES[backend](app)
+        app.extensions['image_storage'] = storage
+    return storage
+
+
+def init_storage(app):
+    """Defaults IMAGE_SPOOL_DIR to the instance folder and, with local storage, serves the stored files at IMAGE_BASE_URL."""
+    if not app.config.get('IMAGE_SPOOL_DIR'):
+        app.config['IMAGE_SPOOL_DIR'] = os.path.join(app.instance_path, 'image_spool')
+    if app.config['IMAGE_STORAGE'] != 'local':
+        return
+
+    def serve_image(key):
+        return send_from_directory(app.config['IMAGE_STORAGE_DIR'], key, max_age=86400)
+
+    app.add_url_rule(f"{app.config['IMAGE_BASE_URL'].rstrip('/')}/<path:key>", 'serve_image', serve_image)
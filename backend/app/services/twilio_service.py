@@ -1,35 +1,69 @@
 # app/services/twilio_service.py
 import os
+import threading
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
 from twilio.base.exceptions import TwilioRestException
 from twilio.twiml.messaging_response import MessagingResponse
 
-def send_sms(to_number, message_body):
-    """Sends an SMS using Twilio."""
+from app.services import http_client
+
+_twilio_clients = {}
+_twilio_clients_lock = threading.Lock()
+
+def get_twilio_client(account_sid, auth_token):
+    """Returns a Twilio client reused across messages, sending over the shared 'twilio' connection pool."""
+    key = (account_sid, auth_token)
+    with _twilio_clients_lock:
+        client = _twilio_clients.get(key)
+        if client is None:
+            shared = http_client.get_client('twilio')
+            twilio_http = TwilioHttpClient(pool_connections=True)
+            twilio_http.session = shared.session
+            # Set after construction: TwilioHttpClient only validates plain-number timeouts.
+            twilio_http.timeout = shared.timeout
+            client = _twilio_clients[key] = Client(account_sid, auth_token, http_client=twilio_http)
+        return client
+
+def reset_twilio_clients():
+    with _twilio_clients_lock:
+        _twilio_clients.clear()
+
+class SmsNotConfigured(Exception):
+    """Raised when Twilio credentials are missing from the environment."""
+
+def deliver_sms(to_number, message_body):
+    """Sends an SMS using Twilio and returns the message SID. Raises on failure."""
     account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
     auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
     twilio_number = os.environ.get('TWILIO_PHONE_NUMBER')
     if not all([account_sid, auth_token, twilio_number]):
-        print("Twilio credentials not configured. Skipping SMS.")
-        return False
+        raise SmsNotConfigured("Twilio credentials not configured.")
+    client = get_twilio_client(account_sid, auth_token)
+    message = client.messages.create(body=message_body, from_=twilio_number, to=to_number)
+    return message.sid
+
+def send_sms(to_number, message_body):
+    """Sends an SMS using Twilio."""
     try:
-        client = Client(account_sid, auth_token)
-        message = client.messages.create(body=message_body, from_=twilio_number, to=to_number)
-        print(f"SMS sent successfully to {to_number}. SID: {message.sid}")
+        sid = deliver_sms(to_number, message_body)
+        print(f"SMS sent successfully to {to_number}. SID: {sid}")
         return True
+    except SmsNotConfigured:
+        print("Twilio credentials not configured. Skipping SMS.")
+        return False
     except TwilioRestException as e:
         print(f"Error sending SMS to {to_number}: {e}")
         return False
 
-def process_inbound_sms(from_number, message_body):
+def inbound_sms_reply(from_number, message_body):
     """
-    Parses the inbound SMS message and returns the appropriate TwiML response.
+    Carries out the command in an inbound SMS and returns the text to reply with.
     """
     from app.models.user import User
-    from app.models.market_price import MarketPrice
-    from app import db
+    from app.services.market_price_cache import get_price_snapshot
+    from app.services.registration_service import register_user, RegistrationConflict
     
-    response = MessagingResponse()
     parts = message_body.strip().upper().split()
     command = parts[0] if parts else ""
     
@@ -38,45 +72,40 @@ def process_inbound_sms(from_number, message_body):
             info_str = " ".join(parts[2:])
             name, location = [x.strip() for x in info_str.split(',')]
             
-            existing_user = User.query.filter_by(phone_number=from_number).first()
-            if existing_user:
-                response.message(f"Hello {existing_user.username}! You are already registered with FMLP.")
-            else:
-                # --- THIS IS THE FIX ---
-                # Generate a unique, placeholder email from the phone number
-                sanitized_phone = from_number.replace('+', '')
-                placeholder_email = f"{sanitized_phone}@fmlp_offline.com"
-                
-                # Check if this placeholder email somehow already exists
-                if User.query.filter_by(email=placeholder_email).first():
-                    response.message("An error occurred. Please contact support.")
-                    return str(response)
-                # -----------------------
-                
-                password = "password"
-                new_farmer = User(
+            # Placeholder email derived from the phone number; SMS users have no email
+            placeholder_email = f"{from_number.replace('+', '')}@fmlp_offline.com"
+            try:
+                register_user(
                     username=name.title(),
-                    email=placeholder_email, # Use the placeholder email
-                    phone_number=from_number,
+                    email=placeholder_email,
+                    password="password",
                     role='farmer',
+                    phone_number=from_number,
                     is_approved=False
                 )
-                new_farmer.set_password(password)
-                db.session.add(new_farmer)
-                db.session.commit()
-                response.message(f"Welcome, {name.title()}! Your FMLP account has been created and is pending approval. We will notify you once it's active.")
+            except RegistrationConflict as conflict:
+                # Re-sent REGISTER texts are the common case; the database may report any of the indexes
+                existing_user = User.query.filter_by(phone_number=from_number).first()
+                if existing_user:
+                    reply = f"Hello {existing_user.username}! You are already registered with FMLP."
+                elif conflict.field == 'username':
+                    reply = f"Sorry, the name {name.title()} is already taken. Please register with a different name."
+                else:
+                    reply = "An error occurred. Please contact support."
+            else:
+                reply = f"Welcome, {name.title()}! Your FMLP account has been created and is pending approval. We will notify you once it's active."
         except Exception as e:
-            response.message("Sorry, there was an error processing your registration. Please use the format: REGISTER FARMER Your Name, Your Location")
+            reply = "Sorry, there was an error processing your registration. Please use the format: REGISTER FARMER Your Name, Your Location"
             print(f"SMS Registration Error: {e}")
 
     elif command == "PRICE" and len(parts) == 2:
         crop_name = parts[1].capitalize()
-        price_entry = MarketPrice.query.filter_by(crop_name=crop_name).first()
+        price_entry = get_price_snapshot()['by_crop'].get(crop_name)
         if price_entry:
-            msg = f"Current market price for {price_entry.crop_name}: {price_entry.average_price} KES/{price_entry.unit}"
-            response.message(msg)
+            msg = f"Current market price for {price_entry['crop_name']}: {price_entry['average_price']} KES/{price_entry['unit']}"
+            reply = msg
         else:
-            response.message(f"Sorry, we do not have a market price for '{crop_name}'.")
+            reply = f"Sorry, we do not have a market price for '{crop_name}'."
 
     else:
         help_text = (
@@ -84,6 +113,15 @@ def process_inbound_sms(from_number, message_body):
             "- REGISTER FARMER Your Name, Your Location\n"
             "- PRICE [CropName] (e.g., PRICE MAIZE)"
         )
-        response.message(help_text)
+        reply = help_text
         
-    return str(response)
\ No newline at end of file
+    return reply
+
+
+def process_inbound_sms(from_number, message_body):
+    """
+    Parses the inbound SMS message and returns the appropriate TwiML response.
+    """
+    response = MessagingResponse()
+    response.message(inbound_sms_reply(from_number, message_body))
+    return str(response)
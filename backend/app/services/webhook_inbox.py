@@ -0,0 +1,176 @@
+# app/services/webhook_inbox.py
+import json
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import current_app
+
+from app import db
+from app.models.webhook_event import WebhookEvent
+from app.services import twilio_service
+from app.services.batch_worker import LeasedJobWorker
+from app.services.notification_service import enqueue_sms
+from app.services.payment_callback_service import apply_stk_callback, parse_stk_callback, CALLBACK_UNKNOWN
+
+UNFINISHED_STATUSES = ('Pending', 'Processing')
+# Result marker for events released unprocessed because an earlier event with the same key failed
+SKIPPED = object()
+
+
+def record_webhook(source, ordering_key, payload, max_attempts=None):
+    """
+    Appends a raw webhook payload to the inbox and commits, so the caller can acknowledge it.
+
+    This is the only work a webhook request does: one INSERT. The event is
+    processed later by the webhook worker.
+    """
+    event = WebhookEvent(
+        source=source,
+        ordering_key=ordering_key,
+        payload=payload,
+        max_attempts=max_attempts or current_app.config['WEBHOOK_MAX_ATTEMPTS']
+    )
+    db.session.add(event)
+    db.session.commit()
+    return event
+
+
+def _handle_mpesa_callback(payload):
+    outcome = apply_stk_callback(*parse_stk_callback(json.loads(payload)))
+    if outcome == CALLBACK_UNKNOWN:
+        # Usually a callback that overtook the commit of its STK push; retried with backoff
+        raise LookupError("No transaction for this CheckoutRequestID yet")
+
+
+def _handle_inbound_sms(payload):
+    message = json.loads(payload)
+    reply = twilio_service.inbound_sms_reply(message['From'], message['Body'])
+    enqueue_sms(message['From'], reply)
+    db.session.commit()
+
+
+# Handlers run inside an app context, commit their own work and must be safe to run twice.
+WEBHOOK_HANDLERS = {
+    'mpesa': _handle_mpesa_callback,
+    'twilio': _handle_inbound_sms,
+}
+
+
+class WebhookWorker(LeasedJobWorker):
+    """
+    Drains the webhook inbox.
+
+    Events with the same (source, ordering_key) are processed strictly in
+    arrival order: an event is only claimed as the head of its key when no
+    earlier event for that key is unfinished, and whoever holds the head also
+    claims the key's later events. Each key's events then run one after another
+    on one thread while different keys run concurrently in the pool. If an event
+    fails, the rest of its key is released untouched and waits behind it while
+    it is retried with exponential backoff; after max_attempts it is marked
+    Failed and the key moves on, as it does when an event's last attempt never
+    reports back. Claiming uses FOR UPDATE SKIP LOCKED on PostgreSQL, so several
+    workers can run side by side.
+    """
+    name = 'webhook'
+    model = WebhookEvent
+    busy_status = 'Processing'
+
+    def __init__(self, app, batch_size=None, max_workers=None, poll_interval=None):
+        super().__init__(
+            app,
+            batch_size=batch_size or app.config['WEBHOOK_WORKER_BATCH_SIZE'],
+            max_workers=max_workers or app.config['WEBHOOK_WORKER_THREADS'],
+            poll_interval=poll_interval or app.config['WEBHOOK_WORKER_POLL_INTERVAL'],
+            lease_seconds=app.config['WEBHOOK_PROCESS_LEASE_SECONDS'],
+            retry_base_seconds=app.config['WEBHOOK_RETRY_BASE_SECONDS']
+        )
+
+    def _claim_batch(self):
+        now = datetime.now(timezone.utc)
+        # Failing these first unblocks the events queued behind them
+        self._fail_exhausted_leases(now)
+        earlier = db.aliased(WebhookEvent)
+        blocked = db.exists().where(
+            earlier.source == WebhookEvent.source,
+            earlier.ordering_key == WebhookEvent.ordering_key,
+            earlier.id < WebhookEvent.id,
+            earlier.status.in_(UNFINISHED_STATUSES)
+        )
+        heads = db.session.execute(
+            db.select(WebhookEvent)
+            .where(*self._claimable(now), ~blocked)
+            .order_by(WebhookEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not heads:
+            db.session.commit()
+            return []
+        # No other worker can claim these: each is blocked by the head we hold
+        followers = db.session.execute(
+            db.select(WebhookEvent)
+            .where(
+                WebhookEvent.status.in_(UNFINISHED_STATUSES),
+                WebhookEvent.attempts < WebhookEvent.max_attempts,
+                db.tuple_(WebhookEvent.source, WebhookEvent.ordering_key).in_(
+                    {(event.source, event.ordering_key) for event in heads}
+                ),
+                WebhookEvent.id.notin_([event.id for event in heads])
+            )
+            .order_by(WebhookEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+
+        lanes = OrderedDict()
+        for event in sorted((*heads, *followers), key=lambda event: event.id):
+            self._lease(event, now)
+            lanes.setdefault((event.source, event.ordering_key), []).append((event.id, event.source, event.payload))
+        db.session.commit()
+        return list(lanes.values())
+
+    def _mark_failed(self, event, now, error):
+        super()._mark_failed(event, now, error)
+        event.processed_at = now
+
+    def _process_lane(self, lane):
+        results = []
+        with self.app.app_context():
+            for index, (event_id, source, payload) in enumerate(lane):
+                try:
+                    WEBHOOK_HANDLERS[source](payload)
+                except Exception as e:
+                    db.session.rollback()
+                    results.append((event_id, f"{type(e).__name__}: {e}"))
+                    results.extend((later_id, SKIPPED) for later_id, _, _ in lane[index + 1:])
+                    break
+                results.append((event_id, None))
+        return results
+
+    def _process_batch(self, lanes):
+        return [result for lane_results in self._pool.map(self._process_lane, lanes) for result in lane_results]
+
+    def _record_results(self, results):
+        now = datetime.now(timezone.utc)
+        events = {
+            event.id: event
+            for event in WebhookEvent.query.filter(WebhookEvent.id.in_([r[0] for r in results]))
+        }
+        for event_id, error in results:
+            event = events[event_id]
+            if error is None:
+                event.status = 'Done'
+                event.processed_at = now
+                event.last_error = None
+            elif error is SKIPPED:
+                event.status = 'Pending'
+                event.attempts -= 1
+                event.next_attempt_at = now
+            else:
+                self._retry_or_fail(event, now, error)
+        db.session.commit()
+
+
+def drain_webhooks(app=None, max_batches=100):
+    """Runs the worker until the inbox has nothing due. Handy for tests and cron jobs."""
+    return WebhookWorker(app or current_app._get_current_object()).drain(max_batches)
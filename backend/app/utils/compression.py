@@ -0,0 +1,67 @@
+# app/utils/compression.py
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional dependency; only gzip is offered without it
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/html',
+    'text/plain',
+}
+
+
+def _choose_encoding(accept_encodings):
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def _compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def init_compression(app):
+    """
+    Compresses response bodies with brotli or gzip, as negotiated by Accept-Encoding.
+
+    Only buffered responses of a compressible type and at least COMPRESS_MIN_SIZE
+    bytes are touched: small bodies are not worth the CPU, and streamed responses
+    are left alone so they keep flowing to the client.
+    """
+    @app.after_request
+    def compress_response(response):
+        if not app.config['COMPRESS_RESPONSES']:
+            return response
+        if (response.status_code < 200 or response.status_code >= 300 or response.status_code == 204
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        encoding = _choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        response.set_data(_compress(data, encoding, app.config))
+        response.headers['Content-Encoding'] = encoding
+        # A strong ETag promises byte-identical bodies, which no longer holds per encoding
+        etag, is_weak = response.get_etag()
+        if etag and not is_weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,32 @@
+# app/utils/conditional.py
+import hashlib
+
+from flask import request, current_app
+from werkzeug.http import is_resource_modified
+
+
+def conditional_response(validators, build_response, vary=()):
+    """
+    Answers a list endpoint with 304 Not Modified when the client's copy is current.
+
+    `validators` is a tuple of cheap aggregates over the rows the endpoint would
+    return (row counts, max(updated_at), ...), fetched in one query without
+    loading or serializing any rows. `vary` adds anything else the body depends
+    on, such as query parameters or the current user. Only when the validators
+    changed is `build_response()` called to fetch and serialize the rows.
+
+    Only an ETag is sent: it covers the row counts, so deletions are caught,
+    which a Last-Modified timestamp could not do.
+    """
+    fingerprint = repr((tuple(validators), tuple(vary))).encode('utf-8')
+    etag = hashlib.sha1(fingerprint).hexdigest()
+
+    if not is_resource_modified(request.environ, etag=etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.make_response(build_response())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
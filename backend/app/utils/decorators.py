@@ -1,18 +1,33 @@
 # app/utils/decorators.py
 from functools import wraps
-from flask_jwt_extended import get_jwt_identity
+from flask_jwt_extended import get_jwt_identity, get_jwt
 from flask import jsonify
 from app.models.user import User
 from app import db # Import db
 
+def _current_role():
+    """
+    Returns (role, is_approved) for the current token.
+
+    Both values are read from the token's claims, which stale-token revocation
+    keeps honest, so no database read is needed. Tokens issued before the claims
+    existed fall back to loading the user.
+    """
+    claims = get_jwt()
+    if 'role' in claims:
+        return claims['role'], claims.get('is_approved', False)
+    user = db.session.get(User, get_jwt_identity())
+    if user is None:
+        return None, False
+    return user.role, user.is_approved
+
 def farmer_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = db.session.get(User, user_id)
-        if user and user.role == 'farmer' and user.is_approved:
+        role, is_approved = _current_role()
+        if role == 'farmer' and is_approved:
             return fn(*args, **kwargs)
-        elif user and user.role == 'farmer' and not user.is_approved:
+        elif role == 'farmer' and not is_approved:
             return jsonify(message="Your farmer account is pending approval."), 403
         else:
             return jsonify(message="Approved farmers access required"), 403
@@ -21,9 +36,8 @@ def farmer_required(fn):
 def buyer_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = db.session.get(User, user_id)
-        if user and user.role == 'buyer':
+        role, _ = _current_role()
+        if role == 'buyer':
             return fn(*args, **kwargs)
         else:
             return jsonify(message="Buyers access required"), 403
@@ -33,10 +47,9 @@ def buyer_required(fn):
 def admin_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = db.session.get(User, user_id)
-        if user and user.role == 'admin':
+        role, _ = _current_role()
+        if role == 'admin':
             return fn(*args, **kwargs)
         else:
             return jsonify(message="Admin access required"), 403
-    return wrapper
\ No newline at end of file
+    return wrapper
@@ -0,0 +1,206 @@
+# app/utils/idempotency.py
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.idempotency_key import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+# How often a duplicate of a request still in flight checks for its response.
+WAIT_POLL_SECONDS = 0.2
+FORM_MIMETYPES = ('multipart/form-data', 'application/x-www-form-urlencoded')
+
+
+def _request_fingerprint():
+    digest = hashlib.sha256(f"{request.method} {request.full_path}\n".encode('utf-8'))
+    if request.mimetype in FORM_MIMETYPES:
+        # Hash the parsed form, so the body stream is still there for the view
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f"{name}={value}\n".encode('utf-8'))
+        for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(f"{name}:{upload.filename}\n".encode('utf-8'))
+            for chunk in iter(lambda: upload.stream.read(64 * 1024), b''):
+                digest.update(chunk)
+            upload.stream.seek(0)
+    else:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _current_user_id():
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:
+        # Missing or bad credentials are for the view's own @jwt_required to report
+        return None
+    identity = get_jwt_identity()
+    return int(identity) if identity is not None else None
+
+
+def _evict(user_id, now, config):
+    """Drops a batch of expired keys, and the user's oldest finished keys beyond the per-user cap."""
+    expired = (
+        db.select(IdempotencyKey.id).where(IdempotencyKey.expires_at < now)
+        .limit(config['IDEMPOTENCY_PURGE_BATCH_SIZE']).scalar_subquery()
+    )
+    db.session.execute(
+        db.delete(IdempotencyKey).where(IdempotencyKey.id.in_(expired))
+        .execution_options(synchronize_session=False)
+    )
+    newest_evicted = (
+        db.select(IdempotencyKey.id).where(IdempotencyKey.user_id == user_id)
+        .order_by(IdempotencyKey.id.desc()).offset(config['IDEMPOTENCY_MAX_KEYS_PER_USER']).limit(1)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        db.delete(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.status == 'Done',
+               IdempotencyKey.id <= newest_evicted)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _claim(user_id, key, fingerprint):
+    """
+    Takes `key` for this request. Returns (record_id, None) when the view should run,
+    or (None, record) with the stored key's row when another request holds it or it holds a response.
+    """
+    config = current_app.config
+    now = datetime.now(timezone.utc)
+    lease = now + timedelta(seconds=config['IDEMPOTENCY_LOCK_SECONDS'])
+    record = db.session.execute(
+        db.select(
+            IdempotencyKey.id, IdempotencyKey.request_fingerprint, IdempotencyKey.status,
+            IdempotencyKey.response_status, IdempotencyKey.response_content_type, IdempotencyKey.response_body,
+            (IdempotencyKey.expires_at < now).label('expired')
+        )
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    ).first()
+
+    if record is None:
+        _evict(user_id, now, config)
+        new_key = IdempotencyKey(user_id=user_id, key=key, request_fingerprint=fingerprint, expires_at=lease)
+        db.session.add(new_key)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent duplicate inserted it first
+            db.session.rollback()
+            return None, None
+        return new_key.id, None
+
+    if record.expired:
+        # Stale response, or a holder that died mid-request: take the key over, unless someone else just did
+        taken = db.session.execute(
+            db.update(IdempotencyKey)
+            .where(IdempotencyKey.id == record.id, IdempotencyKey.expires_at < now)
+            .values(request_fingerprint=fingerprint, status='Processing', response_status=None,
+                    response_content_type=None, response_body=None, created_at=now, expires_at=lease)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        db.session.commit()
+        return (record.id, None) if taken else (None, None)
+    db.session.rollback()
+    return None, record
+
+
+def _replay(record):
+    response = current_app.response_class(
+        record.response_body, status=record.response_status, content_type=record.response_content_type
+    )
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _begin_idempotent_request():
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if request.method != 'POST' or not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        return jsonify(message=f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters."), 400
+    user_id = _current_user_id()
+    if user_id is None:
+        return None
+
+    fingerprint = _request_fingerprint()
+    deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_SECONDS']
+    while True:
+        record_id, record = _claim(user_id, key, fingerprint)
+        if record_id is not None:
+            g.idempotency_key_id = record_id
+            return None
+        if record is not None:
+            if record.request_fingerprint != fingerprint:
+                return jsonify(message=f"This {IDEMPOTENCY_HEADER} was already used for a different request."), 422
+            if record.status == 'Done':
+                return _replay(record)
+        if time.monotonic() >= deadline:
+            return jsonify(message="A request with this Idempotency-Key is still being processed. Please retry."), 409
+        time.sleep(WAIT_POLL_SECONDS)
+
+
+def _release(record_id):
+    db.session.execute(
+        db.delete(IdempotencyKey).where(IdempotencyKey.id == record_id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def _finish_idempotent_request(response):
+    record_id = g.pop('idempotency_key_id', None)
+    if record_id is None:
+        return response
+    # The view has committed its work; anything left in the session is an aborted transaction
+    db.session.rollback()
+    if response.status_code >= 500 or response.status_code == 409 or response.is_streamed:
+        # Server errors and conflicts are worth retrying, so a retry with the same key runs again
+        _release(record_id)
+        return response
+    ttl = timedelta(seconds=current_app.config['IDEMPOTENCY_KEY_TTL_SECONDS'])
+    db.session.execute(
+        db.update(IdempotencyKey)
+        .where(IdempotencyKey.id == record_id)
+        .values(status='Done', response_status=response.status_code,
+                response_content_type=response.content_type, response_body=response.get_data(as_text=True),
+                expires_at=datetime.now(timezone.utc) + ttl)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return response
+
+
+def _abort_idempotent_request(error):
+    record_id = g.pop('idempotency_key_id', None)
+    if record_id is not None:
+        # The view raised before a response was built; free the key for the client's retry
+        db.session.rollback()
+        _release(record_id)
+
+
+def enable_idempotency_keys(blueprint):
+    """
+    Makes the blueprint's POST endpoints idempotent per user and Idempotency-Key header.
+
+    The first request with a key records it as Processing (a unique (user_id, key)
+    index makes exactly one concurrent duplicate win), runs the view and stores
+    its response for IDEMPOTENCY_KEY_TTL_SECONDS. Retries get that response back,
+    marked with an Idempotent-Replayed header, without running the view again;
+    duplicates that arrive while the first is still in flight wait for it, for
+    up to IDEMPOTENCY_WAIT_SECONDS. Server errors and 409s are not stored, so
+    they can be retried with the same key. Each new key evicts a batch of expired
+    keys and keeps at most IDEMPOTENCY_MAX_KEYS_PER_USER finished ones per user.
+
+    Requests without the header, or without a valid token, pass straight through.
+    """
+    blueprint.before_request(_begin_idempotent_request)
+    blueprint.after_request(_finish_idempotent_request)
+    blueprint.teardown_request(_abort_idempotent_request)
+    return blueprint
@@ -0,0 +1,57 @@
+# app/utils/pagination.py
+import base64
+import json
+from datetime import datetime
+
+from app import db
+
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue."""
+
+
+def encode_cursor(created_at, row_id):
+    """Encodes a (created_at, id) position as an opaque, URL-safe token."""
+    payload = json.dumps({"c": created_at.isoformat(), "i": row_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decodes a token produced by encode_cursor back into (created_at, id)."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(payload['c']), int(payload['i'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Invalid pagination cursor.") from e
+
+
+def parse_limit(raw_limit):
+    """Clamps the requested page size to [1, MAX_PAGE_LIMIT]."""
+    if raw_limit is None:
+        return DEFAULT_PAGE_LIMIT
+    return max(1, min(raw_limit, MAX_PAGE_LIMIT))
+
+
+def keyset_paginate(query, created_at_col, id_col, limit, cursor=None):
+    """
+    Returns one page of `query` ordered newest first, plus the cursor for the next page.
+
+    Rows are ordered by (created_at, id) descending and the page boundary is a
+    row-value comparison on the same pair, so the database seeks straight to the
+    cursor position instead of counting past an OFFSET. Latency therefore stays
+    flat no matter how deep a client pages.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(db.tuple_(created_at_col, id_col) < db.tuple_(created_at, row_id))
+    rows = query.order_by(created_at_col.desc(), id_col.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_at_col.key), getattr(last, id_col.key))
+    return rows, next_cursor
@@ -0,0 +1,84 @@
+# app/utils/token_versions.py
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, jsonify
+
+from app import db
+from app.models.user import User
+
+
+class TokenVersionCache:
+    """
+    Small in-process LRU cache of each user's current token version.
+
+    Tokens carry the version they were issued with. Bumping User.token_version
+    revokes every older token; this process sees the bump immediately, and
+    other worker processes within TOKEN_VERSION_CACHE_TTL seconds.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[0]
+
+    def remember(self, user_id, version, ttl):
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic() + ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_version_cache = TokenVersionCache()
+
+
+def _ttl():
+    return current_app.config['TOKEN_VERSION_CACHE_TTL']
+
+
+def remember_token_version(user):
+    """Records a user's token version after login or after it was bumped."""
+    token_version_cache.remember(user.id, user.token_version, _ttl())
+
+
+def current_token_version(user_id):
+    """Returns the user's token version, reading the database only on a cache miss. None if the user is gone."""
+    version = token_version_cache.get(user_id)
+    if version is None:
+        version = db.session.execute(
+            db.select(User.token_version).where(User.id == user_id)
+        ).scalar_one_or_none()
+        if version is not None:
+            token_version_cache.remember(user_id, version, _ttl())
+    return version
+
+
+def token_claims(user):
+    """Extra JWT claims that let the role decorators authorize without a database read."""
+    return {"role": user.role, "is_approved": user.is_approved, "ver": user.token_version}
+
+
+def is_token_revoked(jwt_header, jwt_payload):
+    """flask-jwt-extended blocklist hook: rejects tokens issued before the user's last version bump."""
+    if 'ver' not in jwt_payload:
+        # Issued before role claims existed; the decorators fall back to a database lookup.
+        return False
+    return current_token_version(int(jwt_payload['sub'])) != jwt_payload['ver']
+
+
+def revoked_token_response(jwt_header, jwt_payload):
+    return jsonify(message="Your session is out of date. Please log in again."), 401
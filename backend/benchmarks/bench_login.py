@@ -0,0 +1,97 @@
+# benchmarks/bench_login.py
+"""
+Measures login throughput with bcrypt at the production cost (12 rounds),
+hashing inline on the request threads vs in the PasswordHasher process pool.
+While the logins run, a probe thread times a cheap authenticated request to
+show how much a login burst slows everything else down.
+
+The tables in TEST_DATABASE_URL are dropped and recreated.
+
+    python -m benchmarks.bench_login [--seconds 10] [--threads 16]
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+
+from app import create_app, db
+from app.models.user import User
+from app.services.password_hasher import PasswordHasher
+
+ROUNDS = 12
+
+
+def run(app, hasher, seconds, threads):
+    app.extensions['password_hasher'] = hasher
+    hasher.warm_up()
+    client = app.test_client()
+    stop = threading.Event()
+    logins, failures, probe_latencies = [], [], []
+
+    def login_loop(index):
+        body = json.dumps({"email": f"bench{index}@bench.local", "password": "benchpassword"})
+        while not stop.is_set():
+            response = client.post('/api/auth/login', data=body, content_type='application/json')
+            (logins if response.status_code == 200 else failures).append(1)
+
+    def probe_loop(token):
+        headers = {'Authorization': f'Bearer {token}'}
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get('/api/market/prices', headers=headers)
+            probe_latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.05)
+
+    token = client.post('/api/auth/login', data=json.dumps({"email": "bench0@bench.local", "password": "benchpassword"}),
+                        content_type='application/json').get_json()['access_token']
+    workers = [threading.Thread(target=login_loop, args=(i,)) for i in range(threads)]
+    workers.append(threading.Thread(target=probe_loop, args=(token,)))
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    return len(logins) / elapsed, len(failures), probe_latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+    cores = os.cpu_count() or 1
+
+    app = create_app('testing')
+    app.config['BCRYPT_LOG_ROUNDS'] = ROUNDS
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        password_hash = PasswordHasher(ROUNDS, 0, 1, None).hash("benchpassword")
+        db.session.add_all([
+            User(username=f"bench{i}", email=f"bench{i}@bench.local", password_hash=password_hash, role='buyer')
+            for i in range(args.threads)
+        ])
+        db.session.commit()
+
+        print(f"{args.threads} concurrent logins for {args.seconds:.0f}s, bcrypt cost {ROUNDS}, {cores} core(s):")
+        for label, hasher in [
+            ("inline (before)", PasswordHasher(ROUNDS, workers=0, max_queue=args.threads, queue_timeout=None)),
+            ("process pool (after)", PasswordHasher(ROUNDS, workers=cores, max_queue=args.threads, queue_timeout=None)),
+        ]:
+            rate, failures, probes = run(app, hasher, args.seconds, args.threads)
+            p95 = statistics.quantiles(probes, n=20)[-1] if len(probes) >= 20 else max(probes)
+            print(f"  {label:<22} {rate:7.1f} logins/s  {rate / cores:7.1f} per core  "
+                  f"failures={failures}  probe p50={statistics.median(probes):6.1f} ms p95={p95:6.1f} ms")
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
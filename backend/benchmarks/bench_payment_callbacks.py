@@ -0,0 +1,106 @@
+# benchmarks/bench_payment_callbacks.py
+"""
+Replays M-Pesa STK callbacks against POST /api/payments/callback: first
+deliveries for 1000 pending transactions, then 10k duplicate deliveries of
+already-processed callbacks spread over several threads, the way Safaricom
+retries during a payment spike. Reports throughput and how many SQL
+statements (and how many writes) each phase issued; duplicates should write
+nothing.
+
+The tables in TEST_DATABASE_URL are dropped and recreated.
+
+    python -m benchmarks.bench_payment_callbacks [--duplicates 10000] [--threads 8]
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models.order import Order
+from app.models.processed_callback import ProcessedCallback
+from app.models.transaction import Transaction
+from app.models.user import User
+
+TRANSACTIONS = 1000
+WRITE_VERBS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def payload(index):
+    return json.dumps({"Body": {"stkCallback": {
+        "ResultCode": 0,
+        "ResultDesc": "The service request is processed successfully.",
+        "CheckoutRequestID": f"ws_CO_BENCH_{index}",
+        "CallbackMetadata": {"Item": [
+            {"Name": "Amount", "Value": 120.00},
+            {"Name": "MpesaReceiptNumber", "Value": f"RCPT{index:08d}"},
+        ]},
+    }}})
+
+
+def replay(label, client, bodies, threads):
+    statements = []
+    lock = threading.Lock()
+    def record(conn, cursor, statement, parameters, context, executemany):
+        with lock:
+            statements.append(statement)
+
+    def deliver(body):
+        response = client.post('/api/payments/callback', data=body, content_type='application/json')
+        assert response.status_code == 200, response.get_json()
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(deliver, bodies))
+    finally:
+        elapsed = time.perf_counter() - started
+        event.remove(db.engine, 'before_cursor_execute', record)
+    writes = sum(1 for statement in statements if statement.lstrip().upper().startswith(WRITE_VERBS))
+    print(f"  {label:<20} {len(bodies):6d} callbacks {elapsed * 1000:9.1f} ms  {len(bodies) / elapsed:8.0f} /s  "
+          f"{len(statements) / len(bodies):4.1f} SQL per callback  {writes:5d} writes")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duplicates', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        buyer = User(username='callbackbuyer', email='callbacks@bench.local', phone_number='+254700999998',
+                     password_hash='x', role='buyer', is_approved=True)
+        db.session.add(buyer)
+        db.session.flush()
+        orders = [Order(buyer_id=buyer.id, total_price=120, status='Pending Payment') for _ in range(TRANSACTIONS)]
+        db.session.add_all(orders)
+        db.session.flush()
+        db.session.add_all([
+            Transaction(order_id=order.id, amount=120, phone_number='+254700999998',
+                        checkout_request_id=f"ws_CO_BENCH_{index}")
+            for index, order in enumerate(orders)
+        ])
+        db.session.commit()
+        db.session.remove()
+        client = app.test_client()
+
+        print(f"STK callbacks on {db.engine.dialect.name}, {args.threads} threads:")
+        replay("first deliveries", client, [payload(i) for i in range(TRANSACTIONS)], args.threads)
+        replay("duplicates", client, [payload(i % TRANSACTIONS) for i in range(args.duplicates)], args.threads)
+
+        assert ProcessedCallback.query.count() == TRANSACTIONS
+        assert Order.query.filter_by(status='Confirmed').count() == TRANSACTIONS
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/bench_produce_import.py
+"""
+Creates 1000 produce listings through the per-item endpoint (one multipart
+POST /api/produce/ each) and through one POST /api/produce/bulk, and compares
+wall time and the number of SQL statements.
+
+Works on SQLite or PostgreSQL; the tables in TEST_DATABASE_URL are dropped and recreated.
+
+    python -m benchmarks.bench_produce_import
+"""
+import json
+import time
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models.produce import Produce
+from app.models.user import User
+from app.utils.token_versions import remember_token_version, token_claims
+
+ROWS = 1000
+
+
+def listing(i):
+    return {"name": f"Import Item {i}", "description": "Bench row", "price": "85.50", "quantity": "10",
+            "unit": "kg", "location": "Nakuru"}
+
+
+def measure(label, fn):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    started = time.perf_counter()
+    try:
+        fn()
+    finally:
+        elapsed = time.perf_counter() - started
+        event.remove(db.engine, 'before_cursor_execute', record)
+    print(f"  {label:<24} {elapsed * 1000:9.1f} ms  {len(statements):5d} SQL statements  "
+          f"{ROWS / elapsed:8.0f} rows/s")
+
+
+def main():
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        farmer = User(username='importfarmer', email='import@bench.local', phone_number='+254700999999',
+                      password_hash='x', role='farmer', is_approved=True)
+        db.session.add(farmer)
+        db.session.commit()
+        remember_token_version(farmer)
+        headers = {'Authorization': 'Bearer ' + create_access_token(
+            identity=str(farmer.id), additional_claims=token_claims(farmer))}
+        client = app.test_client()
+
+        def per_item():
+            for i in range(ROWS):
+                response = client.post('/api/produce/', data=listing(i), headers=headers,
+                                       content_type='multipart/form-data')
+                assert response.status_code == 201, response.get_json()
+
+        def bulk():
+            response = client.post('/api/produce/bulk', data=json.dumps([listing(i) for i in range(ROWS)]),
+                                   headers=headers, content_type='application/json')
+            assert response.status_code == 201, response.get_json()
+
+        print(f"{ROWS} listings on {db.engine.dialect.name}:")
+        measure("per-item POST", per_item)
+        measure("bulk POST", bulk)
+        assert Produce.query.count() == 2 * ROWS
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/bench_produce_listing.py
+"""
+Seeds 100k produce rows and checks the planner serves the listing queries from
+the composite indexes (no Seq Scan on produce, and no Sort for the paginated
+marketplace pages).
+
+Needs PostgreSQL; the tables in TEST_DATABASE_URL are dropped and recreated.
+
+    python -m benchmarks.bench_produce_listing
+"""
+import json
+import statistics
+import sys
+import time
+
+from sqlalchemy.dialects import postgresql
+from werkzeug.datastructures import MultiDict
+
+from app import create_app, db
+from app.models.produce import Produce
+from app.resources.produce import available_produce_query
+
+ROWS = 100_000
+FARMERS = 100
+PAGE = 21  # limit + 1, as keyset_paginate fetches it
+RUNS = 20
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+    db.session.execute(db.text(
+        "INSERT INTO users (username, email, password_hash, role, is_approved) "
+        "SELECT 'farmer' || g, 'farmer' || g || '@bench.local', 'x', 'farmer', true "
+        "FROM generate_series(1, :farmers) g"
+    ), {"farmers": FARMERS})
+    db.session.execute(db.text(
+        "INSERT INTO produce (name, description, price, quantity, unit, location, is_available, "
+        "created_at, updated_at, farmer_id) "
+        "SELECT 'Produce ' || g, 'Bench row ' || g, (g % 1000) + 1, 10, 'kg', 'County ' || (g % 47), "
+        "g % 10 <> 0, now() - (g || ' minutes')::interval, now(), (g % :farmers) + 1 "
+        "FROM generate_series(1, :rows) g"
+    ), {"rows": ROWS, "farmers": FARMERS})
+    db.session.commit()
+    db.session.execute(db.text("ANALYZE produce"))
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def explain(query):
+    sql = str(query.statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    plan = db.session.execute(db.text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return list(plan_nodes(plan[0]['Plan']))
+
+
+def timed(query):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        query.all()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    app = create_app('testing')
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            sys.exit("This benchmark needs PostgreSQL (set TEST_DATABASE_URL).")
+        seed()
+
+        middle = Produce.query.filter_by(is_available=True).order_by(
+            Produce.created_at.desc(), Produce.id.desc()
+        ).offset(ROWS // 2).first()
+        deep_cursor = db.tuple_(Produce.created_at, Produce.id) < db.tuple_(middle.created_at, middle.id)
+        keyset = (Produce.created_at.desc(), Produce.id.desc())
+
+        cases = [
+            ("first page", available_produce_query(MultiDict()).order_by(*keyset).limit(PAGE), True),
+            ("deep keyset page", available_produce_query(MultiDict()).filter(deep_cursor).order_by(*keyset).limit(PAGE), True),
+            ("price-bounded page", available_produce_query(MultiDict({"min_price": "100", "max_price": "400"})).order_by(*keyset).limit(PAGE), False),
+            # Unbounded, so the planner may prefer a bitmap scan plus an in-memory sort of ~1k rows.
+            ("farmer listing", Produce.query.filter_by(farmer_id=7).order_by(*keyset), False),
+        ]
+
+        failures = []
+        for label, query, forbid_sort in cases:
+            nodes = explain(query)
+            node_types = [node['Node Type'] for node in nodes]
+            indexes = sorted({node['Index Name'] for node in nodes if 'Index Name' in node})
+            seq_scans = [node for node in nodes if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') == 'produce']
+            print(f"{label:<20} {timed(query):8.2f} ms  nodes={node_types} indexes={indexes}")
+            if seq_scans:
+                failures.append(f"{label}: sequential scan on produce")
+            if forbid_sort and 'Sort' in node_types:
+                failures.append(f"{label}: explicit Sort node")
+            if not indexes:
+                failures.append(f"{label}: no index used")
+
+        db.session.remove()
+        db.drop_all()
+
+    if failures:
+        sys.exit("Plan check failed:\n  " + "\n  ".join(failures))
+    print("All listing queries are served by an index.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_serialization.py
+"""
+Times turning 10k produce listings into a response body: marshmallow dump vs the
+compiled serializer (from objects and from column tuples), JSON encoding with the stdlib and orjson providers, and gzip/brotli compression.
+
+Needs no database; the rows are built in memory.
+
+    python -m benchmarks.bench_serialization
+"""
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import create_app
+from app.models.produce import Produce
+from app.schemas.compiled import compile_schema
+from app.schemas.produce import ProduceSchema
+from app.utils import compression
+from app.utils.json_provider import OrjsonProvider, orjson
+
+ROWS = 10_000
+RUNS = 10
+
+
+def build_rows():
+    now = datetime.now(timezone.utc)
+    return [
+        Produce(
+            id=i, name=f"Produce {i}", description=f"Freshly harvested batch number {i} from the farm.",
+            price=Decimal(i % 1000) + Decimal('0.50'), quantity=i % 50, unit='kg',
+            image_url=None, is_available=True, location=f"County {i % 47}",
+            created_at=now - timedelta(minutes=i), farmer_id=(i % 100) + 1
+        )
+        for i in range(1, ROWS + 1)
+    ]
+
+
+def timed(label, fn):
+    samples = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    print(f"  {label:<28} median {statistics.median(samples):8.1f} ms")
+    return result
+
+
+def main():
+    app = create_app('testing')
+    with app.test_request_context():
+        rows = build_rows()
+        schema = ProduceSchema(many=True)
+        payload = timed("marshmallow dump", lambda: schema.dump(rows))
+        compiled = compile_schema(schema)
+        timed("compiled dump (objects)", lambda: compiled.dump(rows))
+        tuples = [tuple(getattr(row, attribute) for attribute in compiled.attributes) for row in rows]
+        timed("compiled dump (tuples)", lambda: compiled.dump_rows(tuples))
+
+        providers = [("stdlib jsonify", DefaultJSONProvider(app))]
+        if orjson is not None:
+            providers.append(("orjson jsonify", OrjsonProvider(app)))
+        else:
+            print("  (orjson not installed; skipping)")
+        body = None
+        for label, provider in providers:
+            body = timed(label, lambda: provider.response(payload).get_data())
+        print(f"  {'body size':<28} {len(body) / 1024:8.1f} KiB")
+
+        for encoding in ('gzip', 'br'):
+            if encoding == 'br' and compression.brotli is None:
+                print("  (brotli not installed; skipping)")
+                continue
+            compressed = timed(f"{encoding} compress", lambda: compression._compress(body, encoding, app.config))
+            print(f"  {f'{encoding} size':<28} {len(compressed) / 1024:8.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
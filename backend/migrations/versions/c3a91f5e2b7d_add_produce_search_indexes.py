@@ -0,0 +1,47 @@
+"""Add full-text and trigram search indexes to produce
+
+Revision ID: c3a91f5e2b7d
+Revises: 102e7c8c6658
+Create Date: 2025-10-21 09:12:37.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a91f5e2b7d'
+down_revision = '102e7c8c6658'
+branch_labels = None
+depends_on = None
+
+# Must stay identical to app.models.produce.produce_search_vector, or the planner will not use the index.
+SEARCH_VECTOR = (
+    "((setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(location, '')), 'B')) || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C'))"
+)
+
+
+def upgrade():
+    # These index types only exist on PostgreSQL; other databases use the in-process search fallback.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_produce_search_vector', 'produce', [sa.text(SEARCH_VECTOR)], postgresql_using='gin')
+
+    # Trigram indexes let the existing name/location ILIKE '%term%' filters use an index despite the leading wildcard.
+    op.create_index('ix_produce_name_trgm', 'produce', ['name'],
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_produce_location_trgm', 'produce', ['location'],
+                    postgresql_using='gin', postgresql_ops={'location': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.drop_index('ix_produce_location_trgm', table_name='produce')
+    op.drop_index('ix_produce_name_trgm', table_name='produce')
+    op.drop_index('ix_produce_search_vector', table_name='produce')
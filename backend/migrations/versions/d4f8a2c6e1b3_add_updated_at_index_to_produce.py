@@ -0,0 +1,25 @@
+"""Add updated_at index to produce
+
+Revision ID: d4f8a2c6e1b3
+Revises: b2d6e8f0a3c5
+Create Date: 2025-10-26 09:12:44.517093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f8a2c6e1b3'
+down_revision = 'b2d6e8f0a3c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Catalog export: WHERE updated_at > :since ORDER BY updated_at, id
+    op.create_index('ix_produce_updated_at', 'produce', ['updated_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_produce_updated_at', table_name='produce')
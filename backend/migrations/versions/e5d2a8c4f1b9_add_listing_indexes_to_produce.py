@@ -0,0 +1,38 @@
+"""Add composite listing indexes to produce
+
+Revision ID: e5d2a8c4f1b9
+Revises: c3a91f5e2b7d
+Create Date: 2025-10-22 16:40:03.881542
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5d2a8c4f1b9'
+down_revision = 'c3a91f5e2b7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Marketplace listing: WHERE is_available [AND price BETWEEN ..] ORDER BY created_at DESC, id DESC
+    op.create_index('ix_produce_available_created_at', 'produce',
+                    [sa.text('created_at DESC'), sa.text('id DESC')],
+                    postgresql_where=sa.text('is_available'))
+    op.create_index('ix_produce_available_price', 'produce',
+                    ['price', sa.text('created_at DESC')],
+                    postgresql_where=sa.text('is_available'))
+    # A farmer's own listings: WHERE farmer_id = :id ORDER BY created_at DESC, id DESC
+    op.create_index('ix_produce_farmer_created_at', 'produce',
+                    ['farmer_id', sa.text('created_at DESC'), sa.text('id DESC')])
+    # Its leading farmer_id column serves every lookup the single-column index did
+    op.drop_index('ix_produce_farmer_id', table_name='produce')
+
+
+def downgrade():
+    op.create_index('ix_produce_farmer_id', 'produce', ['farmer_id'], unique=False)
+    op.drop_index('ix_produce_farmer_created_at', table_name='produce')
+    op.drop_index('ix_produce_available_price', table_name='produce')
+    op.drop_index('ix_produce_available_created_at', table_name='produce')
@@ -0,0 +1,26 @@
+"""Add pending approval index to users
+
+Revision ID: e8a3c7f1d5b9
+Revises: c5e9b1d7f3a8
+Create Date: 2025-10-28 10:04:37.215468
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a3c7f1d5b9'
+down_revision = 'c5e9b1d7f3a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Admin pending approvals: WHERE role = 'farmer' AND NOT is_approved
+    op.create_index('ix_users_pending_approval', 'users', ['role', 'is_approved'],
+                    postgresql_where=sa.text('NOT is_approved'))
+
+
+def downgrade():
+    op.drop_index('ix_users_pending_approval', table_name='users')
@@ -1,5 +1,7 @@
 # tests/conftest.py
 import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
 from app import create_app, db
 
 @pytest.fixture(scope='module')
@@ -21,4 +23,39 @@ def init_database(test_app):
         db.create_all()
         yield db
         db.session.remove()
-        db.drop_all()
\ No newline at end of file
+        db.drop_all()
+        from app.services.cache import get_cache
+        get_cache(test_app).clear()
+
+@pytest.fixture(scope='function')
+def count_queries(test_app):
+    """Returns a context manager that collects every SQL statement executed inside it."""
+    @contextmanager
+    def counter():
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return counter
+
+@pytest.fixture(scope='function')
+def http_stub():
+    """Routes a service's shared HTTP client ('mpesa', 'twilio', ...) through a local StubTransport."""
+    from app.services import http_client, mpesa_service, twilio_service
+
+    def install(service_name):
+        stub = http_client.StubTransport()
+        http_client.set_transport(service_name, stub)
+        return stub
+
+    http_client.reset_clients()
+    mpesa_service.token_cache.clear()
+    twilio_service.reset_twilio_clients()
+    yield install
+    http_client.reset_clients()
+    mpesa_service.token_cache.clear()
+    twilio_service.reset_twilio_clients()
@@ -61,4 +61,87 @@ def test_admin_approve_farmer(test_client, init_database):
     response = test_client.patch(f'/api/admin/users/{farmer.id}', data=json.dumps(update_data), headers=headers, content_type='application/json')
     
     assert response.status_code == 200
-    assert response.get_json()['is_approved'] is True
\ No newline at end of file
+    assert response.get_json()['is_approved'] is True
+
+def test_approval_change_revokes_stale_tokens(test_client, init_database):
+    """
+    GIVEN an unapproved farmer holding a token that says they are unapproved
+    WHEN an admin approves them
+    THEN the old token should be rejected and a fresh login should grant farmer access
+    """
+    admin_token = create_admin_user(test_client)
+    farmer_creds = register_user_helper(test_client, 'stale_farmer', 'password123', 'farmer', is_approved=False)
+    old_token = login_user_helper(test_client, farmer_creds['email'], farmer_creds['password'])
+    old_headers = {'Authorization': f'Bearer {old_token}'}
+
+    response = test_client.get('/api/produce/my-listings', headers=old_headers)
+    assert response.status_code == 403
+    assert "pending approval" in response.get_json()['message']
+
+    admin_headers = {'Authorization': f'Bearer {admin_token}'}
+    farmer_id = farmer_creds['user_obj'].id
+    response = test_client.patch(f'/api/admin/users/{farmer_id}', data=json.dumps({"is_approved": True}), headers=admin_headers, content_type='application/json')
+    assert response.status_code == 200
+
+    response = test_client.get('/api/produce/my-listings', headers=old_headers)
+    assert response.status_code == 401
+
+    new_token = login_user_helper(test_client, farmer_creds['email'], farmer_creds['password'])
+    response = test_client.get('/api/produce/my-listings', headers={'Authorization': f'Bearer {new_token}'})
+    assert response.status_code == 200
+
+def test_admin_users_paginated_and_filtered(test_client, init_database, count_queries):
+    """
+    GIVEN a logged-in admin and a mix of farmers and buyers
+    WHEN they page through '/api/admin/users' with role, approval and search filters
+    THEN each page should carry the filtered total, fetched in a single query
+    """
+    admin_token = create_admin_user(test_client)
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    for _ in range(5):
+        register_user_helper(test_client, 'pagefarmer', 'password123', 'farmer', is_approved=False)
+    for _ in range(3):
+        register_user_helper(test_client, 'pagebuyer', 'password123', 'buyer')
+
+    with count_queries() as statements:
+        response = test_client.get('/api/admin/users?role=farmer&per_page=2&page=2&sort=-id', headers=headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['total'], body['page'], body['per_page']) == (5, 2, 2)
+    assert len(body['items']) == 2
+    assert all(user['role'] == 'farmer' for user in body['items'])
+    assert body['items'][0]['id'] > body['items'][1]['id']
+    assert 'password_hash' not in body['items'][0]
+    assert len([s for s in statements if 'users' in s]) == 1
+
+    response = test_client.get('/api/admin/users?q=pagebuyer&is_approved=true&page=9', headers=headers)
+    assert response.get_json()['total'] == 3
+    assert response.get_json()['items'] == []
+    # % and _ in the search text are matched literally, not as wildcards
+    for q in ('page_uyer', '%25', 'page%25buyer', '\\'):
+        response = test_client.get(f'/api/admin/users?q={q}&page=1', headers=headers)
+        assert response.get_json()['total'] == 0, q
+    register_user_helper(test_client, 'page_100%_buyer', 'password123', 'buyer')
+    response = test_client.get('/api/admin/users?q=page_100%25_buyer&page=1', headers=headers)
+    assert response.get_json()['total'] == 1
+
+    response = test_client.get('/api/admin/users?is_approved=maybe&page=1', headers=headers)
+    assert response.status_code == 400
+    response = test_client.get('/api/admin/users?sort=password_hash', headers=headers)
+    assert response.status_code == 400
+
+def test_admin_pending_approvals_count(test_client, init_database):
+    """
+    GIVEN unapproved farmers, an approved farmer and an unapproved buyer
+    WHEN an admin requests '/api/admin/users/pending_approvals'
+    THEN only the unapproved farmers should be counted
+    """
+    admin_token = create_admin_user(test_client)
+    for _ in range(3):
+        register_user_helper(test_client, 'pendingfarmer', 'password123', 'farmer', is_approved=False)
+    register_user_helper(test_client, 'approvedfarmer', 'password123', 'farmer')
+    register_user_helper(test_client, 'pendingbuyer', 'password123', 'buyer', is_approved=False)
+
+    response = test_client.get('/api/admin/users/pending_approvals', headers={'Authorization': f'Bearer {admin_token}'})
+    assert response.status_code == 200
+    assert response.get_json() == {"pending_approvals": 3}
@@ -18,6 +18,47 @@ def test_register_user(test_client, init_database):
     assert response.status_code == 201
     assert "User created successfully" in response.get_json()['message']
 
+def test_register_duplicate_reports_conflicting_field(test_client, init_database):
+    """
+    GIVEN an existing user
+    WHEN someone registers with the same email, then the same phone number
+    THEN each attempt should get a 409 naming the field that is already taken
+    """
+    data = {"username": "dupuser", "email": "dup@example.com", "password": "testpassword",
+            "role": "buyer", "phone_number": "+254700000002"}
+    assert test_client.post('/api/auth/register', data=json.dumps(data), content_type='application/json').status_code == 201
+
+    same_email = dict(data, username="dupuser2", phone_number="+254700000003")
+    response = test_client.post('/api/auth/register', data=json.dumps(same_email), content_type='application/json')
+    assert response.status_code == 409
+    assert response.get_json() == {"message": "Email already exists", "field": "email"}
+
+    same_phone = dict(data, username="dupuser3", email="dup3@example.com")
+    response = test_client.post('/api/auth/register', data=json.dumps(same_phone), content_type='application/json')
+    assert response.status_code == 409
+    assert response.get_json()['field'] == 'phone_number'
+
+def test_concurrent_duplicate_registrations(test_client, init_database):
+    """
+    GIVEN many clients registering the same username and email at once
+    WHEN the requests race each other
+    THEN exactly one account should be created and every other request should get a 409, never a 500
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from app.models.user import User
+
+    def register(i):
+        data = {"username": "raceuser", "email": "race@example.com", "password": "testpassword",
+                "role": "buyer", "phone_number": f"+2547001000{i:02d}"}
+        return test_client.post('/api/auth/register', data=json.dumps(data), content_type='application/json').status_code
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        statuses = list(pool.map(register, range(10)))
+
+    assert statuses.count(201) == 1
+    assert statuses.count(409) == 9
+    assert User.query.filter_by(username="raceuser").count() == 1
+
 def test_login_user(test_client, init_database):
     """
     GIVEN a registered user
@@ -44,4 +85,104 @@ def test_login_user(test_client, init_database):
 
     assert response.status_code == 200
     assert "access_token" in json_data
-    assert "refresh_token" in json_data
\ No newline at end of file
+    assert "refresh_token" in json_data
+
+def test_role_checks_do_not_query_users(test_client, init_database, count_queries):
+    """
+    GIVEN a logged-in, approved farmer
+    WHEN they call a farmer-only endpoint
+    THEN the role check should be answered from the token without reading the users table
+    """
+    from tests.test_produce import get_auth_token
+    farmer_token = get_auth_token(test_client, 'claims_farmer', 'password123', 'farmer')
+    headers = {'Authorization': f'Bearer {farmer_token}'}
+    with count_queries() as statements:
+        response = test_client.get('/api/produce/my-listings', headers=headers)
+    assert response.status_code == 200
+    assert not [s for s in statements if 'users' in s]
+
+def test_login_rehashes_password_when_cost_changes(test_app, test_client, init_database, monkeypatch):
+    """
+    GIVEN a user whose password was hashed with an older bcrypt work factor
+    WHEN they log in after BCRYPT_LOG_ROUNDS was raised
+    THEN the login should succeed and the stored hash be upgraded to the new cost
+    """
+    from app.models.user import User
+    from app.services.password_hasher import get_password_hasher
+    from tests.test_produce import register_user_helper
+    creds = register_user_helper(test_client, 'rehash', 'oldpassword')
+    old_hash = creds['user_obj'].password_hash
+    assert old_hash.startswith('$2b$04$')
+
+    monkeypatch.setattr(get_password_hasher(test_app), 'rounds', 5)
+    response = test_client.post('/api/auth/login', data=json.dumps({"email": creds['email'], "password": "oldpassword"}), content_type='application/json')
+    assert response.status_code == 200
+    new_hash = User.query.filter_by(email=creds['email']).one().password_hash
+    assert new_hash.startswith('$2b$05$')
+
+    # The upgraded hash still verifies, and is left alone on the next login
+    response = test_client.post('/api/auth/login', data=json.dumps({"email": creds['email'], "password": "oldpassword"}), content_type='application/json')
+    assert response.status_code == 200
+    assert User.query.filter_by(email=creds['email']).one().password_hash == new_hash
+
+def test_login_returns_503_when_hash_queue_is_full(test_app, test_client, init_database, monkeypatch):
+    """
+    GIVEN every password hashing slot is taken
+    WHEN another login arrives
+    THEN it should be turned away with 503 and Retry-After once the queue timeout passes
+    """
+    from app.services.password_hasher import get_password_hasher
+    from tests.test_produce import register_user_helper
+    creds = register_user_helper(test_client, 'busy', 'password123')
+    hasher = get_password_hasher(test_app)
+    monkeypatch.setattr(hasher, 'queue_timeout', 0.01)
+    taken = 0
+    while hasher._slots.acquire(blocking=False):
+        taken += 1
+    try:
+        response = test_client.post('/api/auth/login', data=json.dumps({"email": creds['email'], "password": "password123"}), content_type='application/json')
+    finally:
+        for _ in range(taken):
+            hasher._slots.release()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+def test_password_hasher_process_pool():
+    """
+    GIVEN a PasswordHasher backed by a worker process
+    WHEN passwords are hashed and checked
+    THEN the results should match inline bcrypt
+    """
+    import bcrypt
+    from app.services.password_hasher import PasswordHasher
+    hasher = PasswordHasher(rounds=4, workers=1, max_queue=4, queue_timeout=5)
+    try:
+        password_hash = hasher.hash("s3cret-pässword")
+        assert bcrypt.checkpw("s3cret-pässword".encode('utf-8'), password_hash.encode('utf-8'))
+        assert hasher.check("s3cret-pässword", password_hash)
+        assert not hasher.check("wrong", password_hash)
+        assert not hasher.needs_rehash(password_hash)
+    finally:
+        hasher.shutdown()
+
+def test_password_hasher_recovers_from_a_dead_worker_process():
+    """
+    GIVEN a PasswordHasher whose worker process has been killed
+    WHEN a password is hashed
+    THEN the hasher should start a new pool and succeed instead of failing every later call
+    """
+    import bcrypt
+    from app.services.password_hasher import PasswordHasher
+    hasher = PasswordHasher(rounds=4, workers=1, max_queue=4, queue_timeout=5)
+    try:
+        hasher.warm_up()
+        broken_pool = hasher._pool
+        for process in list(broken_pool._processes.values()):
+            process.kill()
+            process.join()
+
+        password_hash = hasher.hash("after-crash")
+        assert bcrypt.checkpw(b"after-crash", password_hash.encode('utf-8'))
+        assert hasher._pool is not broken_pool
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,195 @@
+# tests/test_images.py
+import io
+import os
+import time
+
+from PIL import Image
+
+from app.models.image_upload import ImageUpload
+from app.models.produce import Produce
+from app.services.image_cache import DiskLRUCache, get_image_cache
+from app.services.image_service import drain_images
+from app import db
+from tests.test_produce import get_auth_token
+
+def make_image_file(width=1200, height=800, image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (40, 160, 60)).save(buffer, image_format)
+    buffer.seek(0)
+    return buffer
+
+def create_listing_with_image(test_client, farmer_token, image_file, filename):
+    data = {"name": "Pictured Kale", "price": "30", "quantity": "5", "unit": "bunch", "image": (image_file, filename)}
+    return test_client.post('/api/produce/', data=data, headers={'Authorization': f'Bearer {farmer_token}'},
+                            content_type='multipart/form-data')
+
+def test_image_is_processed_in_the_background(test_app, test_client, init_database):
+    """
+    GIVEN a farmer creating a listing with an image
+    WHEN the listing is created and the image worker then runs
+    THEN the listing should be returned at once as pending, and get its image and every resized variant afterwards
+    """
+    farmer_token = get_auth_token(test_client, 'imagefarmer', 'password123')
+    response = create_listing_with_image(test_client, farmer_token, make_image_file(), 'kale.png')
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['image_status'] == 'pending'
+    assert body['image_url'] is None
+    spool_path = ImageUpload.query.one().spool_path
+    assert os.path.exists(spool_path)
+
+    assert drain_images(test_app) == 1
+
+    db.session.expire_all()
+    produce = db.session.get(Produce, body['id'])
+    assert produce.image_status == 'ready'
+    assert ImageUpload.query.one().status == 'Done'
+    assert not os.path.exists(spool_path)
+
+    original = test_client.get(produce.image_url)
+    assert original.status_code == 200
+    assert Image.open(io.BytesIO(original.data)).size == (1200, 800)
+    assert sorted(produce.image_variants, key=int) == ['160', '480', '1024']
+    for width, urls in produce.image_variants.items():
+        assert set(urls) == {'webp', 'jpeg'}
+        for name, url in urls.items():
+            variant = Image.open(io.BytesIO(test_client.get(url).data))
+            assert variant.format == name.upper()
+            assert variant.size == (int(width), round(int(width) * 2 / 3))
+    assert produce.thumbnail_url == produce.image_variants['480']['jpeg']
+
+    # The listing API exposes the variants, so grids can pick the small ones
+    buyer_token = get_auth_token(test_client, 'imagebuyer', 'password123', 'buyer')
+    listing = test_client.get('/api/produce/', headers={'Authorization': f'Bearer {buyer_token}'}).get_json()[0]
+    assert listing['image_variants'] == produce.image_variants
+
+def test_small_images_are_not_upscaled(test_app, test_client, init_database):
+    """
+    GIVEN a listing with a 300x200 image
+    WHEN the image worker renders its variants
+    THEN widths above 300 px should keep the original size instead of being upscaled
+    """
+    farmer_token = get_auth_token(test_client, 'smallimagefarmer', 'password123')
+    response = create_listing_with_image(test_client, farmer_token, make_image_file(300, 200, 'JPEG'), 'small.jpg')
+    drain_images(test_app)
+    db.session.expire_all()
+    variants = db.session.get(Produce, response.get_json()['id']).image_variants
+    sizes = {width: Image.open(io.BytesIO(test_client.get(urls['jpeg']).data)).size for width, urls in variants.items()}
+    assert sizes == {'160': (160, 107), '480': (300, 200), '1024': (300, 200)}
+
+def test_disk_lru_cache_evicts_least_recently_used(tmp_path):
+    """
+    GIVEN a disk cache bounded to 250 bytes
+    WHEN a third 100-byte entry is added after the first one was read again
+    THEN the least recently used entry should be evicted and the total stay under the bound
+    """
+    cache = DiskLRUCache(str(tmp_path), max_bytes=250)
+    cache.set('a', b'a' * 100)
+    cache.set('b', b'b' * 100)
+    past = time.time() - 60
+    os.utime(cache._path('a'), (past, past))
+    os.utime(cache._path('b'), (past + 1, past + 1))
+    assert cache.get('a') == b'a' * 100  # now the most recently used
+
+    cache.set('c', b'c' * 100)
+    assert cache.get('b') is None
+    assert cache.get('a') == b'a' * 100 and cache.get('c') == b'c' * 100
+    assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= 250
+
+    # Too large to ever fit: not cached at all
+    cache.set('huge', b'x' * 300)
+    assert cache.get('huge') is None
+
+def test_repeated_image_reuses_cached_variants(test_app, test_client, init_database, monkeypatch):
+    """
+    GIVEN an empty variant cache
+    WHEN two listings are created with the same image
+    THEN the variants should be rendered once and both listings should be ready
+    """
+    from app.services import image_service
+    get_image_cache(test_app).clear()
+    renders = []
+    original_render = image_service.render_variants
+    monkeypatch.setattr(image_service, 'render_variants', lambda *args: renders.append(1) or original_render(*args))
+
+    farmer_token = get_auth_token(test_client, 'repeatimagefarmer', 'password123')
+    image_bytes = make_image_file().getvalue()
+    for _ in range(2):
+        create_listing_with_image(test_client, farmer_token, io.BytesIO(image_bytes), 'same.png')
+        drain_images(test_app)
+
+    assert len(renders) == 1
+    assert {p.image_status for p in Produce.query.all()} == {'ready'}
+
+def test_unreadable_image_is_marked_failed(test_app, test_client, init_database):
+    """
+    GIVEN a listing whose upload claims to be an image but cannot be decoded
+    WHEN the image worker has used up its attempts
+    THEN the listing should keep no image and report image_status 'failed'
+    """
+    farmer_token = get_auth_token(test_client, 'badimagefarmer', 'password123')
+    response = create_listing_with_image(test_client, farmer_token, io.BytesIO(b"not really a jpeg"), 'photo.jpg')
+    assert response.status_code == 201
+    upload = ImageUpload.query.one()
+    upload.max_attempts = 1
+    db.session.commit()
+
+    drain_images(test_app)
+
+    db.session.expire_all()
+    produce = db.session.get(Produce, response.get_json()['id'])
+    assert (produce.image_status, produce.image_url) == ('failed', None)
+    upload = ImageUpload.query.one()
+    assert upload.status == 'Failed' and 'cannot identify image file' in upload.last_error
+
+    # Files that are not even labelled as images are refused up front
+    response = create_listing_with_image(test_client, farmer_token, io.BytesIO(b"%PDF-1.4"), 'invoice.pdf')
+    assert response.status_code == 422
+
+def test_image_that_kills_the_worker_is_not_retried_forever(test_app, test_client, init_database):
+    """
+    GIVEN an upload whose last allowed attempt never reported back because the worker died
+    WHEN a worker runs after the lease expired
+    THEN the upload should be marked Failed without being processed again, and its spool file removed
+    """
+    from datetime import datetime, timedelta, timezone
+    from unittest.mock import patch
+    farmer_token = get_auth_token(test_client, 'crashimagefarmer', 'password123')
+    response = create_listing_with_image(test_client, farmer_token, make_image_file(), 'bomb.png')
+    upload = ImageUpload.query.one()
+    spool_path = upload.spool_path
+    upload.status, upload.attempts, upload.max_attempts = 'Processing', 3, 3
+    upload.next_attempt_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.session.commit()
+
+    with patch('app.services.image_service.process_image') as mock_process:
+        assert drain_images(test_app) == 0
+    mock_process.assert_not_called()
+
+    db.session.expire_all()
+    upload = ImageUpload.query.one()
+    assert (upload.status, upload.attempts) == ('Failed', 3)
+    assert "Lease expired" in upload.last_error
+    assert db.session.get(Produce, response.get_json()['id']).image_status == 'failed'
+    assert not os.path.exists(spool_path)
+
+def test_deleting_a_listing_removes_its_image_files(test_app, test_client, init_database):
+    """
+    GIVEN one listing whose image is stored and another whose image is still spooled
+    WHEN the farmer deletes both listings
+    THEN the stored original and variants, and the spool file, should be removed
+    """
+    farmer_token = get_auth_token(test_client, 'deleteimagefarmer', 'password123')
+    headers = {'Authorization': f'Bearer {farmer_token}'}
+    stored_id = create_listing_with_image(test_client, farmer_token, make_image_file(), 'kale.png').get_json()['id']
+    drain_images(test_app)
+    stored_dir = os.path.join(test_app.config['IMAGE_STORAGE_DIR'], 'produce', str(stored_id))
+    assert os.listdir(stored_dir)
+    spooled_id = create_listing_with_image(test_client, farmer_token, make_image_file(), 'kale.png').get_json()['id']
+    spool_path = ImageUpload.query.filter_by(produce_id=spooled_id).one().spool_path
+
+    for produce_id in (stored_id, spooled_id):
+        assert test_client.delete(f'/api/produce/{produce_id}', headers=headers).status_code == 204
+
+    assert not os.path.exists(stored_dir)
+    assert not os.path.exists(spool_path)
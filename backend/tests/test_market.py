@@ -51,4 +51,56 @@ def test_non_admin_cannot_create_price(test_client, init_database):
 
     response = test_client.post('/api/market/prices', data=json.dumps(price_data), headers=headers, content_type='application/json')
     
-    assert response.status_code == 403
\ No newline at end of file
+    assert response.status_code == 403
+
+def test_market_prices_etag_and_invalidation(test_client, init_database, count_queries):
+    """
+    GIVEN cached market prices
+    WHEN a client revalidates with If-None-Match, and later an admin adds a price
+    THEN the client should get 304 without a database read, and then fresh data with a new ETag
+    """
+    admin_token = create_admin_user(test_client)
+    admin_headers = {'Authorization': f'Bearer {admin_token}'}
+    test_client.post('/api/market/prices', data=json.dumps({"crop_name": "Beans", "average_price": "120.00", "unit": "kg"}), headers=admin_headers, content_type='application/json')
+
+    response = test_client.get('/api/market/prices', headers=admin_headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    with count_queries() as statements:
+        response = test_client.get('/api/market/prices', headers={**admin_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert not [s for s in statements if 'market_prices' in s]
+
+    test_client.post('/api/market/prices', data=json.dumps({"crop_name": "Kale", "average_price": "30.00", "unit": "bunch"}), headers=admin_headers, content_type='application/json')
+    response = test_client.get('/api/market/prices', headers={**admin_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert [p['crop_name'] for p in response.get_json()] == ['Beans', 'Kale']
+
+def test_snapshot_built_before_a_concurrent_write_is_not_cached(test_client, init_database, monkeypatch):
+    """
+    GIVEN a market price snapshot being built while another request commits a new price
+    WHEN that snapshot is finished after the write invalidated the cache
+    THEN it should not be cached, so the next read includes the new price
+    """
+    from decimal import Decimal
+    from app import db
+    from app.models.market_price import MarketPrice
+    from app.services import market_price_cache
+
+    db.session.add(MarketPrice(crop_name="Beans", average_price=Decimal('120.00'), unit='kg'))
+    db.session.commit()
+    build_snapshot = market_price_cache._build_snapshot
+
+    def build_during_write(generation):
+        snapshot = build_snapshot(generation)
+        # The other request commits (and invalidates) before this snapshot reaches the cache
+        db.session.add(MarketPrice(crop_name="Kale", average_price=Decimal('30.00'), unit='bunch'))
+        db.session.commit()
+        return snapshot
+    monkeypatch.setattr(market_price_cache, '_build_snapshot', build_during_write)
+    assert list(market_price_cache.get_price_snapshot()['by_crop']) == ['Beans']
+
+    monkeypatch.setattr(market_price_cache, '_build_snapshot', build_snapshot)
+    assert list(market_price_cache.get_price_snapshot()['by_crop']) == ['Beans', 'Kale']
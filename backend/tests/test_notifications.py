@@ -0,0 +1,86 @@
+# tests/test_notifications.py
+from app.models.outbound_message import OutboundMessage
+from app.services.notification_service import FakeSender, NotificationWorker, enqueue_sms
+from app import db
+
+def run_worker_once(test_app, sender):
+    worker = NotificationWorker(test_app, sender=sender)
+    try:
+        return worker.run_once()
+    finally:
+        worker.shutdown()
+
+def test_worker_delivers_queued_messages(test_app, init_database):
+    """
+    GIVEN messages waiting in the outbox
+    WHEN the notification worker runs
+    THEN every message should be sent once and marked as Sent
+    """
+    for i in range(3):
+        enqueue_sms(f"+25470000000{i}", f"Message {i}")
+    db.session.commit()
+
+    sender = FakeSender()
+    assert run_worker_once(test_app, sender) == 3
+    assert sorted(body for _, body in sender.sent) == ["Message 0", "Message 1", "Message 2"]
+
+    db.session.expire_all()
+    messages = OutboundMessage.query.all()
+    assert {m.status for m in messages} == {'Sent'}
+    assert all(m.provider_message_id and m.sent_at for m in messages)
+    # Nothing left to do
+    assert run_worker_once(test_app, sender) == 0
+
+def test_worker_retries_then_gives_up(test_app, init_database):
+    """
+    GIVEN an SMS provider that keeps failing
+    WHEN the worker processes a message
+    THEN the message should be rescheduled with the error recorded, and marked Failed after max_attempts
+    """
+    enqueue_sms("+254700000009", "Flaky", max_attempts=2)
+    db.session.commit()
+
+    sender = FakeSender(fail_times=10)
+    assert run_worker_once(test_app, sender) == 1
+    db.session.expire_all()
+    message = OutboundMessage.query.one()
+    assert message.status == 'Pending'
+    assert message.attempts == 1
+    assert "Simulated SMS provider failure" in message.last_error
+    # Backoff: not due again yet
+    assert run_worker_once(test_app, sender) == 0
+
+    # Make it due now and fail the final attempt
+    message.next_attempt_at = message.created_at
+    db.session.commit()
+    assert run_worker_once(test_app, sender) == 1
+    db.session.expire_all()
+    message = OutboundMessage.query.one()
+    assert message.status == 'Failed'
+    assert message.attempts == 2
+    assert sender.sent == []
+
+def test_expired_lease_on_last_attempt_is_failed_not_resent(test_app, init_database):
+    """
+    GIVEN a message whose worker died during its last allowed attempt, and one that still has attempts left
+    WHEN another worker runs after their leases expired
+    THEN the first should be marked Failed without being sent again, and the second should be sent
+    """
+    from datetime import datetime, timedelta, timezone
+    expired = datetime.now(timezone.utc) - timedelta(minutes=1)
+    exhausted = enqueue_sms("+254700000011", "Last chance", max_attempts=2)
+    resumable = enqueue_sms("+254700000012", "Try again", max_attempts=2)
+    for message in (exhausted, resumable):
+        message.status, message.next_attempt_at = 'Sending', expired
+    exhausted.attempts, resumable.attempts = 2, 1
+    db.session.commit()
+
+    sender = FakeSender()
+    assert run_worker_once(test_app, sender) == 1
+
+    assert sender.sent == [("+254700000012", "Try again")]
+    db.session.expire_all()
+    exhausted, resumable = db.session.get(OutboundMessage, exhausted.id), db.session.get(OutboundMessage, resumable.id)
+    assert (exhausted.status, exhausted.attempts) == ('Failed', 2)
+    assert "Lease expired" in exhausted.last_error
+    assert (resumable.status, resumable.attempts) == ('Sent', 2)
@@ -1,9 +1,8 @@
 # tests/test_orders.py
 import json
-from unittest.mock import patch
 
 # FIX: 'setup_produce' is a local function and should NOT be imported.
-from tests.test_produce import register_user_helper, login_user_helper, get_auth_token
+from tests.test_produce import register_user_helper, login_user_helper, get_auth_token, create_produce_helper
 
 def setup_produce(test_client, farmer_token):
     """Helper function to create a produce item and return its ID."""
@@ -68,15 +67,15 @@ def test_get_buyer_orders(test_client, init_database):
     assert response.status_code == 200
     assert len(response.get_json()) == 1
 
-@patch('app.resources.order.send_sms') # Patch where the function is used
-def test_create_order_sends_sms_notification(mock_send_sms, test_client, init_database):
+def test_create_order_sends_sms_notification(test_client, init_database):
     """
     GIVEN a new order is created
     WHEN the order is successfully placed
-    THEN the Twilio send_sms mock should be called
+    THEN an SMS to the farmer should be queued and delivered by the notification worker
     """
-    # Tell the mock to return True and NOT execute the real code
-    mock_send_sms.return_value = True
+    from app.models.outbound_message import OutboundMessage
+    from app.services.notification_service import drain_outbox, get_sender
+    from app import db
 
     farmer_creds = register_user_helper(test_client, 'smsfarmer', 'password123', 'farmer')
     buyer_creds = register_user_helper(test_client, 'smsbuyer', 'password123', 'buyer')
@@ -89,7 +88,16 @@ def test_create_order_sends_sms_notification(mock_send_sms, test_client, init_da
     response = test_client.post('/api/orders/', data=json.dumps(order_data), headers=headers, content_type='application/json')
     
     assert response.status_code == 201
-    mock_send_sms.assert_called_once()
+    queued = OutboundMessage.query.all()
+    assert len(queued) == 1
+    assert queued[0].status == 'Pending'
+
+    sender = get_sender()
+    sent_before = len(sender.sent)
+    assert drain_outbox() == 1
+    assert len(sender.sent) == sent_before + 1
+    db.session.expire_all()
+    assert OutboundMessage.query.one().status == 'Sent'
 
 def test_get_farmer_orders(test_client, init_database):
     """
@@ -124,4 +132,204 @@ def test_farmer_update_order_status(test_client, init_database):
     farmer_headers = {'Authorization': f'Bearer {farmer_token}'}
     response = test_client.patch(f'/api/orders/{order_id}', data=json.dumps(update_data), headers=farmer_headers, content_type='application/json')
     assert response.status_code == 200
-    assert response.get_json()['status'] == "Confirmed"
\ No newline at end of file
+    assert response.get_json()['status'] == "Confirmed"
+
+def test_order_listings_conditional_get(test_client, init_database):
+    """
+    GIVEN a buyer and a farmer holding the ETags of their order listings
+    WHEN the order's status changes
+    THEN both listings should stop answering 304 and return fresh validators
+    """
+    farmer_token = get_auth_token(test_client, 'etagorderfarmer', 'password123', 'farmer')
+    buyer_token = get_auth_token(test_client, 'etagorderbuyer', 'password123', 'buyer')
+    produce_id = setup_produce(test_client, farmer_token)
+    buyer_headers = {'Authorization': f'Bearer {buyer_token}'}
+    farmer_headers = {'Authorization': f'Bearer {farmer_token}'}
+    order_data = {"items": [{"produce_id": produce_id, "quantity": 1}]}
+    order_id = test_client.post('/api/orders/', data=json.dumps(order_data), headers=buyer_headers, content_type='application/json').get_json()['id']
+
+    buyer_etag = test_client.get('/api/orders/', headers=buyer_headers).headers['ETag']
+    farmer_etag = test_client.get('/api/orders/farmer', headers=farmer_headers).headers['ETag']
+    assert test_client.get('/api/orders/', headers={**buyer_headers, 'If-None-Match': buyer_etag}).status_code == 304
+    assert test_client.get('/api/orders/farmer', headers={**farmer_headers, 'If-None-Match': farmer_etag}).status_code == 304
+
+    test_client.patch(f'/api/orders/{order_id}', data=json.dumps({"status": "Confirmed"}), headers=farmer_headers, content_type='application/json')
+    response = test_client.get('/api/orders/', headers={**buyer_headers, 'If-None-Match': buyer_etag})
+    assert response.status_code == 200
+    assert response.get_json()[0]['status'] == "Confirmed"
+    assert test_client.get('/api/orders/farmer', headers={**farmer_headers, 'If-None-Match': farmer_etag}).status_code == 200
+
+def test_order_listings_use_constant_query_count(test_client, init_database, count_queries):
+    """
+    GIVEN a buyer and a farmer with a growing number of orders
+    WHEN the buyer and farmer order listings are requested
+    THEN the number of SQL statements should not grow with the number of orders
+    """
+    from app import db
+    farmer_token = get_auth_token(test_client, 'n1farmer', 'password123', 'farmer')
+    buyer_token = get_auth_token(test_client, 'n1buyer', 'password123', 'buyer')
+    produce_ids = [setup_produce(test_client, farmer_token) for _ in range(2)]
+    buyer_headers = {'Authorization': f'Bearer {buyer_token}'}
+    farmer_headers = {'Authorization': f'Bearer {farmer_token}'}
+    order_data = {"items": [{"produce_id": produce_id, "quantity": 1} for produce_id in produce_ids]}
+
+    def listing_query_counts():
+        db.session.expunge_all()
+        with count_queries() as buyer_statements:
+            assert test_client.get('/api/orders/', headers=buyer_headers).status_code == 200
+        db.session.expunge_all()
+        with count_queries() as farmer_statements:
+            assert test_client.get('/api/orders/farmer', headers=farmer_headers).status_code == 200
+        return len(buyer_statements), len(farmer_statements)
+
+    test_client.post('/api/orders/', data=json.dumps(order_data), headers=buyer_headers, content_type='application/json')
+    counts_with_one_order = listing_query_counts()
+
+    for _ in range(5):
+        test_client.post('/api/orders/', data=json.dumps(order_data), headers=buyer_headers, content_type='application/json')
+    counts_with_six_orders = listing_query_counts()
+
+    assert counts_with_one_order == counts_with_six_orders
+    assert len(test_client.get('/api/orders/', headers=buyer_headers).get_json()) == 6
+
+def test_concurrent_orders_do_not_oversell(test_client, init_database):
+    """
+    GIVEN a produce item with limited stock
+    WHEN many buyers order it at the same time
+    THEN no more than the available stock should be sold
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from app.models.produce import Produce
+    from app import db
+    farmer_token = get_auth_token(test_client, 'racefarmer', 'password123', 'farmer')
+    produce_id = create_produce_helper(test_client, farmer_token, {"name": "Scarce Mangoes", "price": "10", "quantity": "5", "unit": "kg"})
+    buyer_headers = [
+        {'Authorization': f"Bearer {get_auth_token(test_client, 'racebuyer', 'password123', 'buyer')}"}
+        for _ in range(12)
+    ]
+    order_data = json.dumps({"items": [{"produce_id": produce_id, "quantity": 1}]})
+
+    def place_order(headers):
+        response = test_client.post('/api/orders/', data=order_data, headers=headers, content_type='application/json')
+        return response.status_code, response.get_json()
+
+    with ThreadPoolExecutor(max_workers=len(buyer_headers)) as pool:
+        results = list(pool.map(place_order, buyer_headers))
+
+    db.session.expire_all()
+    assert [status for status, _ in results].count(201) == 5
+    assert db.session.get(Produce, produce_id).quantity == 0
+    rejected = [body['message'] for status, body in results if status != 201]
+    assert len(rejected) == 7
+    # Losers are refused for lack of stock, either at validation or by the guarded UPDATE
+    assert all(message.startswith(("Insufficient stock for Scarce Mangoes", "Stock changed while placing the order"))
+               for message in rejected)
+    assert all(status in (201, 400) for status, _ in results)
+
+def test_create_order_query_count_independent_of_farmers(test_client, init_database, count_queries):
+    """
+    GIVEN a 50-line cart spread across 20 farmers
+    WHEN the order is placed
+    THEN it should issue as many SELECTs as a one-line, one-farmer cart, and queue one SMS per farmer
+    """
+    from app.models.user import User
+    from app.models.produce import Produce
+    from app.models.outbound_message import OutboundMessage
+    from app import db
+    farmers = [
+        User(username=f'bulkfarmer{i}', email=f'bulkfarmer{i}@example.com', role='farmer',
+             is_approved=True, phone_number=f'+25471100{i:04d}', password_hash='unused')
+        for i in range(20)
+    ]
+    db.session.add_all(farmers)
+    db.session.flush()
+    produce = [
+        Produce(name=f'Bulk Item {i}', price=10, quantity=100, unit='kg', farmer_id=farmers[i % 20].id)
+        for i in range(50)
+    ]
+    db.session.add_all(produce)
+    db.session.commit()
+    produce_ids = [p.id for p in produce]
+    buyer_token = get_auth_token(test_client, 'bulkbuyer', 'password123', 'buyer')
+    headers = {'Authorization': f'Bearer {buyer_token}'}
+
+    def statements_for(cart):
+        db.session.expunge_all()
+        with count_queries() as statements:
+            response = test_client.post('/api/orders/', data=json.dumps({"items": cart}), headers=headers, content_type='application/json')
+        assert response.status_code == 201
+        assert len(response.get_json()['order_items']) == len(cart)
+        # INSERT batching differs between database drivers, so only reads are compared
+        return len([s for s in statements if s.lstrip().upper().startswith('SELECT')])
+
+    small_cart = statements_for([{"produce_id": produce_ids[0], "quantity": 1}])
+    OutboundMessage.query.delete()
+    db.session.commit()
+
+    big_cart = statements_for([{"produce_id": produce_id, "quantity": 1} for produce_id in produce_ids])
+    assert big_cart == small_cart
+    assert OutboundMessage.query.count() == 20
+
+def test_order_retries_with_idempotency_key_are_replayed(test_client, init_database):
+    """
+    GIVEN a buyer who placed an order with an Idempotency-Key
+    WHEN the same request is retried with the key, and the key is reused for a different order
+    THEN the retry should get the stored response without reserving stock again, and the reuse should be rejected
+    """
+    from app.models.order import Order
+    from app.models.produce import Produce
+    from app import db
+    farmer_token = get_auth_token(test_client, 'idemfarmer', 'password123', 'farmer')
+    buyer_token = get_auth_token(test_client, 'idembuyer', 'password123', 'buyer')
+    produce_id = setup_produce(test_client, farmer_token)
+    headers = {'Authorization': f'Bearer {buyer_token}', 'Idempotency-Key': 'order-attempt-1'}
+    order_data = json.dumps({"items": [{"produce_id": produce_id, "quantity": 5}]})
+
+    first = test_client.post('/api/orders/', data=order_data, headers=headers, content_type='application/json')
+    retry = test_client.post('/api/orders/', data=order_data, headers=headers, content_type='application/json')
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+    assert 'Idempotent-Replayed' not in first.headers
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    db.session.expire_all()
+    assert Order.query.count() == 1
+    assert db.session.get(Produce, produce_id).quantity == 45
+
+    other_order = json.dumps({"items": [{"produce_id": produce_id, "quantity": 1}]})
+    response = test_client.post('/api/orders/', data=other_order, headers=headers, content_type='application/json')
+    assert response.status_code == 422
+    assert Order.query.count() == 1
+
+def test_concurrent_order_retries_create_one_order(test_client, init_database):
+    """
+    GIVEN a slow order placement
+    WHEN the same order is posted several times at once with one Idempotency-Key
+    THEN one order should be created and every request should get it back
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest.mock import patch
+    from app.models.order import Order
+    from app.services.inventory_service import reserve_stock
+    farmer_token = get_auth_token(test_client, 'idemracefarmer', 'password123', 'farmer')
+    buyer_token = get_auth_token(test_client, 'idemracebuyer', 'password123', 'buyer')
+    produce_id = setup_produce(test_client, farmer_token)
+    headers = {'Authorization': f'Bearer {buyer_token}', 'Idempotency-Key': 'order-attempt-2'}
+    order_data = json.dumps({"items": [{"produce_id": produce_id, "quantity": 1}]})
+
+    def slow_reserve_stock(items):
+        time.sleep(0.5)
+        return reserve_stock(items)
+
+    def place_order(_):
+        response = test_client.post('/api/orders/', data=order_data, headers=headers, content_type='application/json')
+        return response.status_code, response.get_json()['id']
+
+    with patch('app.resources.order.reserve_stock', side_effect=slow_reserve_stock) as mock_reserve:
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(place_order, range(5)))
+
+    assert mock_reserve.call_count == 1
+    assert len(set(results)) == 1 and results[0][0] == 201
+    assert Order.query.count() == 1
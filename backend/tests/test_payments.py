@@ -2,6 +2,7 @@
 import json
 from unittest.mock import patch
 
+from app.services.webhook_inbox import drain_webhooks
 from tests.test_produce import get_auth_token, create_produce_helper, register_user_helper
 
 def create_test_order(test_client, buyer_token, produce_id):
@@ -12,7 +13,15 @@ def create_test_order(test_client, buyer_token, produce_id):
     assert response.status_code == 201
     return response.get_json()['id']
 
-@patch('app.resources.payment.mpesa_service.initiate_stk_push') # Patch where it is used
+def configure_mpesa(monkeypatch):
+    """Points the M-Pesa service at a stub Daraja host with dummy credentials."""
+    monkeypatch.setenv('MPESA_BASE_URL', 'https://daraja.test')
+    monkeypatch.setenv('MPESA_CONSUMER_KEY', 'key')
+    monkeypatch.setenv('MPESA_CONSUMER_SECRET', 'secret')
+    monkeypatch.setenv('MPESA_SHORTCODE', '174379')
+    monkeypatch.setenv('MPESA_PASSKEY', 'passkey')
+
+@patch('app.services.mpesa_service.initiate_stk_push')
 def test_initiate_payment(mock_initiate_stk, test_client, init_database):
     """
     GIVEN a logged-in buyer with an existing order
@@ -33,6 +42,141 @@ def test_initiate_payment(mock_initiate_stk, test_client, init_database):
     assert "Payment initiated successfully" in response.get_json()['message']
     mock_initiate_stk.assert_called_once()
 
+@patch('app.services.mpesa_service.initiate_stk_push')
+def test_repeated_payment_initiation_reuses_pending_transaction(mock_initiate_stk, test_client, init_database):
+    """
+    GIVEN an order whose payment was initiated with an Idempotency-Key
+    WHEN the buyer initiates it again, with or without the key, and again with the key after the push failed
+    THEN the existing transaction should come back without another push, the failed key should get 409, and a new key should push
+    """
+    from app.models.idempotency_key import IdempotencyKey
+    from app.models.transaction import Transaction
+    from app import db
+    farmer_token = get_auth_token(test_client, 'repeatfarmer', 'password123', 'farmer')
+    buyer_token = get_auth_token(test_client, 'repeatbuyer', 'password123', 'buyer')
+    order_id = create_test_order(test_client, buyer_token, create_produce_helper(test_client, farmer_token))
+    mock_initiate_stk.side_effect = [
+        {"ResponseCode": "0", "CheckoutRequestID": "ws_CO_FIRST"},
+        {"ResponseCode": "0", "CheckoutRequestID": "ws_CO_SECOND"},
+    ]
+    url = f'/api/payments/initiate/{order_id}'
+    headers = {'Authorization': f'Bearer {buyer_token}', 'Idempotency-Key': 'tap-1'}
+
+    first = test_client.post(url, headers=headers)
+    again = test_client.post(url, headers={'Authorization': f'Bearer {buyer_token}'})
+
+    assert first.status_code == again.status_code == 200
+    assert first.get_json()['checkout_request_id'] == again.get_json()['checkout_request_id'] == "ws_CO_FIRST"
+    assert "already initiated" in again.get_json()['message']
+    assert mock_initiate_stk.call_count == 1
+
+    test_client.post('/api/payments/callback', data=stk_callback_payload("ws_CO_FIRST", result_code=1032), content_type='application/json')
+    drain_webhooks()
+    # Once the stored response has expired, the key still leads back to its transaction
+    IdempotencyKey.query.delete()
+    db.session.commit()
+    replay = test_client.post(url, headers=headers)
+    assert replay.status_code == 409
+    assert "new Idempotency-Key" in replay.get_json()['message']
+    assert (replay.get_json()['details']['checkout_request_id'], replay.get_json()['details']['status']) == ("ws_CO_FIRST", "Failed")
+    assert mock_initiate_stk.call_count == 1
+
+    retry = test_client.post(url, headers={**headers, 'Idempotency-Key': 'tap-2'})
+    assert retry.status_code == 200
+    assert retry.get_json()['checkout_request_id'] == "ws_CO_SECOND"
+    assert Transaction.query.filter_by(order_id=order_id).count() == 2
+
+def test_concurrent_payment_initiations_push_once(test_client, init_database):
+    """
+    GIVEN an order awaiting payment and an M-Pesa API that takes a while to answer
+    WHEN the buyer initiates its payment several times at once
+    THEN one STK push should be sent and every request should get its transaction back
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from app.models.transaction import Transaction
+    farmer_token = get_auth_token(test_client, 'racefarmer', 'password123', 'farmer')
+    buyer_token = get_auth_token(test_client, 'racebuyer', 'password123', 'buyer')
+    order_id = create_test_order(test_client, buyer_token, create_produce_helper(test_client, farmer_token))
+    headers = {'Authorization': f'Bearer {buyer_token}'}
+
+    def slow_push(**kwargs):
+        time.sleep(0.5)
+        return {"ResponseCode": "0", "CheckoutRequestID": "ws_CO_RACE"}
+
+    def initiate(_):
+        response = test_client.post(f'/api/payments/initiate/{order_id}', headers=headers)
+        return response.status_code, response.get_json().get('checkout_request_id')
+
+    with patch('app.services.mpesa_service.initiate_stk_push', side_effect=slow_push) as mock_initiate_stk:
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(initiate, range(6)))
+
+    assert results == [(200, "ws_CO_RACE")] * 6
+    assert mock_initiate_stk.call_count == 1
+    assert Transaction.query.filter_by(order_id=order_id).count() == 1
+
+@patch('app.services.mpesa_service.initiate_stk_push')
+def test_payment_initiation_lock_expires(mock_initiate_stk, test_app, test_client, init_database, monkeypatch):
+    """
+    GIVEN an order locked by a payment initiation that never finished
+    WHEN the buyer initiates its payment before and after the lock expires
+    THEN the first attempt should be refused with 409 and the second should push
+    """
+    from datetime import datetime, timedelta, timezone
+    from app.models.order import Order
+    from app import db
+    monkeypatch.setitem(test_app.config, 'PAYMENT_INITIATION_LOCK_SECONDS', 0.5)
+    farmer_token = get_auth_token(test_client, 'lockfarmer', 'password123', 'farmer')
+    buyer_token = get_auth_token(test_client, 'lockbuyer', 'password123', 'buyer')
+    order_id = create_test_order(test_client, buyer_token, create_produce_helper(test_client, farmer_token))
+    headers = {'Authorization': f'Bearer {buyer_token}'}
+    mock_initiate_stk.return_value = {"ResponseCode": "0", "CheckoutRequestID": "ws_CO_AFTER_LOCK"}
+
+    order = db.session.get(Order, order_id)
+    order.payment_lock_expires_at = datetime.now(timezone.utc) + timedelta(minutes=5)
+    db.session.commit()
+    response = test_client.post(f'/api/payments/initiate/{order_id}', headers=headers)
+    assert response.status_code == 409
+    mock_initiate_stk.assert_not_called()
+
+    order = db.session.get(Order, order_id)
+    order.payment_lock_expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.session.commit()
+    response = test_client.post(f'/api/payments/initiate/{order_id}', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['checkout_request_id'] == "ws_CO_AFTER_LOCK"
+    db.session.expire_all()
+    assert db.session.get(Order, order_id).payment_lock_expires_at is None
+
+@patch('app.services.mpesa_service.initiate_stk_push')
+def test_payment_initiation_retries_with_idempotency_key_are_replayed(mock_initiate_stk, test_client, init_database):
+    """
+    GIVEN a buyer initiating payment with an Idempotency-Key while M-Pesa is briefly unavailable
+    WHEN they retry with the same key after the failure, and again after it succeeded
+    THEN the failure should not be stored, and the success should be replayed without calling M-Pesa
+    """
+    farmer_token = get_auth_token(test_client, 'replayfarmer', 'password123', 'farmer')
+    buyer_token = get_auth_token(test_client, 'replaybuyer', 'password123', 'buyer')
+    order_id = create_test_order(test_client, buyer_token, create_produce_helper(test_client, farmer_token))
+    mock_initiate_stk.side_effect = [
+        {"errorCode": "500.001.1001", "errorMessage": "Service unavailable"},
+        {"ResponseCode": "0", "CheckoutRequestID": "ws_CO_REPLAY"},
+    ]
+    url = f'/api/payments/initiate/{order_id}'
+    headers = {'Authorization': f'Bearer {buyer_token}', 'Idempotency-Key': 'pay-1'}
+
+    failed = test_client.post(url, headers=headers)
+    succeeded = test_client.post(url, headers=headers)
+    replayed = test_client.post(url, headers=headers)
+
+    assert failed.status_code == 500
+    assert succeeded.status_code == replayed.status_code == 200
+    assert replayed.get_json() == succeeded.get_json()
+    assert replayed.get_json()['checkout_request_id'] == "ws_CO_REPLAY"
+    assert replayed.headers['Idempotent-Replayed'] == 'true'
+    assert mock_initiate_stk.call_count == 2
+
 def test_payment_callback_success(test_client, init_database):
     """
     GIVEN an order and transaction exist in a pending state
@@ -80,7 +224,298 @@ def test_payment_callback_success(test_client, init_database):
     response = test_client.post('/api/payments/callback', data=json.dumps(success_payload), content_type='application/json')
     
     assert response.status_code == 200
+    drain_webhooks()
     updated_order = db.session.get(Order, order.id)
     assert updated_order.status == "Confirmed"
     updated_transaction = db.session.get(Transaction, transaction.id)
-    assert updated_transaction.status == "Success"
\ No newline at end of file
+    assert updated_transaction.status == "Success"
+
+def create_pending_transaction(test_client, checkout_request_id):
+    """Helper to create an order awaiting payment with its pending transaction; returns (order_id, transaction_id)."""
+    from app.models.user import User
+    from app.models.order import Order
+    from app.models.transaction import Transaction
+    from app import db
+    buyer_creds = register_user_helper(test_client, 'callback_buyer', 'password123', 'buyer')
+    order = Order(buyer_id=buyer_creds['user_obj'].id, total_price=120.00, status="Pending Payment")
+    db.session.add(order)
+    db.session.flush()
+    transaction = Transaction(order_id=order.id, amount=120.00, phone_number="+254712345678",
+                              checkout_request_id=checkout_request_id)
+    db.session.add(transaction)
+    db.session.commit()
+    return order.id, transaction.id
+
+def stk_callback_payload(checkout_request_id, result_code=0, receipt_number="QWERTY1234"):
+    callback = {"ResultCode": result_code, "ResultDesc": "Result", "CheckoutRequestID": checkout_request_id}
+    if result_code == 0:
+        callback["CallbackMetadata"] = {"Item": [
+            {"Name": "Amount", "Value": 120.00},
+            {"Name": "MpesaReceiptNumber", "Value": receipt_number},
+        ]}
+    return json.dumps({"Body": {"stkCallback": callback}})
+
+def test_duplicate_payment_callbacks_are_applied_once(test_client, init_database, count_queries):
+    """
+    GIVEN a pending transaction whose success callback has been processed
+    WHEN Safaricom retries the same callback, and then sends a late failure for it
+    THEN the retries should be acknowledged without any write and the order should stay confirmed
+    """
+    from app.models.order import Order
+    from app.models.processed_callback import ProcessedCallback
+    from app.models.transaction import Transaction
+    from app import db
+    order_id, transaction_id = create_pending_transaction(test_client, "ws_CO_DUP_1")
+
+    response = test_client.post('/api/payments/callback', data=stk_callback_payload("ws_CO_DUP_1"), content_type='application/json')
+    assert response.status_code == 200
+    drain_webhooks()
+
+    with count_queries() as statements:
+        for _ in range(3):
+            response = test_client.post('/api/payments/callback', data=stk_callback_payload("ws_CO_DUP_1"), content_type='application/json')
+            assert response.status_code == 200
+    assert len(statements) == 3
+    assert all(statement.lstrip().upper().startswith('SELECT') for statement in statements)
+
+    response = test_client.post('/api/payments/callback', data=stk_callback_payload("ws_CO_DUP_1", result_code=1032), content_type='application/json')
+    assert response.status_code == 200
+    drain_webhooks()
+
+    db.session.expire_all()
+    assert db.session.get(Order, order_id).status == "Confirmed"
+    transaction = db.session.get(Transaction, transaction_id)
+    assert (transaction.status, transaction.mpesa_receipt_number) == ("Success", "QWERTY1234")
+    assert ProcessedCallback.query.count() == 1
+
+def test_concurrent_payment_callbacks_are_applied_once(test_app, test_client, init_database, monkeypatch):
+    """
+    GIVEN a pending transaction, with callbacks processed during the request
+    WHEN the same success callback is delivered several times at once
+    THEN every delivery should be acknowledged and exactly one recorded
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from app.models.processed_callback import ProcessedCallback
+    monkeypatch.setitem(test_app.config, 'WEBHOOK_INBOX', False)
+    create_pending_transaction(test_client, "ws_CO_RACE_1")
+    payload = stk_callback_payload("ws_CO_RACE_1")
+
+    def deliver(_):
+        return test_client.post('/api/payments/callback', data=payload, content_type='application/json').status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(deliver, range(8)))
+
+    assert statuses == [200] * 8
+    assert ProcessedCallback.query.count() == 1
+
+def test_failed_payment_callback_reopens_order(test_client, init_database):
+    """
+    GIVEN an order awaiting payment
+    WHEN the callback reports that the buyer cancelled the STK push
+    THEN the transaction should be failed and the order payable again
+    """
+    from app.models.order import Order
+    from app.models.transaction import Transaction
+    from app import db
+    order_id, transaction_id = create_pending_transaction(test_client, "ws_CO_FAIL_1")
+
+    response = test_client.post('/api/payments/callback', data=stk_callback_payload("ws_CO_FAIL_1", result_code=1032), content_type='application/json')
+
+    assert response.status_code == 200
+    drain_webhooks()
+    db.session.expire_all()
+    assert db.session.get(Order, order_id).status == "Pending"
+    assert db.session.get(Transaction, transaction_id).status == "Failed"
+
+def test_payment_callback_for_unknown_transaction_is_retried(test_client, init_database):
+    """
+    GIVEN a success callback that arrives before its transaction is committed
+    WHEN the webhook worker processes it, and again once the transaction exists
+    THEN it should be kept for retry rather than dropped, and then applied
+    """
+    from datetime import datetime, timezone
+    from app.models.order import Order
+    from app.models.webhook_event import WebhookEvent
+    from app import db
+    response = test_client.post('/api/payments/callback', data=stk_callback_payload("ws_CO_EARLY_1"), content_type='application/json')
+    assert response.status_code == 200
+    drain_webhooks()
+    event = WebhookEvent.query.one()
+    assert event.status == 'Pending' and 'LookupError' in event.last_error
+
+    order_id, _ = create_pending_transaction(test_client, "ws_CO_EARLY_1")
+    event.next_attempt_at = datetime.now(timezone.utc)
+    db.session.commit()
+    drain_webhooks()
+
+    db.session.expire_all()
+    assert db.session.get(WebhookEvent, event.id).status == 'Done'
+    assert db.session.get(Order, order_id).status == "Confirmed"
+
+def test_payment_callback_rejects_unknown_and_malformed(test_app, test_client, init_database, monkeypatch):
+    """
+    GIVEN no matching transaction
+    WHEN a callback without a CheckoutRequestID arrives, or one for an unknown transaction with inline processing
+    THEN the endpoint should answer 400 and 404 respectively
+    """
+    response = test_client.post('/api/payments/callback', data=json.dumps({"Body": {"stkCallback": {"ResultCode": 0}}}), content_type='application/json')
+    assert response.status_code == 400
+    monkeypatch.setitem(test_app.config, 'WEBHOOK_INBOX', False)
+    response = test_client.post('/api/payments/callback', data=stk_callback_payload("ws_CO_NOPE"), content_type='application/json')
+    assert response.status_code == 404
+
+def test_mpesa_access_token_is_reused_between_stk_pushes(http_stub, monkeypatch):
+    """
+    GIVEN a valid Daraja access token
+    WHEN two STK pushes are initiated
+    THEN the OAuth endpoint should be called once and both pushes should reuse the token
+    """
+    from app.services import mpesa_service
+    configure_mpesa(monkeypatch)
+    stub = http_stub('mpesa')
+    stub.add('GET', 'https://daraja.test/oauth/', lambda request: (200, {"access_token": "token-1", "expires_in": "3599"}))
+    stub.add('POST', 'https://daraja.test/mpesa/stkpush/', lambda request: (200, {"ResponseCode": "0", "CheckoutRequestID": "ws_CO_1"}))
+
+    for order_id in (1, 2):
+        response = mpesa_service.initiate_stk_push("+254712345678", 100, order_id)
+        assert response["ResponseCode"] == "0"
+
+    assert len(stub.calls_to('https://daraja.test/oauth/')) == 1
+    pushes = stub.calls_to('https://daraja.test/mpesa/stkpush/')
+    assert len(pushes) == 2
+    assert all(push.headers['Authorization'] == 'Bearer token-1' for push in pushes)
+
+def test_mpesa_access_token_refreshes_after_rejection(http_stub, monkeypatch):
+    """
+    GIVEN a cached token that Daraja has already revoked
+    WHEN an STK push is rejected with 401
+    THEN a new token should be fetched and the push retried once
+    """
+    from app.services import mpesa_service
+    configure_mpesa(monkeypatch)
+    tokens = iter(["stale", "fresh"])
+    stub = http_stub('mpesa')
+    stub.add('GET', 'https://daraja.test/oauth/', lambda request: (200, {"access_token": next(tokens), "expires_in": "3599"}))
+    stub.add('POST', 'https://daraja.test/mpesa/stkpush/', lambda request: (
+        (200, {"ResponseCode": "0", "CheckoutRequestID": "ws_CO_2"})
+        if request.headers['Authorization'] == 'Bearer fresh' else (401, {"errorMessage": "Invalid Access Token"})
+    ))
+
+    response = mpesa_service.initiate_stk_push("0712345678", 100, 3)
+
+    assert response["CheckoutRequestID"] == "ws_CO_2"
+    assert len(stub.calls_to('https://daraja.test/oauth/')) == 2
+
+def stub_stk_query(http_stub, monkeypatch, outcomes):
+    """Stubs Daraja so an STK Push Query for each CheckoutRequestID answers with `outcomes[id]`."""
+    configure_mpesa(monkeypatch)
+    stub = http_stub('mpesa')
+    stub.add('GET', 'https://daraja.test/oauth/', lambda request: (200, {"access_token": "token-1", "expires_in": "3599"}))
+    def query(request):
+        return outcomes[json.loads(request.body)["CheckoutRequestID"]]
+    stub.add('POST', 'https://daraja.test/mpesa/stkpushquery/', query)
+    return stub
+
+def age_transaction(transaction_id, seconds):
+    from datetime import datetime, timedelta, timezone
+    from app.models.transaction import Transaction
+    from app import db
+    db.session.get(Transaction, transaction_id).created_at = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+    db.session.commit()
+
+def test_reconciliation_settles_payments_without_callbacks(test_client, init_database, http_stub, monkeypatch):
+    """
+    GIVEN stale pending transactions whose callbacks were lost, and one fresh transaction
+    WHEN the reconciliation worker runs
+    THEN paid and failed pushes should be settled from the STK query, in-progress ones left for later,
+         and the fresh one not queried at all
+    """
+    from app.models.order import Order
+    from app.models.transaction import Transaction
+    from app.services.payment_reconciliation import reconcile_payments
+    from app import db
+    stub = stub_stk_query(http_stub, monkeypatch, {
+        "ws_CO_PAID": (200, {"ResponseCode": "0", "ResultCode": "0", "ResultDesc": "The service request is processed successfully."}),
+        "ws_CO_CANCELLED": (200, {"ResponseCode": "0", "ResultCode": "1032", "ResultDesc": "Request cancelled by user"}),
+        "ws_CO_WAITING": (500, {"errorCode": "500.001.1001", "errorMessage": "The transaction is being processed"}),
+    })
+    orders = {}
+    for checkout_request_id in ("ws_CO_PAID", "ws_CO_CANCELLED", "ws_CO_WAITING", "ws_CO_FRESH"):
+        orders[checkout_request_id], transaction_id = create_pending_transaction(test_client, checkout_request_id)
+        if checkout_request_id != "ws_CO_FRESH":
+            age_transaction(transaction_id, 600)
+
+    stats = reconcile_payments()
+
+    assert (stats['checked'], stats['paid'], stats['failed'], stats['in_progress']) == (3, 1, 1, 1)
+    assert stats['lag_seconds'] >= 600
+    assert len(stub.calls_to('https://daraja.test/mpesa/stkpushquery/')) == 3
+    assert len(stub.calls_to('https://daraja.test/oauth/')) == 1
+    db.session.expire_all()
+    statuses = {
+        checkout_request_id: (Transaction.query.filter_by(checkout_request_id=checkout_request_id).one().status,
+                              db.session.get(Order, order_id).status)
+        for checkout_request_id, order_id in orders.items()
+    }
+    assert statuses == {
+        "ws_CO_PAID": ("Success", "Confirmed"),
+        "ws_CO_CANCELLED": ("Failed", "Pending"),
+        "ws_CO_WAITING": ("Pending", "Pending Payment"),
+        "ws_CO_FRESH": ("Pending", "Pending Payment"),
+    }
+    # Checked transactions wait PAYMENT_RECONCILE_INTERVAL_SECONDS before the next query
+    assert reconcile_payments()['checked'] == 0
+
+def test_reconciliation_expires_payments_that_never_resolve(test_client, init_database, http_stub, monkeypatch):
+    """
+    GIVEN a pending transaction older than PAYMENT_RECONCILE_EXPIRE_SECONDS that Daraja cannot resolve
+    WHEN the reconciliation worker runs
+    THEN it should be failed and its order reopened for payment
+    """
+    from app.models.order import Order
+    from app.models.transaction import Transaction
+    from app.services.payment_reconciliation import reconcile_payments
+    from app import db
+    stub_stk_query(http_stub, monkeypatch, {"ws_CO_LOST": (503, "Service Unavailable")})
+    order_id, transaction_id = create_pending_transaction(test_client, "ws_CO_LOST")
+    age_transaction(transaction_id, 2 * 24 * 3600)
+
+    stats = reconcile_payments()
+
+    assert (stats['unreachable'], stats['expired']) == (1, 1)
+    db.session.expire_all()
+    assert db.session.get(Transaction, transaction_id).status == "Failed"
+    assert db.session.get(Order, order_id).status == "Pending"
+
+def test_late_callback_records_receipt_of_reconciled_payment(test_client, init_database, http_stub, monkeypatch):
+    """
+    GIVEN a payment confirmed by the reconciliation worker, which gets no M-Pesa receipt from the STK query
+    WHEN its success callback arrives afterwards, and is then retried
+    THEN the receipt should be recorded with a ledger entry once, and the order should stay confirmed
+    """
+    from app.models.order import Order
+    from app.models.processed_callback import ProcessedCallback
+    from app.models.transaction import Transaction
+    from app.services.payment_reconciliation import reconcile_payments
+    from app import db
+    stub_stk_query(http_stub, monkeypatch, {
+        "ws_CO_LATE": (200, {"ResponseCode": "0", "ResultCode": "0", "ResultDesc": "The service request is processed successfully."}),
+    })
+    order_id, transaction_id = create_pending_transaction(test_client, "ws_CO_LATE")
+    age_transaction(transaction_id, 600)
+    assert reconcile_payments()['paid'] == 1
+    db.session.expire_all()
+    assert db.session.get(Transaction, transaction_id).mpesa_receipt_number is None
+
+    for _ in range(2):
+        response = test_client.post('/api/payments/callback', data=stk_callback_payload("ws_CO_LATE", receipt_number="LATE123456"), content_type='application/json')
+        assert response.status_code == 200
+        drain_webhooks()
+
+    db.session.expire_all()
+    transaction = db.session.get(Transaction, transaction_id)
+    assert (transaction.status, transaction.mpesa_receipt_number) == ("Success", "LATE123456")
+    assert db.session.get(Order, order_id).status == "Confirmed"
+    ledger = ProcessedCallback.query.all()
+    assert [(entry.checkout_request_id, entry.transaction_id) for entry in ledger] == [("ws_CO_LATE", transaction_id)]
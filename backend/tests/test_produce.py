@@ -1,5 +1,7 @@
 # tests/test_produce.py
+import io
 import json
+from app.models.produce import Produce
 from app.models.user import User
 from app import db
 
@@ -106,4 +108,275 @@ def test_filter_produce_by_location(test_client, init_database):
     headers = {'Authorization': f'Bearer {buyer_token}'}
     response = test_client.get('/api/produce/?location=Eldoret', headers=headers)
     assert response.status_code == 200
-    assert len(response.get_json()) == 2
\ No newline at end of file
+    assert len(response.get_json()) == 2
+
+def test_get_all_produce_cursor_pagination(test_client, init_database):
+    """
+    GIVEN five produce listings
+    WHEN they are fetched two at a time, following next_cursor
+    THEN three pages should cover every listing once, newest first
+    """
+    farmer_token = get_auth_token(test_client, 'page_farmer', 'password123')
+    created_ids = [
+        create_produce_helper(test_client, farmer_token, {"name": f"Page Item {i}", "price": "10", "quantity": "1", "unit": "kg"})
+        for i in range(5)
+    ]
+    buyer_token = get_auth_token(test_client, 'page_buyer', 'password123', 'buyer')
+    headers = {'Authorization': f'Bearer {buyer_token}'}
+
+    seen_ids, pages, cursor = [], 0, None
+    while True:
+        url = '/api/produce/?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        response = test_client.get(url, headers=headers)
+        assert response.status_code == 200
+        body = response.get_json()
+        assert len(body['items']) <= 2
+        seen_ids.extend(item['id'] for item in body['items'])
+        pages += 1
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert seen_ids == sorted(created_ids, reverse=True)
+
+def test_get_all_produce_invalid_cursor(test_client, init_database):
+    """
+    GIVEN a logged-in buyer
+    WHEN the produce list is requested with a malformed cursor
+    THEN a 400 should be returned
+    """
+    buyer_token = get_auth_token(test_client, 'badcursor_buyer', 'password123', 'buyer')
+    headers = {'Authorization': f'Bearer {buyer_token}'}
+    response = test_client.get('/api/produce/?cursor=not-a-cursor', headers=headers)
+    assert response.status_code == 400
+
+def test_get_all_produce_conditional_get(test_client, init_database, count_queries):
+    """
+    GIVEN a client holding the ETag of the produce listing
+    WHEN it revalidates the listing with If-None-Match
+    THEN a 304 should be returned without fetching any produce rows, until a listing changes or is deleted
+    """
+    from datetime import datetime, timedelta, timezone
+    from werkzeug.http import http_date
+    farmer_token = get_auth_token(test_client, 'etag_farmer', 'password123')
+    produce_id = create_produce_helper(test_client, farmer_token)
+    buyer_token = get_auth_token(test_client, 'etag_buyer', 'password123', 'buyer')
+    headers = {'Authorization': f'Bearer {buyer_token}'}
+
+    response = test_client.get('/api/produce/', headers=headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    # A deletion leaves max(updated_at) alone, so only the ETag (which covers the count) is sent
+    assert 'Last-Modified' not in response.headers
+
+    with count_queries() as statements:
+        response = test_client.get('/api/produce/', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    # Only the count/max(updated_at) aggregate runs; no listing columns are selected
+    assert len(statements) == 1
+    assert 'count(' in statements[0].lower() and 'description' not in statements[0]
+
+    # The validator is per query string
+    response = test_client.get('/api/produce/?name=tom', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+
+    test_client.put(f'/api/produce/{produce_id}', data=json.dumps({"price": 99.0}),
+                    headers={'Authorization': f'Bearer {farmer_token}'}, content_type='application/json')
+    response = test_client.get('/api/produce/', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    # Deleting a listing other than the latest change leaves max(updated_at) as it was
+    create_produce_helper(test_client, farmer_token, {"name": "Etag Kale", "price": "15", "quantity": "2", "unit": "bunch"})
+    etag = test_client.get('/api/produce/', headers=headers).headers['ETag']
+    test_client.delete(f'/api/produce/{produce_id}', headers={'Authorization': f'Bearer {farmer_token}'})
+    assert test_client.get('/api/produce/', headers={**headers, 'If-None-Match': etag}).status_code == 200
+    future = http_date(datetime.now(timezone.utc) + timedelta(hours=1))
+    response = test_client.get('/api/produce/', headers={**headers, 'If-Modified-Since': future})
+    assert response.status_code == 200
+    assert [item['name'] for item in response.get_json()] == ["Etag Kale"]
+
+def test_get_all_produce_compressed(test_client, init_database):
+    """
+    GIVEN a produce listing larger than the compression threshold
+    WHEN it is requested with and without Accept-Encoding: gzip
+    THEN the gzip body should decompress to exactly the uncompressed JSON
+    """
+    import gzip
+    farmer_token = get_auth_token(test_client, 'gzip_farmer', 'password123')
+    for i in range(10):
+        create_produce_helper(test_client, farmer_token, {"name": f"Gzip Item {i}", "description": "Sweet and crunchy.", "price": "10", "quantity": "1", "unit": "kg"})
+    buyer_token = get_auth_token(test_client, 'gzip_buyer', 'password123', 'buyer')
+    headers = {'Authorization': f'Bearer {buyer_token}'}
+
+    plain = test_client.get('/api/produce/', headers=headers)
+    assert 'Content-Encoding' not in plain.headers
+    compressed = test_client.get('/api/produce/', headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert compressed.status_code == 200
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert len(compressed.data) < len(plain.data)
+    assert gzip.decompress(compressed.data) == plain.data
+
+    # Small bodies are sent as they are
+    small = test_client.get('/api/produce/?name=nothing-matches', headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+def test_export_produce_streams_ndjson_and_csv(test_client, init_database):
+    """
+    GIVEN two listings, one of which is updated after a first export
+    WHEN the catalog is exported as NDJSON and CSV, in full and with updated_since
+    THEN every listing should be streamed in update order, and only newer ones after updated_since
+    """
+    import csv
+    farmer_token = get_auth_token(test_client, 'export_farmer', 'password123')
+    first_id = create_produce_helper(test_client, farmer_token, {"name": "Export Kale", "price": "20", "quantity": "3", "unit": "bunch"})
+    second_id = create_produce_helper(test_client, farmer_token, {"name": "Export Onions", "description": "Red, \"Bombay\"", "price": "55.5", "quantity": "1", "unit": "kg"})
+    buyer_token = get_auth_token(test_client, 'export_buyer', 'password123', 'buyer')
+    headers = {'Authorization': f'Bearer {buyer_token}'}
+
+    response = test_client.get('/api/produce/export', headers=headers)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    items = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [item['id'] for item in items] == [first_id, second_id]
+    assert items[1]['price'] == '55.50' and items[1]['description'] == 'Red, "Bombay"'
+
+    # An incremental sync only sees what changed since the last row of the previous export
+    test_client.put(f'/api/produce/{first_id}', data=json.dumps({"price": 25.0}),
+                    headers={'Authorization': f'Bearer {farmer_token}'}, content_type='application/json')
+    response = test_client.get(f'/api/produce/export?updated_since={items[-1]["updated_at"]}', headers=headers)
+    changed = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(item['id'], item['price']) for item in changed] == [(first_id, '25.00')]
+
+    response = test_client.get('/api/produce/export?format=csv', headers=headers)
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [int(row['id']) for row in rows] == [second_id, first_id]
+    assert rows[0]['description'] == 'Red, "Bombay"' and rows[0]['image_url'] == ''
+
+    assert test_client.get('/api/produce/export?format=xml', headers=headers).status_code == 400
+    assert test_client.get('/api/produce/export?updated_since=yesterday', headers=headers).status_code == 400
+
+def test_export_produce_csv_encodes_image_variants_as_json(test_client, init_database):
+    """
+    GIVEN a listing whose image has been resized into variants
+    WHEN the catalog is exported as CSV
+    THEN the image_variants cell should hold the variants as JSON
+    """
+    import csv
+    from app.models.produce import Produce
+    from app import db
+    farmer_token = get_auth_token(test_client, 'variants_farmer', 'password123')
+    produce_id = create_produce_helper(test_client, farmer_token, {"name": "Export Mangoes", "price": "10", "quantity": "4", "unit": "kg"})
+    variants = {"160": {"webp": "http://x/a.webp", "jpeg": "http://x/a.jpg"}}
+    db.session.get(Produce, produce_id).image_variants = variants
+    db.session.commit()
+
+    response = test_client.get('/api/produce/export?format=csv', headers={'Authorization': f'Bearer {farmer_token}'})
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+    assert json.loads(rows[0]['image_variants']) == variants
+    assert rows[0]['is_available'] == 'True'
+
+def test_bulk_create_produce(test_client, init_database):
+    """
+    GIVEN an approved farmer with a batch of listings as a JSON array and as a CSV upload
+    WHEN they are posted to the bulk endpoint
+    THEN every row should be created in input order with its pre-uploaded image URL
+    """
+    farmer_token = get_auth_token(test_client, 'bulk_farmer', 'password123')
+    headers = {'Authorization': f'Bearer {farmer_token}'}
+    rows = [
+        {"name": f"Bulk Item {i}", "price": 10 + i, "quantity": i, "unit": "kg", "location": "Meru",
+         "image_url": f"https://images.example.com/bulk-{i}.jpg"}
+        for i in range(5)
+    ]
+    response = test_client.post('/api/produce/bulk', data=json.dumps(rows), headers=headers, content_type='application/json')
+    assert response.status_code == 201
+    assert response.get_json()['created'] == 5
+    ids = response.get_json()['ids']
+    assert [db.session.get(Produce, i).name for i in ids] == [row['name'] for row in rows]
+    assert db.session.get(Produce, ids[2]).image_url == "https://images.example.com/bulk-2.jpg"
+
+    csv_text = "name,price,quantity,unit,location,image_url\nCsv Cabbage,40,10,item,Nyeri,\nCsv Carrots,35.5,4,kg,,\n"
+    response = test_client.post('/api/produce/bulk', data={'file': (io.BytesIO(csv_text.encode()), 'listings.csv')},
+                                headers=headers, content_type='multipart/form-data')
+    assert response.status_code == 201
+    carrots = db.session.get(Produce, response.get_json()['ids'][1])
+    assert (carrots.name, str(carrots.price), carrots.location, carrots.image_url) == ("Csv Carrots", "35.50", None, None)
+
+def test_bulk_create_produce_reports_row_errors(test_client, init_database):
+    """
+    GIVEN a bulk import where some rows are invalid
+    WHEN it is posted
+    THEN a 422 should list the errors by row index and no listing should be created
+    """
+    farmer_token = get_auth_token(test_client, 'bulk_bad_farmer', 'password123')
+    headers = {'Authorization': f'Bearer {farmer_token}'}
+    rows = [
+        {"name": "Good Row", "price": 10, "quantity": 1, "unit": "kg"},
+        {"name": "Bad Unit", "price": 10, "quantity": 1, "unit": "tonne"},
+        {"name": "No Price", "quantity": 1, "unit": "kg", "image_url": "not-a-url"},
+    ]
+    response = test_client.post('/api/produce/bulk', data=json.dumps(rows), headers=headers, content_type='application/json')
+    assert response.status_code == 422
+    errors = response.get_json()['errors']
+    assert set(errors) == {'1', '2'}
+    assert 'unit' in errors['1'] and {'price', 'image_url'} <= set(errors['2'])
+    assert Produce.query.count() == 0
+
+    buyer_token = get_auth_token(test_client, 'bulk_buyer', 'password123', 'buyer')
+    response = test_client.post('/api/produce/bulk', data=json.dumps(rows[:1]), headers={'Authorization': f'Bearer {buyer_token}'}, content_type='application/json')
+    assert response.status_code == 403
+    response = test_client.post('/api/produce/bulk', data=json.dumps({"name": "Not a list"}), headers=headers, content_type='application/json')
+    assert response.status_code == 400
+
+def test_search_produce_ranks_name_matches_first(test_client, init_database):
+    """
+    GIVEN listings mentioning tomatoes in their name or only in their description
+    WHEN the produce list is searched with q, with and without limit
+    THEN name matches should rank first, every word should have to match, and limit should return the envelope
+    """
+    farmer_token = get_auth_token(test_client, 'search_farmer', 'password123')
+    create_produce_helper(test_client, farmer_token, {"name": "Cabbages", "description": "Pairs well with tomatoes.", "price": "10", "quantity": "1", "unit": "kg"})
+    create_produce_helper(test_client, farmer_token, {"name": "Fresh Tomatoes", "price": "80", "quantity": "5", "unit": "kg", "location": "Nakuru"})
+    create_produce_helper(test_client, farmer_token, {"name": "Potatoes", "price": "60", "quantity": "5", "unit": "kg"})
+    buyer_token = get_auth_token(test_client, 'search_buyer', 'password123', 'buyer')
+    headers = {'Authorization': f'Bearer {buyer_token}'}
+
+    response = test_client.get('/api/produce/?q=tomatoes', headers=headers)
+    assert response.status_code == 200
+    assert [item['name'] for item in response.get_json()] == ["Fresh Tomatoes", "Cabbages"]
+
+    # Every word must match, and partial words match as prefixes
+    response = test_client.get('/api/produce/?q=tomat%20nakuru', headers=headers)
+    assert [item['name'] for item in response.get_json()] == ["Fresh Tomatoes"]
+
+    # With limit, ranked search answers in the same envelope as the cursor listing
+    response = test_client.get('/api/produce/?q=tomatoes&limit=1', headers=headers)
+    assert [item['name'] for item in response.get_json()['items']] == ["Fresh Tomatoes"]
+    assert response.get_json()['next_cursor'] is None
+
+def test_search_index_fallback_matches_prefixes_and_updates_in_place():
+    """
+    GIVEN the in-process search index used where full-text search is unavailable
+    WHEN it is searched, then updated with an edited row and a deletion
+    THEN every word should have to match as a prefix, like the PostgreSQL query, and results follow the update
+    """
+    from app.services.search_service import ProduceSearchIndex
+    index = ProduceSearchIndex()
+    index.update([(1, "Fresh Tomatoes", None, "Nakuru"), (2, "Potatoes", "Good for chips", "Eldoret")], signature=(2, None))
+    assert set(index.search("tomat")) == {1}
+    assert set(index.search("eldoret chips")) == {2}
+    # No typo tolerance: PostgreSQL's prefix tsquery would not match this either
+    assert index.search("tomatos") == {}
+
+    index.update([(2, "Sweet Potatoes", None, "Eldoret")], signature=(1, None), live_ids=[2])
+    assert index.search("tomat") == {}
+    assert set(index.search("sweet")) == {2}
+    assert index.search("chips") == {}
+    assert len(index) == 1
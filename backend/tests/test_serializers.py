@@ -0,0 +1,110 @@
+# tests/test_serializers.py
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import db
+from app.models.market_price import MarketPrice
+from app.models.order import Order, OrderItem
+from app.models.produce import Produce
+from app.models.user import User
+from app.schemas.compiled import compile_schema
+from app.schemas.market_price import MarketPriceSchema
+from app.schemas.order import OrderItemResponseSchema, OrderSchema
+from app.schemas.produce import ProduceSchema
+from app.schemas.user import UserSchema
+
+
+def seed_rows():
+    farmer = User(username='parityfarmer', email='parity@farm.test', phone_number='+254700000001',
+                  password_hash='x', role='farmer', is_approved=True)
+    buyer = User(username='paritybuyer', email='parity@buy.test', phone_number=None,
+                 password_hash='x', role='buyer', is_approved=False)
+    db.session.add_all([farmer, buyer])
+    db.session.flush()
+    produce = [
+        Produce(farmer_id=farmer.id, name="Sukuma Wiki", description="Mbichi kabisa — leo asubuhi", price=Decimal('85.50'),
+                quantity=12, unit='bunch', location="Kiambu", image_url="https://img.test/sukuma.jpg", image_status='ready',
+                thumbnail_url="https://img.test/w480.jpg", image_variants={"160": {"webp": "https://img.test/w160.webp"}}),
+        Produce(farmer_id=farmer.id, name="Maize", description=None, price=Decimal('3200'), quantity=0,
+                unit='crate', location=None, image_url=None, is_available=False),
+    ]
+    db.session.add_all(produce)
+    db.session.flush()
+    order = Order(buyer_id=buyer.id, total_price=Decimal('3371.00'), status='Pending')
+    order.items = [
+        OrderItem(produce_id=produce[0].id, quantity=2, price_per_unit=Decimal('85.50')),
+        OrderItem(produce_id=produce[1].id, quantity=1, price_per_unit=Decimal('3200.00')),
+    ]
+    db.session.add(order)
+    db.session.add_all([
+        MarketPrice(crop_name="Beans", average_price=Decimal('120.00'), unit='kg'),
+        MarketPrice(crop_name="Irish Potatoes", average_price=Decimal('0.05'), unit='90kg bag'),
+    ])
+    db.session.commit()
+    db.session.expire_all()
+
+
+def test_compiled_serializers_match_marshmallow(test_app, init_database):
+    """
+    GIVEN rows for every schema used on the list endpoints, including None, Unicode and Decimal values
+    WHEN they are dumped by marshmallow and by the compiled serializers, from ORM objects and from column tuples
+    THEN the encoded JSON should be byte-identical with both JSON providers
+    """
+    seed_rows()
+    encoders = [test_app.json, DefaultJSONProvider(test_app)]
+    cases = [
+        (ProduceSchema(many=True), Produce),
+        (UserSchema(many=True), User),
+        (MarketPriceSchema(many=True), MarketPrice),
+        (OrderSchema(many=True), Order),
+        (OrderItemResponseSchema(many=True), OrderItem),
+        (ProduceSchema(many=True, only=("id", "name", "unit")), Produce),
+    ]
+    for schema, model in cases:
+        compiled = compile_schema(schema)
+        objects = model.query.order_by(model.id).all()
+        expected = schema.dump(objects)
+        assert [list(item) for item in compiled.dump(objects)] == [list(item) for item in expected]  # key order too
+        for encoder in encoders:
+            assert encoder.dumps(compiled.dump(objects)).encode() == encoder.dumps(expected).encode()
+        assert compiled.dump(objects[0], many=False) == schema.dump(objects[0], many=False)
+
+        if compiled.dump_row is not None:
+            rows = db.session.execute(db.select(*compiled.columns(model)).order_by(model.id)).all()
+            for encoder in encoders:
+                assert encoder.dumps(compiled.dump_rows(rows)).encode() == encoder.dumps(expected).encode()
+
+    # Nested schemas can only be dumped from objects
+    assert compile_schema(OrderSchema(many=True)).dump_row is None
+
+def test_schemas_with_dump_hooks_or_method_fields_are_dumped_by_marshmallow():
+    """
+    GIVEN schemas with a post_dump processor, and with a Method field
+    WHEN they are compiled and used to dump objects
+    THEN the output should match schema.dump, processors and methods included
+    """
+    from types import SimpleNamespace
+    from marshmallow import Schema, fields, post_dump
+
+    class EnvelopeSchema(Schema):
+        name = fields.String()
+
+        @post_dump(pass_collection=True)
+        def wrap(self, data, many, **kwargs):
+            return {"items": data} if many else data
+
+    class ShoutSchema(Schema):
+        name = fields.String()
+        shout = fields.Method("get_shout")
+
+        def get_shout(self, obj):
+            return obj.name.upper()
+
+    objects = [SimpleNamespace(name="kale"), SimpleNamespace(name="beans")]
+    for schema in (EnvelopeSchema(many=True), ShoutSchema(many=True)):
+        compiled = compile_schema(schema)
+        assert compiled.dump(objects) == schema.dump(objects)
+        assert compiled.dump(objects[0], many=False) == schema.dump(objects[0], many=False)
+        assert compiled.dump_row is None
+    assert compile_schema(EnvelopeSchema(many=True)).dump(objects) == {"items": [{"name": "kale"}, {"name": "beans"}]}
@@ -2,11 +2,19 @@
 import json
 from urllib.parse import urlencode
 
+def latest_sms_reply(to_number):
+    """Processes the queued inbound SMS and returns the last reply queued for `to_number`."""
+    from app.models.outbound_message import OutboundMessage
+    from app.services.webhook_inbox import drain_webhooks
+    drain_webhooks()
+    message = OutboundMessage.query.filter_by(to_number=to_number).order_by(OutboundMessage.id.desc()).first()
+    return message.body if message else None
+
 def test_inbound_sms_register_farmer(test_client, init_database):
     """
     GIVEN a new farmer sends a correctly formatted registration SMS
     WHEN Twilio posts to the '/api/sms/inbound' webhook
-    THEN a new user should be created, and a success SMS response returned
+    THEN the webhook should be acknowledged at once, then a new user created and a success SMS queued
     """
     # Twilio sends data as a URL-encoded form
     payload = {
@@ -17,10 +25,9 @@ def test_inbound_sms_register_farmer(test_client, init_database):
     response = test_client.post('/api/sms/inbound', data=urlencode(payload), content_type='application/x-www-form-urlencoded')
     
     assert response.status_code == 200
-    # Twilio expects a TwiML response for SMS replies
-    assert '<Response>' in response.data.decode()
-    assert '<Message>' in response.data.decode()
-    assert 'Welcome, John Doe!' in response.data.decode()
+    # Twilio expects a TwiML response; the reply itself is sent later through the outbox
+    assert '<Response />' in response.data.decode()
+    assert 'Welcome, John Doe!' in latest_sms_reply('+254712345678')
     
     # Check that the user was actually created in the DB
     from app.models.user import User
@@ -28,6 +35,24 @@ def test_inbound_sms_register_farmer(test_client, init_database):
     assert user is not None
     assert user.username == 'John Doe'
 
+def test_inbound_sms_register_twice(test_client, init_database):
+    """
+    GIVEN a farmer who has already registered by SMS
+    WHEN they send the registration SMS again
+    THEN they should be told they are already registered and no second account created
+    """
+    payload = {
+        'From': '+254712345679',
+        'Body': 'REGISTER FARMER Jane Doe, Kitale'
+    }
+    test_client.post('/api/sms/inbound', data=urlencode(payload), content_type='application/x-www-form-urlencoded')
+    response = test_client.post('/api/sms/inbound', data=urlencode(payload), content_type='application/x-www-form-urlencoded')
+
+    assert response.status_code == 200
+    assert 'Hello Jane Doe! You are already registered with FMLP.' in latest_sms_reply('+254712345679')
+    from app.models.user import User
+    assert User.query.filter_by(phone_number='+254712345679').count() == 1
+
 def test_inbound_sms_get_price(test_client, init_database):
     """
     GIVEN a market price for 'Maize' exists
@@ -49,7 +74,7 @@ def test_inbound_sms_get_price(test_client, init_database):
     response = test_client.post('/api/sms/inbound', data=urlencode(payload), content_type='application/x-www-form-urlencoded')
 
     assert response.status_code == 200
-    assert 'Current market price for Maize: 35.00 KES/kg' in response.data.decode()
+    assert 'Current market price for Maize: 35.00 KES/kg' in latest_sms_reply('+254787654321')
 
 def test_inbound_sms_unknown_command(test_client, init_database):
     """
@@ -65,5 +90,47 @@ def test_inbound_sms_unknown_command(test_client, init_database):
     response = test_client.post('/api/sms/inbound', data=urlencode(payload), content_type='application/x-www-form-urlencoded')
     
     assert response.status_code == 200
-    assert 'Sorry, I did not understand that command.' in response.data.decode()
-    assert 'REGISTER FARMER' in response.data.decode() # The help text should contain valid commands
\ No newline at end of file
+    reply = latest_sms_reply('+254711111111')
+    assert 'Sorry, I did not understand that command.' in reply
+    assert 'REGISTER FARMER' in reply # The help text should contain valid commands
+
+def test_twilio_client_is_reused_between_messages(http_stub, monkeypatch):
+    """
+    GIVEN Twilio credentials
+    WHEN several SMS are delivered
+    THEN they should share one Twilio client and connection pool
+    """
+    from app.services import twilio_service
+    monkeypatch.setenv('TWILIO_ACCOUNT_SID', 'ACtest')
+    monkeypatch.setenv('TWILIO_AUTH_TOKEN', 'secret')
+    monkeypatch.setenv('TWILIO_PHONE_NUMBER', '+15005550006')
+    stub = http_stub('twilio')
+    stub.add('POST', 'https://api.twilio.com/2010-04-01/Accounts/ACtest/Messages.json',
+             lambda request: (201, {"sid": "SM0001", "status": "queued"}))
+
+    assert twilio_service.deliver_sms('+254712345678', 'First') == 'SM0001'
+    assert twilio_service.deliver_sms('+254712345679', 'Second') == 'SM0001'
+
+    assert len(stub.requests) == 2
+    assert twilio_service.get_twilio_client('ACtest', 'secret') is twilio_service.get_twilio_client('ACtest', 'secret')
+
+def test_inbound_sms_price_uses_shared_cache(test_client, init_database, count_queries):
+    """
+    GIVEN market prices already served once
+    WHEN more PRICE requests arrive by SMS
+    THEN they should be answered from the market price cache without querying the table
+    """
+    from app.models.market_price import MarketPrice
+    from app import db
+    db.session.add(MarketPrice(crop_name="Beans", average_price=120.00, unit="kg"))
+    db.session.commit()
+    payload = {'From': '+254787654322', 'Body': 'PRICE BEANS'}
+
+    test_client.post('/api/sms/inbound', data=urlencode(payload), content_type='application/x-www-form-urlencoded')
+    latest_sms_reply('+254787654322')
+    with count_queries() as statements:
+        test_client.post('/api/sms/inbound', data=urlencode(payload), content_type='application/x-www-form-urlencoded')
+        reply = latest_sms_reply('+254787654322')
+
+    assert 'Current market price for Beans: 120.00 KES/kg' in reply
+    assert not [s for s in statements if 'market_prices' in s]
@@ -0,0 +1,108 @@
+# tests/test_webhooks.py
+from datetime import datetime, timedelta, timezone
+
+from app.models.webhook_event import WebhookEvent
+from app.services.webhook_inbox import WEBHOOK_HANDLERS, WebhookWorker, record_webhook
+from app import db
+
+def run_worker_once(test_app):
+    worker = WebhookWorker(test_app)
+    try:
+        return worker.run_once()
+    finally:
+        worker.shutdown()
+
+def test_worker_processes_each_key_in_order(test_app, init_database, monkeypatch):
+    """
+    GIVEN interleaved inbox events for two keys, where the first event of key A fails once
+    WHEN the webhook worker runs
+    THEN key B should be processed, key A's later events should wait, and key A should then finish in order
+    """
+    processed = []
+    failures = {'A1': 1}
+    def handler(payload):
+        if failures.get(payload):
+            failures[payload] -= 1
+            raise RuntimeError(f"{payload} failed")
+        processed.append(payload)
+    monkeypatch.setitem(WEBHOOK_HANDLERS, 'test', handler)
+    for key, payload in [('A', 'A1'), ('B', 'B1'), ('A', 'A2'), ('B', 'B2'), ('A', 'A3')]:
+        record_webhook('test', key, payload)
+
+    assert run_worker_once(test_app) == 5
+    assert processed == ['B1', 'B2']
+    db.session.expire_all()
+    events = {event.payload: event for event in WebhookEvent.query.all()}
+    assert events['A1'].status == 'Pending' and 'A1 failed' in events['A1'].last_error
+    assert events['A1'].attempts == 1
+    assert (events['A2'].status, events['A2'].attempts) == ('Pending', 0)
+    # A1 is backing off and blocks the rest of its key
+    assert run_worker_once(test_app) == 0
+
+    events['A1'].next_attempt_at = datetime.now(timezone.utc)
+    db.session.commit()
+    assert run_worker_once(test_app) == 3
+    assert processed == ['B1', 'B2', 'A1', 'A2', 'A3']
+    db.session.expire_all()
+    assert {event.status for event in WebhookEvent.query.all()} == {'Done'}
+
+def test_worker_gives_up_after_max_attempts(test_app, init_database, monkeypatch):
+    """
+    GIVEN an event whose handler always fails
+    WHEN it has been attempted max_attempts times
+    THEN it should be marked Failed and the next event for its key processed
+    """
+    processed = []
+    def handler(payload):
+        if payload == 'bad':
+            raise ValueError("cannot parse")
+        processed.append(payload)
+    monkeypatch.setitem(WEBHOOK_HANDLERS, 'test', handler)
+    bad = record_webhook('test', 'K', 'bad', max_attempts=2)
+    record_webhook('test', 'K', 'good')
+
+    for _ in range(2):
+        run_worker_once(test_app)
+        WebhookEvent.query.filter_by(id=bad.id).update({'next_attempt_at': datetime.now(timezone.utc)})
+        db.session.commit()
+    run_worker_once(test_app)
+
+    db.session.expire_all()
+    assert db.session.get(WebhookEvent, bad.id).status == 'Failed'
+    assert processed == ['good']
+
+def test_event_that_kills_the_worker_does_not_block_its_key(test_app, init_database, monkeypatch):
+    """
+    GIVEN an event whose worker died during its last allowed attempt, with a later event queued behind it
+    WHEN another worker runs after the lease expired
+    THEN the event should be marked Failed without being handled again, and the later event processed
+    """
+    processed = []
+    monkeypatch.setitem(WEBHOOK_HANDLERS, 'test', processed.append)
+    crashed = record_webhook('test', 'K', 'crashes', max_attempts=2)
+    record_webhook('test', 'K', 'next')
+    crashed.status, crashed.attempts = 'Processing', 2
+    crashed.next_attempt_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.session.commit()
+
+    assert run_worker_once(test_app) == 1
+
+    assert processed == ['next']
+    db.session.expire_all()
+    crashed = db.session.get(WebhookEvent, crashed.id)
+    assert (crashed.status, crashed.attempts) == ('Failed', 2)
+    assert "Lease expired" in crashed.last_error and crashed.processed_at is not None
+
+def test_webhooks_are_acknowledged_with_one_insert(test_client, init_database, count_queries):
+    """
+    GIVEN the webhook inbox is enabled
+    WHEN Twilio posts an inbound SMS
+    THEN the request should only store the raw event
+    """
+    with count_queries() as statements:
+        response = test_client.post('/api/sms/inbound', data={'From': '+254711000001', 'Body': 'PRICE MAIZE'})
+
+    assert response.status_code == 200
+    assert len(statements) == 1 and statements[0].lstrip().upper().startswith('INSERT INTO WEBHOOK_EVENTS')
+    event = WebhookEvent.query.one()
+    assert (event.source, event.ordering_key, event.status) == ('twilio', '+254711000001', 'Pending')